@@ -1,28 +1,46 @@
 import asyncio
 import datetime
 import logging
+import random
 import socket
 import sys
+import time
 from enum import IntEnum
-from typing import Optional
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
 
 import aiohttp
 import aioredis
 import discord
-import fakeredis.aioredis
 from discord.ext import commands
 import asyncpg
 
 from obsidion import constants
 from obsidion.core.global_checks import init_global_checks
+from obsidion.utils.cache import Cache
+from obsidion.utils.context import Context, current_context
+from obsidion.utils.http import CircuitBreakers, RateLimiter
+from obsidion.utils.mojang import UUIDResolver
+from obsidion.utils.prometheus import PrometheusClient
+from obsidion.utils.stats import AsyncStatsClient, http_trace_config
+from obsidion.utils.watchdog import Watchdog
 
 log = logging.getLogger(__name__)
 
-__all__ = ["Obsidion", "ExitCodes"]
+__all__ = ["Obsidion", "ExitCodes", "guild_prefix"]
+
+T = TypeVar("T")
+
+# errors worth retrying a connection after, the server may just not be up yet
+CONNECT_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresError,
+    aioredis.RedisError,
+)
 
 
 class Obsidion(commands.AutoShardedBot):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, cluster_id: int = 0, **kwargs):
 
         super().__init__(*args, **kwargs)
 
@@ -32,6 +50,37 @@ class Obsidion(commands.AutoShardedBot):
         self.redis_closed = False
         self.db_pool = None
         self.db_ready = asyncio.Event()
+        self.cache = Cache(self)
+        self.uuid_resolver = UUIDResolver(self)
+        self.rate_limiter = RateLimiter()
+        self.circuit_breakers = CircuitBreakers()
+        if constants.Stats.backend == "prometheus":
+            # every cluster serves its own metrics, on consecutive ports
+            self.stats = PrometheusClient(
+                constants.Stats.prometheus_host,
+                constants.Stats.prometheus_port + cluster_id,
+                prefix=constants.Stats.prefix,
+                enabled=constants.Stats.enabled,
+            )
+        else:
+            self.stats = AsyncStatsClient(
+                self.loop,
+                constants.Stats.statsd_host,
+                constants.Stats.statsd_port,
+                prefix=constants.Stats.prefix,
+                enabled=constants.Stats.enabled,
+                max_packet_size=constants.Stats.max_packet_size,
+                flush_interval=constants.Stats.flush_interval,
+            )
+        self.watchdog = Watchdog(self)
+        # extension -> (seconds importing it, seconds setting it up)
+        self.extension_timings: Dict[str, Tuple[float, float]] = {}
+        # guild id -> prefix, for the guilds with a custom prefix, see the config cog
+        self.prefixes: Dict[int, str] = {}
+        # the mention prefixes, see could_be_command
+        self._mentions: Optional[Tuple[str, ...]] = None
+        # the IPC client of this cluster, when running under the cluster launcher
+        self.cluster = None
 
         self._connector = None
         self._resolver = None
@@ -41,16 +90,55 @@ class Obsidion(commands.AutoShardedBot):
         # Do basic checks on every command
         init_global_checks(self)
 
+    async def _connect(
+        self,
+        name: str,
+        connect: Callable[[], Awaitable[T]],
+        retries: int,
+        backoff: float,
+    ) -> T:
+        """Call `connect` until it succeeds, doubling the delay between attempts.
+
+        Args:
+            name (str): name of the service, for the logs
+            connect (Callable[[], Awaitable[T]]): opens the connection
+            retries (int): attempts after the first one before giving up
+            backoff (float): seconds to wait before the first retry
+
+        Returns:
+            T: whatever `connect` returned
+        """
+        for attempt in range(retries + 1):
+            try:
+                return await connect()
+            except CONNECT_ERRORS as e:
+                if attempt == retries:
+                    raise
+                # jittered, so the clusters don't all retry at once
+                delay = backoff * 2**attempt * random.uniform(1, 1.5)
+                log.warning(
+                    f"Could not connect to {name} ({e!r}), retrying in {delay:.1f}s."
+                )
+                await asyncio.sleep(delay)
+
     async def _create_db_pool(self) -> None:
         """
         Create the postgres connection pool.
         """
-        self.db_pool = await asyncpg.create_pool(
-            database=constants.Database.database,
-            user=constants.Database.username,
-            password=constants.Database.password,
-            host=constants.Database.host,
-            port=constants.Database.port,
+        self.db_pool = await self._connect(
+            "postgres",
+            lambda: asyncpg.create_pool(
+                database=constants.Database.database,
+                user=constants.Database.username,
+                password=constants.Database.password,
+                host=constants.Database.host,
+                port=constants.Database.port,
+                min_size=constants.Database.min_size,
+                max_size=constants.Database.max_size,
+                max_inactive_connection_lifetime=constants.Database.max_idle_lifetime,
+            ),
+            constants.Database.connect_retries,
+            constants.Database.connect_backoff,
         )
 
         self.db_ready.set()
@@ -64,31 +152,79 @@ class Obsidion(commands.AutoShardedBot):
         to run the bot.
         The fakeredis cache won't have persistence across restarts, but that
         usually won't matter for local bot testing.
+        If Redis can't be reached the bot runs without it, see `Cache.available`,
+        and tries to connect again every `redis.reconnect_interval` seconds.
         """
+        previous = self.redis_session
         if not constants.Redis.enabled:
             log.info(
                 "Using fakeredis instead of communicating with a real Redis server."
             )
+            # only needed without redis, and it takes a third of the startup imports
+            import fakeredis.aioredis
+
             self.redis_session = await fakeredis.aioredis.create_redis_pool()
         else:
-            self.redis_session = await aioredis.create_redis_pool(
-                address=(constants.Redis.host, constants.Redis.port),
-            )
-
+            try:
+                self.redis_session = await self._connect(
+                    "redis",
+                    lambda: aioredis.create_redis_pool(
+                        address=(constants.Redis.host, constants.Redis.port),
+                        minsize=constants.Redis.min_size,
+                        maxsize=constants.Redis.max_size,
+                    ),
+                    constants.Redis.connect_retries,
+                    constants.Redis.connect_backoff,
+                )
+            except CONNECT_ERRORS:
+                log.error("Could not connect to redis, running without the cache.")
+                self.loop.call_later(
+                    constants.Redis.reconnect_interval, self._reconnect_redis
+                )
+                return
+
+        if previous is not None and not previous.closed:
+            # the pool of a lost connection, also ends the invalidation subscription on it
+            previous.close()
         self.redis_closed = False
         self.redis_ready.set()
 
+        # keep the in-process cache tier coherent with the other shards
+        self.cache.start_listening()
+
+    def _reconnect_redis(self) -> None:
+        if not self.is_closed():
+            self.loop.create_task(self._create_redis_session())
+
+    def redis_lost(self) -> None:
+        """Run without redis until it can be connected to again.
+
+        Called by the cache when a redis command fails, the pool is replaced by a new
+        one once redis is back.
+        """
+        if not self.redis_ready.is_set() or self.redis_closed:
+            return
+        log.error("Lost the connection to redis, running without the cache.")
+        self.redis_ready.clear()
+        self.loop.call_later(constants.Redis.reconnect_interval, self._reconnect_redis)
+
     async def login(self, *args, **kwargs) -> None:
         """Re-create the connector and set up sessions before logging into Discord."""
         self._recreate()
         await self.stats.create_socket()
+        self.watchdog.start()
+        # no command can run before the pools are up, as none is received until
+        # the bot has logged in
+        await asyncio.gather(self._create_redis_session(), self._create_db_pool())
         await super().login(*args, **kwargs)
         self.uptime = datetime.datetime.now()
 
     async def close(self) -> None:
-        """Close the Discord connection and the aiohttp session, connector, statsd client, and resolver."""
+        """Close the Discord connection and the aiohttp session, connector, stats client, and resolver."""
         await super().close()
 
+        self.watchdog.stop()
+
         if self.http_session:
             await self.http_session.close()
 
@@ -98,8 +234,7 @@ class Obsidion(commands.AutoShardedBot):
         if self._resolver:
             await self._resolver.close()
 
-        if self.stats._transport:
-            self.stats._transport.close()
+        await self.stats.close()
 
         if self.redis_session:
             self.redis_closed = True
@@ -108,7 +243,7 @@ class Obsidion(commands.AutoShardedBot):
             await self.redis_session.wait_closed()
 
     def _recreate(self) -> None:
-        """Re-create the connector, aiohttp session, the APIClient and the Redis session."""
+        """Re-create the connector, aiohttp session and the APIClient."""
         # Use asyncio for DNS resolution instead of threads so threads aren't spammed.
         # Doesn't seem to have any state with regards to being closed, so no need to worry?
         self._resolver = aiohttp.AsyncResolver()
@@ -124,22 +259,27 @@ class Obsidion(commands.AutoShardedBot):
                 "The previous redis pool was not closed; it will remain open and be overwritten"
             )
 
-        # Create the redis session
-        self.loop.create_task(self._create_redis_session())
-
-        # Create the postgres pool
-        self.loop.create_task(self._create_db_pool())
-
-        # Use AF_INET as its socket family to prevent HTTPS related problems both locally
-        # and in production.
+        # The pool size, keep-alive and DNS cache are tuned in the config. Use AF_INET
+        # as its socket family by default to prevent HTTPS related problems both
+        # locally and in production.
+        connector = constants.HTTP.connector
+        family = getattr(socket, connector["family"])
         self._connector = aiohttp.TCPConnector(
             resolver=self._resolver,
-            family=socket.AF_INET,
+            family=family,
+            limit=connector["limit"],
+            limit_per_host=connector["limit_per_host"],
+            keepalive_timeout=connector["keepalive_timeout"],
+            ttl_dns_cache=connector["ttl_dns_cache"],
         )
 
         # Client.login() will call HTTPClient.static_login() which will create a session using
-        # this connector attribute.
-        self.http.connector = self._connector
+        # this connector attribute. discord.py gets a connector of its own with the default
+        # limits: every shard's gateway websocket holds a connection for as long as it is
+        # open, so sharing the tuned pool would starve the shards (or the upstream hosts).
+        self.http.connector = aiohttp.TCPConnector(
+            resolver=self._resolver, family=family
+        )
 
         # Its __del__ does send a warning but it doesn't always show up for some reason.
         if self.http_session and not self.http_session.closed:
@@ -147,17 +287,74 @@ class Obsidion(commands.AutoShardedBot):
                 "The previous session was not closed; it will remain open and be overwritten"
             )
 
-        self.http_session = aiohttp.ClientSession(connector=self._connector)
+        # Fail fast on hosts which are down, then rate limit and cap the concurrency
+        # of requests to every upstream host.
+        self.http_session = aiohttp.ClientSession(
+            connector=self._connector,
+            timeout=aiohttp.ClientTimeout(total=constants.HTTP.default_host["timeout"]),
+            trace_configs=[
+                self.circuit_breakers.trace_config(),
+                self.rate_limiter.trace_config(),
+                http_trace_config(self.stats),
+            ],
+        )
+
+    @property
+    def total_guilds(self) -> int:
+        """Number of guilds the bot is in, across every cluster."""
+        if self.cluster is not None:
+            return self.cluster.guild_count
+        return len(self.guilds)
 
-    async def get_context(self, message, *, cls=commands.Context):
+    def owns_guild(self, guild_id: int) -> bool:
+        """Whether the guild is on one of the shards run by this process."""
+        if self.shard_ids is None:
+            return True
+        return (guild_id >> 22) % self.shard_count in self.shard_ids
+
+    async def get_context(self, message, *, cls=Context):
         return await super().get_context(message, cls=cls)
 
+    async def invoke(self, ctx: commands.Context):
+        if not isinstance(ctx, Context):
+            return await super().invoke(ctx)
+        # expose the context to everything the command runs, to time its phases
+        ctx.invoked_at = time.perf_counter()
+        token = current_context.set(ctx)
+        task = asyncio.current_task()
+        self.watchdog.commands[task] = ctx
+        try:
+            await super().invoke(ctx)
+        finally:
+            ctx.completed_at = time.perf_counter()
+            current_context.reset(token)
+            self.watchdog.commands.pop(task, None)
+
+    def prefix_for(self, guild_id: Optional[int]) -> str:
+        """The prefix of a guild, without touching the database."""
+        return self.prefixes.get(guild_id, constants.Bot.default_prefix)
+
+    def could_be_command(self, message: discord.Message) -> bool:
+        """Whether the message starts with one of the prefixes of `guild_prefix`.
+
+        This is a couple of string checks, so the (many) messages which aren't
+        commands are dropped without building a context for them.
+        """
+        if self._mentions is None:
+            if self.user is None:
+                # the mention prefixes aren't known yet, let get_context decide
+                return True
+            self._mentions = (f"<@{self.user.id}> ", f"<@!{self.user.id}> ")
+        guild_id = message.guild.id if message.guild else None
+        return message.content.startswith(
+            self.prefix_for(guild_id)
+        ) or message.content.startswith(self._mentions)
+
     async def process_commands(self, message: discord.Message):
-        if not message.author.bot:
-            ctx = await self.get_context(message)
-            await self.invoke(ctx)
-        else:
-            ctx = None
+        if message.author.bot or not self.could_be_command(message):
+            return
+        ctx = await self.get_context(message)
+        await self.invoke(ctx)
 
     async def logout(self):
         """Logs out of Discord and closes all connections."""
@@ -180,6 +377,12 @@ class Obsidion(commands.AutoShardedBot):
         sys.exit(self._shutdown_mode)
 
 
+def guild_prefix(bot: Obsidion, message: discord.Message) -> List[str]:
+    """The prefixes of the guild the message was sent in, or the default prefix in DMs."""
+    guild_id = message.guild.id if message.guild else None
+    return commands.when_mentioned_or(bot.prefix_for(guild_id))(bot, message)
+
+
 class ExitCodes(IntEnum):
     # This needs to be an int enum to be used
     # with sys.exit
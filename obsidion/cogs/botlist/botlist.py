@@ -38,26 +38,28 @@ class botlist(commands.Cog):
             "Content-Type": "application/json",
             "Authorization": constants.Discord_bot_list.bots4discord_token,
         }
-        json = {"server_count": len(self.bot.guilds)}
+        json = {"server_count": self.bot.total_guilds}
 
-        await self.session.post(
+        async with self.session.post(
             f"https://botsfordiscord.com/api/bot/{constants.Bot.clientid}",
             headers=headers,
             json=json,
-        )
+        ):
+            pass
 
     @tasks.loop(minutes=30.0)
     async def discord_boats(self):
         headers = {
             "Authorization": constants.Discord_bot_list.discordboats_token,
         }
-        json = {"server_count": len(self.bot.guilds)}
+        json = {"server_count": self.bot.total_guilds}
 
-        await self.session.post(
+        async with self.session.post(
             f"https://discord.boats/api/bot/{constants.Bot.clientid}",
             headers=headers,
             json=json,
-        )
+        ):
+            pass
 
     @tasks.loop(minutes=30.0)
     async def discord_bot_list(self):
@@ -65,26 +67,28 @@ class botlist(commands.Cog):
             "Content-Type": "application/json",
             "Authorization": constants.Discord_bot_list.discordbotlist_token,
         }
-        json = {"guilds": len(self.bot.guilds)}
+        json = {"guilds": self.bot.total_guilds}
 
-        await self.session.post(
+        async with self.session.post(
             f"https://discordbotlist.com/api/v1/bots/{constants.Bot.clientid}/stats",
             headers=headers,
             json=json,
-        )
+        ):
+            pass
 
     @tasks.loop(minutes=30.0)
     async def discord_labs(self):
         headers = {
             "token": constants.Discord_bot_list.discodlabs_token,
         }
-        json = {"server_count": len(self.bot.guilds)}
+        json = {"server_count": self.bot.total_guilds}
 
-        await self.session.post(
+        async with self.session.post(
             f"https://bots.discordlabs.org/v2/bot/{constants.Bot.clientid}/stats",
             headers=headers,
             json=json,
-        )
+        ):
+            pass
 
     @tasks.loop(minutes=30.0)
     async def bots_on_discord(self):
@@ -92,10 +96,11 @@ class botlist(commands.Cog):
             "Content-Type": "application/json",
             "Authorization": constants.Discord_bot_list.botsondiscord_token,
         }
-        json = {"guildCount": len(self.bot.guilds)}
+        json = {"guildCount": self.bot.total_guilds}
 
-        await self.session.post(
+        async with self.session.post(
             f"https://bots.ondiscord.xyz/bot-api/bots/{constants.Bot.clientid}",
             headers=headers,
             json=json,
-        )
+        ):
+            pass
@@ -1,6 +1,197 @@
+"""
+Per guild configuration.
+
+Guild prefixes are stored in postgres, and loaded in bulk into `bot.prefixes`
+at startup so resolving the prefix of a message never touches the database.
+Only guilds with a custom prefix are kept. A change is sent to every cluster
+with NOTIFY, and each cluster updates its dict when it gets the notification.
+If the listening connection is lost, it is acquired again and the prefixes are
+reloaded, as changes may have been missed in between.
+"""
+
+import asyncio
+import json
+import logging
+import sys
+from typing import List, Optional
+
+import asyncpg
 from discord.ext import commands
 
+from obsidion import constants
+from obsidion.bot import Obsidion
+from obsidion.utils.utils import log_task_errors
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS guild_prefixes (
+    guild_id BIGINT PRIMARY KEY,
+    prefix TEXT NOT NULL
+)
+"""
+
+CHANNEL = "guild_prefixes"
+
+MAX_PREFIX_LENGTH = 10
+
+# how long to wait before listening for prefix changes again, doubling up to the max
+LISTEN_BACKOFF = 1
+LISTEN_MAX_BACKOFF = 60
+
 
 class config(commands.Cog):
-    def __init__(self, bot):
+    """Configure the bot for this server."""
+
+    def __init__(self, bot: Obsidion):
         self.bot = bot
+        self._listener: Optional[asyncpg.Connection] = None
+        self._lost = asyncio.Event()
+        # changes notified while the prefixes are being reloaded, None otherwise
+        self._buffered: Optional[List[dict]] = None
+        self._task = bot.loop.create_task(self.load_prefixes())
+        self._task.add_done_callback(log_task_errors)
+
+    def cog_unload(self) -> None:
+        """Stop listening for prefix changes on cog unload."""
+        self._task.cancel()
+        if self._listener is not None:
+            self.bot.loop.create_task(self.release_listener(self._listener))
+            self._listener = None
+
+    async def release_listener(self, conn: asyncpg.Connection) -> None:
+        conn.remove_termination_listener(self.on_listener_lost)
+        try:
+            await conn.remove_listener(CHANNEL, self.on_prefix_change)
+        except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError):
+            # the connection is already gone, the pool will replace it
+            pass
+        await self.bot.db_pool.release(conn)
+
+    async def load_prefixes(self) -> None:
+        """Load the prefixes and listen for changes, for as long as the cog is loaded."""
+        await self.bot.db_ready.wait()
+        delay = LISTEN_BACKOFF
+        while True:
+            self._lost.clear()
+            try:
+                await self.listen()
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                log.warning(
+                    f"Could not listen for prefix changes ({e!r}), retrying in {delay}s."
+                )
+                if self._listener is not None and self._listener.is_closed():
+                    await self.release_listener(self._listener)
+                    self._listener = None
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, LISTEN_MAX_BACKOFF)
+                continue
+            delay = LISTEN_BACKOFF
+            await self._lost.wait()
+            log.warning("Lost the connection listening for prefix changes, reloading.")
+            await self.release_listener(self._listener)
+            self._listener = None
+
+    async def listen(self) -> None:
+        if self._listener is None:
+            self._listener = await self.bot.db_pool.acquire()
+            self._listener.add_termination_listener(self.on_listener_lost)
+        # listen before loading so no change is missed in between, and hold the
+        # changes back until the rows they may be newer than are loaded
+        self._buffered = []
+        try:
+            await self._listener.add_listener(CHANNEL, self.on_prefix_change)
+            await self._listener.execute(SCHEMA)
+            rows = await self._listener.fetch(
+                "SELECT guild_id, prefix FROM guild_prefixes"
+            )
+            # changes missed while not listening include removed prefixes, so
+            # start over
+            self.bot.prefixes.clear()
+            for row in rows:
+                if self.bot.owns_guild(row["guild_id"]):
+                    self.set_prefix(row["guild_id"], row["prefix"])
+            for change in self._buffered:
+                self.apply_change(change)
+        finally:
+            self._buffered = None
+        log.info(f"Loaded the prefixes of {len(self.bot.prefixes)} guilds.")
+
+    def on_listener_lost(self, conn: asyncpg.Connection) -> None:
+        self._lost.set()
+
+    def set_prefix(self, guild_id: int, prefix: str) -> None:
+        if prefix == constants.Bot.default_prefix:
+            self.bot.prefixes.pop(guild_id, None)
+        else:
+            # most custom prefixes are the same few strings, share them
+            self.bot.prefixes[guild_id] = sys.intern(prefix)
+
+    def on_prefix_change(self, conn, pid, channel: str, payload: str) -> None:
+        change = json.loads(payload)
+        if self._buffered is not None:
+            self._buffered.append(change)
+        else:
+            self.apply_change(change)
+
+    def apply_change(self, change: dict) -> None:
+        if self.bot.owns_guild(change["guild_id"]):
+            self.set_prefix(change["guild_id"], change["prefix"])
+
+    async def save_prefix(self, guild_id: int, prefix: str) -> None:
+        """Store the prefix of a guild, and tell every cluster about it."""
+        async with self.bot.db_pool.acquire() as conn:
+            async with conn.transaction():
+                if prefix == constants.Bot.default_prefix:
+                    await conn.execute(
+                        "DELETE FROM guild_prefixes WHERE guild_id = $1", guild_id
+                    )
+                else:
+                    await conn.execute(
+                        """
+                        INSERT INTO guild_prefixes (guild_id, prefix) VALUES ($1, $2)
+                        ON CONFLICT (guild_id) DO UPDATE SET prefix = $2
+                        """,
+                        guild_id,
+                        prefix,
+                    )
+                await conn.execute(
+                    "SELECT pg_notify($1, $2)",
+                    CHANNEL,
+                    json.dumps({"guild_id": guild_id, "prefix": prefix}),
+                )
+        # don't wait for the notification to update this cluster
+        self.set_prefix(guild_id, prefix)
+
+    @commands.group(invoke_without_command=True)
+    @commands.guild_only()
+    async def prefix(self, ctx: commands.Context):
+        """Show the prefix of this server."""
+        await ctx.send(
+            f"The prefix of this server is `{self.bot.prefix_for(ctx.guild.id)}`, you can also mention me."
+        )
+
+    @prefix.command(name="set")
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def prefix_set(self, ctx: commands.Context, prefix: str):
+        """Change the prefix of this server."""
+        if len(prefix) > MAX_PREFIX_LENGTH:
+            await ctx.send(
+                f"Sorry, a prefix can be at most {MAX_PREFIX_LENGTH} characters long."
+            )
+            return
+        await self.save_prefix(ctx.guild.id, prefix)
+        await ctx.send(
+            f":white_check_mark: The prefix of this server is now `{prefix}`."
+        )
+
+    @prefix.command(name="reset")
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def prefix_reset(self, ctx: commands.Context):
+        """Reset the prefix of this server to the default one."""
+        await self.save_prefix(ctx.guild.id, constants.Bot.default_prefix)
+        await ctx.send(
+            f":white_check_mark: The prefix of this server is now `{constants.Bot.default_prefix}`."
+        )
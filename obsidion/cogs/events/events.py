@@ -11,17 +11,15 @@ class events(commands.Cog):
     @commands.Cog.listener()
     async def on_guild_join(self, guild):
         if constants.Channels.new_guild_channel:
-            users = sum(1 for m in guild.members if not m.bot)
-            bots = sum(1 for m in guild.members if m.bot)
-            members = f"Humans: `{users}/{len(guild.members)}` \n Bots: `{bots}/{len(guild.members)}`"
             embed = discord.Embed(name=f"{self.bot.user.name} has joined a guild")
             embed.set_footer(
-                text=f"Guild: {len(self.bot.guilds):,} | Shard: {guild.shard_id}/{self.bot.shard_count-1} | rejoin"
+                text=f"Guild: {self.bot.total_guilds:,} | Shard: {guild.shard_id}/{self.bot.shard_count-1} | rejoin"
             )
             guild_text = (
                 f"Name: `{guild.name}`\n"
                 f"ID: `{guild.id}`\n"
-                f"Owner ID: `{guild.owner.id}`\n"
+                f"Owner ID: `{guild.owner_id}`\n"
+                f"Members: `{guild.member_count:,}`\n"
             )
 
             embed.add_field(name="Guild", value=guild_text)
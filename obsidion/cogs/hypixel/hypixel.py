@@ -1,5 +1,3 @@
-from aiohypixel import HypixelSession
-
 import discord
 from discord.ext import commands
 
@@ -10,12 +8,20 @@ class hypixel(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.session = bot.http_session
+        self._hypixel_session = None
 
-        self.hypixel_session = HypixelSession(
-            api_keys=(
-                [str(constants.Bot.hypixelapi_token), "strong", "random key"]
-            )  # I HATE THIS I NEED TO FIX THE LIBRARY
-        )
+    @property
+    def hypixel_session(self):
+        """The Hypixel api session, aiohypixel is only imported on first use."""
+        if self._hypixel_session is None:
+            from aiohypixel import HypixelSession
+
+            self._hypixel_session = HypixelSession(
+                api_keys=(
+                    [str(constants.Bot.hypixelapi_token), "strong", "random key"]
+                )  # I HATE THIS I NEED TO FIX THE LIBRARY
+            )
+        return self._hypixel_session
 
     @commands.command()
     async def watchdogstats(self, ctx: commands.Context):
@@ -1,8 +1,6 @@
 import discord
 from discord.ext import commands
 
-from obsidion.utils.utils import usernameToUUID
-
 import logging
 
 log = logging.getLogger(__name__)
@@ -50,7 +48,7 @@ class images(commands.Cog):
     async def avatar(self, ctx: commands.Context, username: str):
         """Renders a Minecraft players face."""
         await ctx.channel.trigger_typing()
-        uuid = await usernameToUUID(username, ctx.bot.http_session)
+        uuid = await ctx.bot.uuid_resolver.username_to_uuid(username)
         if uuid:
             embed = discord.Embed(
                 description=f"Here is: `{username}`'s Face! \n **[DOWNLOAD](https://visage.surgeplay.com/face/512/{uuid})**",
@@ -69,7 +67,7 @@ class images(commands.Cog):
     async def skull(self, ctx: commands.Context, username: str = None):
         """Renders a Minecraft players skull."""
         await ctx.channel.trigger_typing()
-        uuid = await usernameToUUID(username, ctx.bot.http_session)
+        uuid = await ctx.bot.uuid_resolver.username_to_uuid(username)
         if uuid:
             embed = discord.Embed(
                 description=f"Here is: `{username}`'s Skull! \n **[DOWNLOAD](https://visage.surgeplay.com/head/512/{uuid})**",
@@ -88,7 +86,7 @@ class images(commands.Cog):
     async def skin(self, ctx: commands.Context, username: str):
         """Renders a Minecraft players skin."""
         await ctx.channel.trigger_typing()
-        uuid = await usernameToUUID(username, ctx.bot.http_session)
+        uuid = await ctx.bot.uuid_resolver.username_to_uuid(username)
         if uuid:
             embed = discord.Embed(
                 description=f"Here is: `{username}`'s Skin! \n **[DOWNLOAD](https://visage.surgeplay.com/full/512/{uuid})**",
@@ -113,7 +111,7 @@ class images(commands.Cog):
                 f"{ctx.message.author.mention}, Please supply a render type. Your options are:\n `face`, `front`, `frontfull`, `head`, `bust`, `skin` \n Type: ?render <render type> <username>"
             )
             return
-        uuid = await usernameToUUID(username, ctx.bot.http_session)
+        uuid = await ctx.bot.uuid_resolver.username_to_uuid(username)
         if uuid:
             embed = discord.Embed(
                 description=f"Here is: `{username}`'s {render_type}! \n **[DOWNLOAD](https://visage.surgeplay.com/{render_type}/512/{uuid})**",
@@ -1,18 +1,71 @@
+import asyncio
 import base64
+import hashlib
 import io
-import json
 import logging
+import time
 from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
 
 import discord
 from discord.ext import commands
 
 from obsidion import constants
 from obsidion.bot import Obsidion
+from obsidion.utils.cache import cached
+from obsidion.utils.chat_formatting import shorten
+from obsidion.utils.ping import bedrock_status, java_status
 from obsidion.utils.utils import get
 
 log = logging.getLogger(__name__)
 
+# highest port number of an address
+MAX_PORT = 65535
+# shown for servers without a description, discord refuses empty embed fields
+NO_DESCRIPTION = "No description"
+# seconds between edits of a streamed embed, so we stay under discord's rate limit
+EDIT_INTERVAL = 1.0
+# servers shown per page of the servers command, and the most characters of the
+# name and value of each field: 10 * (100 + 400) keeps a page well under the
+# 6000 characters discord allows in an embed
+PAGE_SIZE = 10
+FIELD_NAME_LENGTH = 100
+FIELD_VALUE_LENGTH = 400
+# seconds the discord cdn url of an uploaded favicon is reused for at most, its
+# signed link expires after about a day (and when the message is deleted)
+FAVICON_TTL = 43200
+# seconds before the expiry of the link to stop reusing it
+FAVICON_EXPIRY_MARGIN = 3600
+
+
+def favicon_ttl(url: str) -> int:
+    """Seconds the cdn url of an uploaded favicon can be reused for.
+
+    Attachment urls are signed, `ex` is the unix time (in hex) they expire at.
+
+    Args:
+        url (str): cdn url of the attachment
+
+    Returns:
+        int: seconds to cache the url for, 0 if it shouldn't be
+    """
+    expires = parse_qs(urlsplit(url).query).get("ex")
+    if not expires:
+        return FAVICON_TTL
+    try:
+        remaining = int(expires[0], 16) - time.time() - FAVICON_EXPIRY_MARGIN
+    except ValueError:
+        return 0
+    return max(min(int(remaining), FAVICON_TTL), 0)
+
+
+def server_key(prefix: str, server_ip: str, port) -> str:
+    """Redis key of a server status."""
+    if port:
+        return f"{prefix}_{server_ip}:{port}"
+    return f"{prefix}_{server_ip}"
+
 
 class info(commands.Cog):
     """commands that are bot related."""
@@ -21,15 +74,11 @@ class info(commands.Cog):
         """initialise the bot"""
         self.bot = bot
 
-    @staticmethod
-    async def get_uuid(session, username: str):
-        url = f"https://api.mojang.com/users/profiles/minecraft/{username}"
-        async with session.get(url) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                uuid = data["id"]
-                return uuid
-            return False
+    @cached(lambda uuid: f"names_{uuid}", ttl=28800)
+    async def get_names(self, uuid: str):
+        return await get(
+            self.bot.http_session, f"https://api.mojang.com/user/profiles/{uuid}/names"
+        )
 
     @commands.command(
         aliases=["whois", "p", "names", "namehistory", "pastnames", "namehis"]
@@ -38,13 +87,7 @@ class info(commands.Cog):
     async def profile(self, ctx: commands.Context, username: str):
         """View a players Minecraft UUID, Username history and skin."""
         await ctx.channel.trigger_typing()
-        if await self.bot.redis_session.exists(f"username_{username}"):
-            uuid = await self.bot.redis_session.get(
-                f"username_{username}", encoding="utf-8"
-            )
-        else:
-            uuid = await self.get_uuid(ctx.bot.http_session, username)
-            self.bot.redis_session.set(f"username_{username}", uuid, expire=28800)
+        uuid = await self.bot.uuid_resolver.username_to_uuid(username)
 
         if not uuid:
             await ctx.send("That username is not been used.")
@@ -52,14 +95,7 @@ class info(commands.Cog):
 
         long_uuid = f"{uuid[0:8]}-{uuid[8:12]}-{uuid[12:16]}-{uuid[16:20]}-{uuid[20:]}"
 
-        if await self.bot.redis_session.exists(uuid):
-            names = json.loads(await self.bot.redis_session.get(uuid))
-        else:
-            names = await get(
-                ctx.bot.http_session,
-                f"https://api.mojang.com/user/profiles/{uuid}/names",
-            )
-            self.bot.redis_session.set(uuid, json.dumps(names), expire=28800)
+        names = await self.get_names(uuid)
 
         name_list = ""
         for name in names[::-1][:-1]:
@@ -90,45 +126,46 @@ class info(commands.Cog):
         await ctx.send(embed=embed)
 
     @staticmethod
-    def get_server(ip: str, port):
-        """returns the server icon"""
+    def get_server(ip: str, port) -> Union[Tuple[str, Optional[str]], bool]:
+        """Split the port off an address, False if the address is invalid"""
         if ":" in ip:  # deal with them providing port in string instead of seperate
-            ip, port = ip.split(":")
-            return (ip, port)
-        if port:
-            return (ip, port)
-        return (ip, None)
+            ip, port = ip.split(":", 1)
+        if not ip or ":" in ip:
+            return False
+        if port is not None and not (str(port).isdigit() and 0 < int(port) <= MAX_PORT):
+            return False
+        return (ip, port or None)
+
+    @cached(lambda server_ip, port: server_key("server", server_ip, port), ttl=300)
+    async def get_java_server(self, server_ip: str, port):
+        return await java_status(server_ip, port)
+
+    @cached(lambda server_ip, port: server_key("bserver", server_ip, port), ttl=300)
+    async def get_bedrock_server(self, server_ip: str, port):
+        return await bedrock_status(server_ip, port)
 
     @commands.command()
     @commands.cooldown(rate=1, per=5.0, type=commands.BucketType.user)
     async def server(self, ctx: commands.Context, server_ip: str, port: int = None):
         """Get info on a minecraft server"""
         await ctx.channel.trigger_typing()
-        url = f"{constants.Bot.api}/server/java"
-        server_ip, _port = self.get_server(server_ip, port)
+        address = self.get_server(server_ip, port)
+        if not address:
+            await ctx.send(
+                f"{ctx.author}, :x: `{server_ip}` is not a valid server address."
+            )
+            return
+        server_ip, _port = address
         if _port:
             port = _port
-        if port:
-            payload = {"server": server_ip, "port": port}
-        else:
-            payload = {"server": server_ip}
-
-        if port:
-            key = f"server_{server_ip}:ip"
-        else:
-            key = f"server_{server_ip}"
-        if await self.bot.redis_session.exists(key):
-            data = json.loads(await self.bot.redis_session.get(key))
-        else:
-            data = await get(ctx.bot.http_session, url, payload)
-            self.bot.redis_session.set(key, json.dumps(data), expire=300)
+        data = await self.get_java_server(server_ip, port)
         if not data:
             await ctx.send(
                 f"{ctx.author}, :x: The Java edition Minecraft server `{server_ip}` is currently not online or cannot be requested"
             )
             return
         embed = discord.Embed(title=f"Java Server: {server_ip}", color=0x00FF00)
-        embed.add_field(name="Description", value=data["description"])
+        embed.add_field(name="Description", value=data["description"] or NO_DESCRIPTION)
 
         embed.add_field(
             name="Players",
@@ -145,47 +182,154 @@ class info(commands.Cog):
             inline=False,
         )
         if data["favicon"]:
+            # favicons are keyed by their contents, so a favicon is uploaded once
+            # and its cdn url reused by every server (and lookup) showing it
+            key = f"favicon_{hashlib.sha1(data['favicon'].encode('utf-8')).hexdigest()}"
+            url = await self.bot.cache.get(key)
+            if url:
+                embed.set_thumbnail(url=url)
+                await ctx.send(embed=embed)
+                return
             encoded = base64.decodebytes(data["favicon"][22:].encode("utf-8"))
             image_bytesio = io.BytesIO(encoded)
             favicon = discord.File(image_bytesio, "favicon.png")
             embed.set_thumbnail(url="attachment://favicon.png")
-            await ctx.send(embed=embed, file=favicon)
+            message = await ctx.send(embed=embed, file=favicon)
+            self.bot.stats.incr(
+                f"upload_bytes.{ctx.command.qualified_name}", len(encoded)
+            )
+            if message.embeds and message.embeds[0].thumbnail.url:
+                url = message.embeds[0].thumbnail.url
+                ttl = favicon_ttl(url)
+                if ttl:
+                    await self.bot.cache.set(key, url, ttl)
         else:
             embed.set_thumbnail(
                 url="https://media.discordapp.net/attachments/493764139290984459/602058959284863051/unknown.png"
             )
             await ctx.send(embed=embed)
 
+    async def ping_servers(
+        self, addresses: List[str]
+    ) -> AsyncIterator[Tuple[int, str, dict]]:
+        """Ping several Java servers concurrently, yielding them as they answer.
+
+        At most `ping.bulk_concurrency` pings are in flight at once, and the
+        statuses are shared with (and cached like) the `server` command.
+
+        Args:
+            addresses (List[str]): addresses of the servers, with optional ports
+
+        Yields:
+            Tuple[int, str, dict]: index and address of a server and its status,
+                False if it is offline and None if the address is invalid
+        """
+        semaphore = asyncio.Semaphore(constants.Ping.bulk_concurrency)
+
+        async def check(index: int, address: str):
+            server = self.get_server(address, None)
+            if not server:
+                return index, address, None
+            server_ip, port = server
+            async with semaphore:
+                return index, address, await self.get_java_server(server_ip, port)
+
+        for done in asyncio.as_completed(
+            [check(index, address) for index, address in enumerate(addresses)]
+        ):
+            yield await done
+
+    @staticmethod
+    def server_summary(data: Optional[dict]) -> str:
+        if data is None:
+            return ":x: Not a valid server address"
+        if not data:
+            return ":x: Not online or cannot be requested"
+        summary = (
+            f":white_check_mark: `{data['players']['online']:,}/"
+            f"{data['players']['max']:,}` players on `{data['version']['name']}`"
+        )
+        if data.get("latency") is not None:
+            summary += f" ({data['latency']}ms)"
+        return summary
+
+    @commands.command()
+    @commands.cooldown(rate=1, per=30.0, type=commands.BucketType.user)
+    async def servers(self, ctx: commands.Context, *addresses: str):
+        """Get info on several minecraft servers at once"""
+        # the same server twice would only cost another ping
+        addresses = list(dict.fromkeys(addresses))
+        if not addresses:
+            await ctx.send("Please give the addresses of the servers to check.")
+            return
+        if len(addresses) > constants.Ping.bulk_limit:
+            await ctx.send(
+                f"Sorry, only up to {constants.Ping.bulk_limit} servers can be checked at once."
+            )
+            return
+
+        # one message per page, every page edited as its results come in
+        pages = [
+            addresses[start : start + PAGE_SIZE]
+            for start in range(0, len(addresses), PAGE_SIZE)
+        ]
+        embeds = []
+        for number, page in enumerate(pages, 1):
+            title = "Java Servers"
+            if len(pages) > 1:
+                title += f" ({number}/{len(pages)})"
+            embed = discord.Embed(title=title, color=0x00FF00)
+            for address in page:
+                embed.add_field(
+                    name=shorten(address, FIELD_NAME_LENGTH),
+                    value="Pinging...",
+                    inline=False,
+                )
+            embeds.append(embed)
+        messages = [await ctx.send(embed=embed) for embed in embeds]
+
+        loop = asyncio.get_event_loop()
+        last_edit = loop.time()
+        pending = set()
+        async for index, address, data in self.ping_servers(addresses):
+            page, position = divmod(index, PAGE_SIZE)
+            embeds[page].set_field_at(
+                position,
+                name=shorten(address, FIELD_NAME_LENGTH),
+                value=shorten(self.server_summary(data), FIELD_VALUE_LENGTH),
+                inline=False,
+            )
+            pending.add(page)
+            if loop.time() - last_edit >= EDIT_INTERVAL:
+                for page in sorted(pending):
+                    await messages[page].edit(embed=embeds[page])
+                last_edit = loop.time()
+                pending.clear()
+        for page in sorted(pending):
+            await messages[page].edit(embed=embeds[page])
+
     @commands.command()
     @commands.cooldown(rate=1, per=5.0, type=commands.BucketType.user)
     async def serverpe(self, ctx: commands.Context, server_ip: str, port: int = None):
         """Get info on a minecraft PE server"""
         await ctx.channel.trigger_typing()
-        url = f"{constants.Bot.api}/server/bedrock"
-        server_ip, _port = self.get_server(server_ip, port)
+        address = self.get_server(server_ip, port)
+        if not address:
+            await ctx.send(
+                f"{ctx.author}, :x: `{server_ip}` is not a valid server address."
+            )
+            return
+        server_ip, _port = address
         if _port:
             port = _port
-        if port:
-            payload = {"server": server_ip, "port": port}
-        else:
-            payload = {"server": server_ip}
-
-        if port:
-            key = f"bserver_{server_ip}:ip"
-        else:
-            key = f"bserver_{server_ip}"
-        if await self.bot.redis_session.exists(key):
-            data = json.loads(await self.bot.redis_session.get(key))
-        else:
-            data = await get(ctx.bot.http_session, url, payload)
-            self.bot.redis_session.set(key, json.dumps(data), expire=300)
+        data = await self.get_bedrock_server(server_ip, port)
         if not data:
             await ctx.send(
                 f"{ctx.author}, :x: The Bedrock edition Minecraft server `{server_ip}` is currently not online or cannot be requested"
             )
             return
         embed = discord.Embed(title=f"Bedrock Server: {server_ip}", color=0x00FF00)
-        embed.add_field(name="Description", value=data["motd"])
+        embed.add_field(name="Description", value=data["motd"] or NO_DESCRIPTION)
 
         embed.add_field(
             name="Players",
@@ -203,12 +347,8 @@ class info(commands.Cog):
             embed.add_field(name="Players Online", value=names, inline=False)
         await ctx.send(embed=embed)
 
-    @commands.command(aliases=["sales"])
-    @commands.cooldown(rate=1, per=5.0, type=commands.BucketType.user)
-    async def status(self, ctx: commands.Context):
-        """Check the status of all the Mojang services"""
-        await ctx.channel.trigger_typing()
-        data = await get(ctx.bot.http_session, f"{constants.Bot.api}/mojang/check")
+    @cached(lambda: "status", ttl=3600)
+    async def get_sales(self):
         sales_mapping = {
             "item_sold_minecraft": True,
             "prepaid_card_redeemed_minecraft": True,
@@ -216,15 +356,24 @@ class info(commands.Cog):
             "item_sold_scrolls": False,
         }
         payload = {"metricKeys": [k for (k, v) in sales_mapping.items() if v]}
+        url = "https://api.mojang.com/orders/statistics"
+        async with self.bot.http_session.post(url, json=payload) as resp:
+            if resp.status == 200:
+                return await resp.json()
+            return False
 
-        if await self.bot.redis_session.exists("status"):
-            sales_data = json.loads(await self.bot.redis_session.get("status"))
-        else:
-            url = "https://api.mojang.com/orders/statistics"
-            async with ctx.bot.http_session.post(url, json=payload) as resp:
-                if resp.status == 200:
-                    sales_data = await resp.json()
-            await self.bot.redis_session.set("status", json.dumps(sales_data))
+    @commands.command(aliases=["sales"])
+    @commands.cooldown(rate=1, per=5.0, type=commands.BucketType.user)
+    async def status(self, ctx: commands.Context):
+        """Check the status of all the Mojang services"""
+        await ctx.channel.trigger_typing()
+        data = await get(ctx.bot.http_session, f"{constants.Bot.api}/mojang/check")
+        sales_data = await self.get_sales()
+        if not sales_data:
+            await ctx.send(
+                f"{ctx.author}, :x: The Minecraft sales statistics could not be requested"
+            )
+            return
 
         services = ""
         for service in data:
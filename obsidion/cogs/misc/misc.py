@@ -87,6 +87,8 @@ class miscellaneous(commands.Cog):
         print(uptime_str)
 
         statics = (
+            f"Servers: `{self.bot.total_guilds:,}`\n"
+            f"Shards: `{self.bot.shard_count}`\n"
             f"Memory Usage: `{ram}MB`\n"
             f"Uptime: `{uptime_str}`\n"
             f"Discord.py: `v{discord.__version__}`"
@@ -0,0 +1,225 @@
+"""
+Declarative scraping of server stats pages.
+
+Every site is described by a `Site`: precompiled XPath expressions for the top
+level fields of a player page and for its per game stat tables. A page is parsed
+once with lxml's C parser and every field is read straight off the tree, instead
+of walking it with repeated BeautifulSoup `find` calls.
+
+The `parse_<site>` functions are plain module level functions, so they can be
+sent to the parser process pool.
+"""
+
+from typing import Callable, Dict, Optional, Sequence, Union
+
+from lxml import etree
+
+__all__ = [
+    "Field",
+    "Site",
+    "has_class",
+    "parse_blocksmc",
+    "parse_gommehd",
+    "parse_minesaga",
+    "parse_universocraft",
+    "parse_veltpvp",
+]
+
+_parser = etree.HTMLParser(encoding="utf-8")
+
+
+def has_class(name: str) -> str:
+    """XPath predicate matching elements with `name` as one of their classes."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def clean(text: str) -> str:
+    return text.replace("\n", "").strip()
+
+
+def strip(text: str) -> str:
+    return text.strip()
+
+
+def raw(text: str) -> str:
+    return text
+
+
+def line(index: int) -> Callable[[str], str]:
+    """Transform picking one line out of an element's text."""
+
+    def transform(text: str) -> str:
+        lines = text.split("\n")
+        return lines[index].replace("\xa0", " ").strip() if index < len(lines) else ""
+
+    return transform
+
+
+class Field:
+    """A string read from the tree by an XPath expression.
+
+    Args:
+        path (str): XPath expression, evaluating to a string or to text nodes
+            which are joined together
+        transform (Callable[[str], str], optional): applied to the string.
+            Defaults to stripping newlines and surrounding whitespace.
+    """
+
+    def __init__(self, path: str, transform: Callable[[str], object] = clean):
+        self.xpath = etree.XPath(path, smart_strings=False)
+        self.transform = transform
+
+    def __call__(self, node: etree._Element) -> object:
+        value = self.xpath(node)
+        if isinstance(value, list):
+            value = "".join(value)
+        return self.transform(value)
+
+
+class Site:
+    """Description of a player stats page.
+
+    Args:
+        missing (str): XPath expression which is true on the page of a player
+            that does not exist
+        fields (Dict[str, Field], optional): top level fields of the player
+        games (Sequence[str], optional): XPath expressions selecting the game
+            sections, in order
+        game_name (Field, optional): name of a game, relative to its section
+        stats (str, optional): XPath expression selecting the stats of a game,
+            relative to its section
+        stat_name (Field, optional): name of a stat, relative to the stat
+        stat_value (Field, optional): value of a stat, relative to the stat
+    """
+
+    def __init__(
+        self,
+        missing: str,
+        fields: Dict[str, Field] = None,
+        games: Sequence[str] = (),
+        game_name: Optional[Field] = None,
+        stats: Optional[str] = None,
+        stat_name: Optional[Field] = None,
+        stat_value: Optional[Field] = None,
+    ):
+        self.missing = etree.XPath(f"boolean({missing})")
+        self.fields = fields or {}
+        self.games = [etree.XPath(path) for path in games]
+        self.game_name = game_name
+        self.stats = etree.XPath(stats) if stats else None
+        self.stat_name = stat_name
+        self.stat_value = stat_value
+
+    def parse(self, page: str) -> Union[dict, bool]:
+        """Extract the stats of a player, False if the player was not found."""
+        root = etree.fromstring(page.encode("utf-8"), _parser)
+        if root is None or self.missing(root):
+            return False
+
+        data = {name: field(root) for name, field in self.fields.items()}
+        data["game_stats"] = []
+        for games in self.games:
+            for game in games(root):
+                stats = {}
+                for stat in self.stats(game):
+                    stats[self.stat_name(stat)] = self.stat_value(stat)
+                data["game_stats"].append({self.game_name(game): stats})
+        return data
+
+
+BLOCKSMC = Site(
+    missing=f"not(//p[{has_class('profile-rank')}])",
+    fields={
+        "rank": Field(f"string(//p[{has_class('profile-rank')}])"),
+        "timeplayed": Field("string(//h1[@dir='ltr'])"),
+    },
+    games=[f"//div[{has_class('col-xl-4')}]"],
+    game_name=Field(f"string(.//div[{has_class('title')}])"),
+    stats=".//li",
+    stat_name=Field(f"string(.//div[{has_class('key')}])"),
+    stat_value=Field(f"string(.//div[{has_class('val')}])", int),
+)
+
+UNIVERSOCRAFT = Site(
+    missing="string((//p)[1]) = '¡No se ha encontrado ningún usuario con ese nombre!'",
+    games=[f"//div[{has_class('game')}]"],
+    game_name=Field("string(.//h2)"),
+    stats=f".//div[{has_class('game-stat')}]",
+    stat_name=Field(f"string(.//p[{has_class('game-stat-title')}])", raw),
+    stat_value=Field(f"string(.//p[{has_class('game-stat-count')}])", raw),
+)
+
+_minesaga_details = f"(//div[{has_class('dd-profile-details')}])[1]"
+MINESAGA = Site(
+    missing=f"not({_minesaga_details}//h4)",
+    fields={
+        "joined": Field(f"string({_minesaga_details}//h4)", strip),
+        "last_seen": Field(f"string(({_minesaga_details}//span)[2])", strip),
+        "play_time": Field(f"string(({_minesaga_details}//span)[3])", strip),
+    },
+    games=["//div[normalize-space(@class)='dd-section col-md-4']"],
+    game_name=Field(f"string(.//div[{has_class('dd-box-title')}])"),
+    stats=".//dl",
+    stat_name=Field("string(.//dt)"),
+    stat_value=Field("string(.//dd)", raw),
+)
+
+GOMMEHD = Site(
+    missing="string((//title)[1]) = 'Statistiken'",
+    games=[f"//div[{has_class('stat-table')}]"],
+    game_name=Field("string(.//h5)"),
+    stats=".//li",
+    # the score sits inside the element holding the name of the stat
+    stat_name=Field(f".//text()[not(ancestor::span[{has_class('score')}])]"),
+    stat_value=Field(f"string(.//span[{has_class('score')}])", raw),
+)
+
+_veltpvp_unknown = ".//div[normalize-space(@class)='server unknown']"
+VELTPVP = Site(
+    missing="not(//div[@id='profile'])",
+    fields={
+        "rank": Field("string((//div[@id='profile'])[1]//h2)", strip),
+        "last_seen": Field(f"string(//div[{has_class('bottom')}])", line(2)),
+        "current_status": Field(f"string(//div[{has_class('top')}])", strip),
+        "first_joined": Field(f"string((//div[{has_class('element')}])[2])", line(3)),
+        "time_played": Field(f"string((//div[{has_class('element')}])[2])", line(5)),
+        "monthly_views": Field(f"string((//div[{has_class('element')}])[2])", line(7)),
+    },
+    games=[
+        # the first (featured) game is a link, the others are listed until the
+        # first one which isn't an unknown server
+        f"(//a[{has_class('server')}])[1]",
+        f"//div[{has_class('server')}][{_veltpvp_unknown}]"
+        f"[not(preceding::div[{has_class('server')}][not({_veltpvp_unknown})])]"
+        f"[not(ancestor::div[{has_class('server')}][not({_veltpvp_unknown})])]",
+    ],
+    game_name=Field(f"string(.//div[{has_class('server-header')}])", strip),
+    stats=f".//div[{has_class('server-stat')}]",
+    stat_name=Field(f"string(.//div[{has_class('server-stat-description')}])", strip),
+    stat_value=Field(f"string(.//div[{has_class('server-stat-number')}])", strip),
+)
+
+
+def parse_blocksmc(html: str):
+    """Parse a BlocksMC player page, False if the player was not found."""
+    return BLOCKSMC.parse(html)
+
+
+def parse_universocraft(html: str):
+    """Parse a UniversoCraft player page, False if the player was not found."""
+    return UNIVERSOCRAFT.parse(html)
+
+
+def parse_minesaga(html: str):
+    """Parse a Minesaga player page, False if the player was not found."""
+    return MINESAGA.parse(html)
+
+
+def parse_gommehd(html: str):
+    """Parse a GommeHD player page, False if the player was not found."""
+    return GOMMEHD.parse(html)
+
+
+def parse_veltpvp(html: str):
+    """Parse a VeltPVP player page, False if the player was not found."""
+    return VELTPVP.parse(html)
@@ -1,7 +1,12 @@
+import asyncio
+import logging
+from typing import Callable
+
 import discord
 from discord.ext import commands
 from .utils import (
     wyncraftClasses,
+    hiveMCPlayer,
     hiveMCStatus,
     hiveMCGameStats,
     hiveMCRank,
@@ -11,9 +16,10 @@ from .utils import (
     minesaga,
     gommehd,
     veltpvp,
+    shutdown_parser_pool,
 )
-from obsidion.utils.utils import usernameToUUID
-import json
+
+log = logging.getLogger(__name__)
 
 hive_con = {
     # "survival_games": "SG",
@@ -47,28 +53,109 @@ hive_con = {
     "explosive_eggs": "EE",
 }
 
+# stats from the hive api which are not shown to the user
+hive_hidden_stats = (
+    "UUID",
+    "cached",
+    "firstLogin",
+    "lastLogin",
+    "achievements",
+    "title",
+)
+
+
+def add_game_stats(embed: discord.Embed, data: dict) -> None:
+    """Add a field for every game in the `game_stats` of a scraped player."""
+    for game in data["game_stats"]:
+        value = ""
+        name = list(game)
+        name_new = name[0]
+        scores = game[name_new]
+        for key in scores.keys():
+            value += f"{key}: {scores[key]}\n"
+        embed.add_field(name=name_new, value=value)
+
 
 class servers(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    def cog_unload(self):
+        shutdown_parser_pool()
+
+    async def player_embed(
+        self,
+        key: str,
+        username: str,
+        fetch: Callable,
+        build: Callable[[dict], discord.Embed],
+        embed_key: str = None,
+    ):
+        """Get the stats embed of a player, composing and caching it on a miss.
+
+        The player's stats and UUID (for the thumbnail) are fetched concurrently,
+        and the finished embed is cached so a warm lookup makes no requests. The
+        embed is only cached with its thumbnail, so a failed or missing UUID
+        lookup costs the thumbnail of this lookup alone.
+
+        Args:
+            key (str): redis key of the player's stats
+            username (str): username of the player
+            fetch (Callable): fetches the player's stats from upstream
+            build (Callable[[dict], discord.Embed]): builds the embed from the stats
+            embed_key (str, optional): redis key of the embed, for when several
+                embeds are built from the same stats. Defaults to `embed_{key}`.
+
+        Returns:
+            discord.Embed: the embed, or None if the player has no stats
+        """
+        embed_key = embed_key or f"embed_{key}"
+        embed = await self.bot.cache.get(embed_key)
+        if embed is not None:
+            return discord.Embed.from_dict(embed)
+
+        data, uuid = await asyncio.gather(
+            self.bot.cache.get_or_fetch(key, fetch, ttl=28800),
+            self.bot.uuid_resolver.username_to_uuid(username),
+            return_exceptions=True,
+        )
+        if isinstance(data, BaseException):
+            raise data
+        if isinstance(uuid, Exception):
+            log.warning(f"Could not get the UUID of {username} ({uuid!r}).")
+            uuid = None
+        elif isinstance(uuid, BaseException):
+            raise uuid
+        if not data:
+            # not found is already cached with the stats
+            return None
+        embed = build(data)
+        if uuid:
+            embed.set_thumbnail(url=f"https://visage.surgeplay.com/bust/{uuid}")
+            await self.bot.cache.set(embed_key, embed.to_dict(), 28800)
+        return embed
+
     @commands.command()
     @commands.cooldown(rate=1, per=5.0, type=commands.BucketType.user)
     async def wyncraft(self, ctx: commands.Context, username: str):
         """Get statistics of a player on wynncraft."""
         await ctx.trigger_typing()
-        if await self.bot.redis_session.exists(f"wyncraft_{username}"):
-            data = json.loads(await self.bot.redis_session.get(f"wyncraft_{username}"))
-        else:
-            data = await wyncraftClasses(username, ctx.bot.http_session)
-            self.bot.redis_session.set(
-                f"wyncraft_{username}", json.dumps(data), expire=28800
-            )
-        if not data:
+        embed = await self.player_embed(
+            f"wyncraft_{username}",
+            username,
+            lambda: wyncraftClasses(username, ctx.bot.http_session),
+            lambda data: self.wyncraft_embed(username, data),
+        )
+        if not embed:
             await ctx.send(
                 f"`{username}` has not logged onto Wynncraft or their status is not available."
             )
             return
+        embed.timestamp = ctx.message.created_at
+        await ctx.send(embed=embed)
+
+    @staticmethod
+    def wyncraft_embed(username: str, data: dict) -> discord.Embed:
         len_data = len(data["classes"])
         embed = discord.Embed(color=0xA4EC66)
         embed.set_author(
@@ -76,10 +163,6 @@ class servers(commands.Cog):
             url=f"https://wynncraft.com/stats/player/{username}",
             icon_url="https://cdn.wynncraft.com/img/wynn.png",
         )
-        embed.set_thumbnail(
-            url=f"https://visage.surgeplay.com/bust/{await usernameToUUID(username, ctx.bot.http_session)}"
-        )
-        embed.timestamp = ctx.message.created_at
         for i in range(len_data):
             embed.add_field(
                 name=data["classes"][i]["class_name"],
@@ -89,72 +172,65 @@ class servers(commands.Cog):
                     f"Class Deaths: `{data['classes'][i]['class_deaths']}`"
                 ),
             )
-        await ctx.send(embed=embed)
+        return embed
 
     @commands.command()
     @commands.cooldown(rate=1, per=5.0, type=commands.BucketType.user)
     async def gommehd(self, ctx: commands.Context, username: str):
         """Get statistics of a player on gommehd."""
         await ctx.trigger_typing()
-        if await self.bot.redis_session.exists(f"gommehd_{username}"):
-            data = json.loads(await self.bot.redis_session.get(f"gommehd_{username}"))
-        else:
-            data = await gommehd(username, ctx.bot.http_session)
-            self.bot.redis_session.set(
-                f"gommehd_{username}", json.dumps(data), expire=28800
-            )
-        if data == False:
+        embed = await self.player_embed(
+            f"gommehd_{username}",
+            username,
+            lambda: gommehd(username, ctx.bot.http_session),
+            lambda data: self.gommehd_embed(username, data),
+        )
+        if not embed:
             await ctx.send(
                 f"`{username}` has not logged onto GommeHD or their status is not available."
             )
             return
+        embed.timestamp = ctx.message.created_at
+        await ctx.send(embed=embed)
+
+    @staticmethod
+    def gommehd_embed(username: str, data: dict) -> discord.Embed:
         embed = discord.Embed(color=0xF1A90F)
         embed.set_author(
             name=f"GommeHD information for {username}",
             url=f"https://www.gommehd.net/player/index?playerName={username}",
             icon_url="https://www.gommehd.net/images/brandmark@3x.png",
         )
-        embed.set_thumbnail(
-            url=f"https://visage.surgeplay.com/bust/{await usernameToUUID(username, ctx.bot.http_session)}"
-        )
-        embed.timestamp = ctx.message.created_at
-        for game in data["game_stats"]:
-            value = ""
-            name = list(game)
-            name_new = name[0]
-            scores = game[name_new]
-            for key in scores.keys():
-                value += f"{key}: {scores[key]}\n"
-            embed.add_field(name=name_new, value=value)
-        await ctx.send(embed=embed)
+        add_game_stats(embed, data)
+        return embed
 
     @commands.command()
     @commands.cooldown(rate=1, per=5.0, type=commands.BucketType.user)
     async def veltpvp(self, ctx: commands.Context, username: str):
         """Get statistics of a player on veltpvp."""
         await ctx.trigger_typing()
-        if await self.bot.redis_session.exists(f"veltpvp_{username}"):
-            data = json.loads(await self.bot.redis_session.get(f"veltpvp_{username}"))
-        else:
-            data = await veltpvp(username, ctx.bot.http_session)
-            self.bot.redis_session.set(
-                f"veltpvp_{username}", json.dumps(data), expire=28800
-            )
-        if not data:
+        embed = await self.player_embed(
+            f"veltpvp_{username}",
+            username,
+            lambda: veltpvp(username, ctx.bot.http_session),
+            lambda data: self.veltpvp_embed(username, data),
+        )
+        if not embed:
             await ctx.send(
                 f"`{username}` has not logged onto VeltPVP or their status is not available."
             )
             return
+        embed.timestamp = ctx.message.created_at
+        await ctx.send(embed=embed)
+
+    @staticmethod
+    def veltpvp_embed(username: str, data: dict) -> discord.Embed:
         embed = discord.Embed(color=0x2E39A7)
         embed.set_author(
             name=f"VeltPVP information for {username}",
             url=f"https://www.veltpvp.com/u/{username}",
             icon_url="https://www.veltpvp.com/resources/images/nav-logo.png",
         )
-        embed.set_thumbnail(
-            url=f"https://visage.surgeplay.com/bust/{await usernameToUUID(username, ctx.bot.http_session)}"
-        )
-        embed.timestamp = ctx.message.created_at
         embed.add_field(
             name=("VeltPVP Stats"),
             value=(
@@ -167,148 +243,125 @@ class servers(commands.Cog):
                 f"Kills: `{data['game_stats'][0]['HCF']['Kills']}`\nDeaths: `{data['game_stats'][0]['HCF']['Deaths']}`\nKDR: `{data['game_stats'][0]['HCF']['KDR']}`"
             ),
         )
-        await ctx.send(embed=embed)
+        return embed
 
     @commands.command()
     @commands.cooldown(rate=1, per=5.0, type=commands.BucketType.user)
     async def blocksmc(self, ctx: commands.Context, username: str):
         """Get statistics of a player on blocksmc."""
         await ctx.trigger_typing()
-        if await self.bot.redis_session.exists(f"blocksmc_{username}"):
-            data = json.loads(await self.bot.redis_session.get(f"blocksmc_{username}"))
-        else:
-            data = await blocksmc(username, ctx.bot.http_session)
-            self.bot.redis_session.set(
-                f"blocksmc_{username}", json.dumps(data), expire=28800
-            )
-        if not data:
+        embed = await self.player_embed(
+            f"blocksmc_{username}",
+            username,
+            lambda: blocksmc(username, ctx.bot.http_session),
+            lambda data: self.blocksmc_embed(username, data),
+        )
+        if not embed:
             await ctx.send(
                 f"`{username}` has not logged onto BlocksMC or their status is not available."
             )
             return
+        embed.timestamp = ctx.message.created_at
+        await ctx.send(embed=embed)
+
+    @staticmethod
+    def blocksmc_embed(username: str, data: dict) -> discord.Embed:
         embed = discord.Embed(color=0x008CD3)
         embed.set_author(
             name=f"BlocksMC information for {username}",
             url=f"https://blocksmc.com/player/{username}",
             icon_url="https://blocksmc.com/templates3/src/logo-gray-sm.png",
         )
-        embed.set_thumbnail(
-            url=f"https://visage.surgeplay.com/bust/{await usernameToUUID(username, ctx.bot.http_session)}"
-        )
-        embed.timestamp = ctx.message.created_at
-        for game in data["game_stats"]:
-            value = ""
-            name = list(game)
-            name_new = name[0]
-            scores = game[name_new]
-            for key in scores.keys():
-                value += f"{key}: {scores[key]}\n"
-            embed.add_field(name=name_new, value=value)
-        await ctx.send(embed=embed)
+        add_game_stats(embed, data)
+        return embed
 
     @commands.command()
     @commands.cooldown(rate=1, per=5.0, type=commands.BucketType.user)
     async def universocraft(self, ctx: commands.Context, username: str):
         """Get statistics of a player on universocraft."""
         await ctx.trigger_typing()
-        if await self.bot.redis_session.exists(f"universocraft_{username}"):
-            data = json.loads(
-                await self.bot.redis_session.get(f"universocraft_{username}")
-            )
-        else:
-            data = await universocraft(username, ctx.bot.http_session)
-            self.bot.redis_session.set(
-                f"universocraft_{username}", json.dumps(data), expire=28800
-            )
-        if not data:
+        embed = await self.player_embed(
+            f"universocraft_{username}",
+            username,
+            lambda: universocraft(username, ctx.bot.http_session),
+            lambda data: self.universocraft_embed(username, data),
+        )
+        if not embed:
             await ctx.send(
                 f"`{username}` has not logged onto UniversoCraft or their status is not available."
             )
             return
+        embed.timestamp = ctx.message.created_at
+        await ctx.send(embed=embed)
+
+    @staticmethod
+    def universocraft_embed(username: str, data: dict) -> discord.Embed:
         embed = discord.Embed(color=0x82C228)
         embed.set_author(
             name=f"UniversoCraft information for {username}",
             url=f"https://www.universocraft.com/members/{username}",
             icon_url="https://www.universocraft.com/favicon.ico",
         )
-        embed.set_thumbnail(
-            url=f"https://visage.surgeplay.com/bust/{await usernameToUUID(username, ctx.bot.http_session)}"
-        )
-        embed.timestamp = ctx.message.created_at
-        for game in data["game_stats"]:
-            value = ""
-            name = list(game)
-            name_new = name[0]
-            scores = game[name_new]
-            for key in scores.keys():
-                value += f"{key}: {scores[key]}\n"
-            embed.add_field(name=name_new, value=value)
-        await ctx.send(embed=embed)
+        add_game_stats(embed, data)
+        return embed
 
     @commands.command()
     @commands.cooldown(rate=1, per=5.0, type=commands.BucketType.user)
     async def minesaga(self, ctx: commands.Context, username: str):
         """Get statistics of a player on minesaga."""
         await ctx.trigger_typing()
-        if await self.bot.redis_session.exists(f"minesaga_{username}"):
-            data = json.loads(await self.bot.redis_session.get(f"minesaga_{username}"))
-        else:
-            data = await minesaga(username, ctx.bot.http_session)
-            self.bot.redis_session.set(
-                f"minesaga_{username}", json.dumps(data), expire=28800
-            )
-        if not data:
+        embed = await self.player_embed(
+            f"minesaga_{username}",
+            username,
+            lambda: minesaga(username, ctx.bot.http_session),
+            lambda data: self.minesaga_embed(username, data),
+        )
+        if not embed:
             await ctx.send(
                 f"`{username}` has not logged onto Minesaga or their status is not available."
             )
             return
+        embed.timestamp = ctx.message.created_at
+        await ctx.send(embed=embed)
+
+    @staticmethod
+    def minesaga_embed(username: str, data: dict) -> discord.Embed:
         embed = discord.Embed(color=0x6696C2)
         embed.set_author(
             name=f"Minesaga information for {username}",
             url=f"https://www.minesaga.org/members/{username}",
             icon_url="https://www.minesaga.org/favicon.ico",
         )
-        embed.set_thumbnail(
-            url=f"https://visage.surgeplay.com/bust/{await usernameToUUID(username, ctx.bot.http_session)}"
-        )
-        embed.timestamp = ctx.message.created_at
-        for game in data["game_stats"]:
-            value = ""
-            name = list(game)
-            name_new = name[0]
-            scores = game[name_new]
-            for key in scores.keys():
-                value += f"{key}: {scores[key]}\n"
-            embed.add_field(name=name_new, value=value)
-        await ctx.send(embed=embed)
+        add_game_stats(embed, data)
+        return embed
 
     @commands.command()
     @commands.cooldown(rate=1, per=5.0, type=commands.BucketType.user)
     async def manacube(self, ctx: commands.Context, username: str):
         """Get statistics of a player on manacube."""
         await ctx.trigger_typing()
-        if await self.bot.redis_session.exists(f"manacube_{username}"):
-            data = json.loads(await self.bot.redis_session.get(f"manacube_{username}"))
-        else:
-            data = await manacube(username, ctx.bot.http_session)
-            self.bot.redis_session.set(
-                f"manacube_{username}", json.dumps(data), expire=28800
-            )
-        if not data:
+        embed = await self.player_embed(
+            f"manacube_{username}",
+            username,
+            lambda: manacube(username, ctx.bot.http_session),
+            lambda data: self.manacube_embed(username, data),
+        )
+        if not embed:
             await ctx.send(
                 f"`{username}` has not logged onto Minesaga or their status is not available."
             )
             return
+        embed.timestamp = ctx.message.created_at
+        await ctx.send(embed=embed)
+
+    @staticmethod
+    def manacube_embed(username: str, data: dict) -> discord.Embed:
         embed = discord.Embed(color=0x11B7C4)
         embed.set_author(
             name=f"Manacube information for {username}",
             url=f"https://manacube.com/stats/player/{username}/",
             icon_url="https://manacube.com/styles/ndzn/manacube/img/logo-cube.png",
         )
-        embed.set_thumbnail(
-            url=f"https://visage.surgeplay.com/bust/{await usernameToUUID(username, ctx.bot.http_session)}"
-        )
-        embed.timestamp = ctx.message.created_at
         embed.add_field(
             name=("Manacube Stats"),
             value=(
@@ -370,75 +423,73 @@ class servers(commands.Cog):
                 f"Playtime: `{data['kitpvp']['playtime']}`\nLevel: `{data['kitpvp']['level']}`\nMoney: `{data['kitpvp']['money']}`\nKills: `{data['kitpvp']['kills']}`"
             ),
         )
-        await ctx.send(embed=embed)
+        return embed
 
     @commands.command()
     @commands.cooldown(rate=1, per=5.0, type=commands.BucketType.user)
     async def hiverank(self, ctx: commands.Context, username: str):
         """View the rank of a player on hiverank."""
         await ctx.trigger_typing()
-        if await self.bot.redis_session.exists(f"hiveMCRank_{username}"):
-            data = json.loads(
-                await self.bot.redis_session.get(f"hiveMCRank_{username}")
-            )
-        else:
-            data = await hiveMCRank(username, ctx.bot.http_session)
-            self.bot.redis_session.set(
-                f"hiveMCRank_{username}", json.dumps(data), expire=28800
-            )
-        if not data:
+        embed = await self.player_embed(
+            f"hivemc_player_{username}",
+            username,
+            lambda: hiveMCPlayer(username, ctx.bot.http_session),
+            lambda player: self.hiverank_embed(username, hiveMCRank(player)),
+            embed_key=f"embed_hiverank_{username}",
+        )
+        if not embed:
             await ctx.send(
                 f"`{username}` has not logged onto Hive or there are no ranks available."
             )
             return
+        embed.timestamp = ctx.message.created_at
+        await ctx.send(embed=embed)
+
+    @staticmethod
+    def hiverank_embed(username: str, data: dict) -> discord.Embed:
         embed = discord.Embed(color=0xFFAF03)
         embed.set_author(
             name=f"Hive rank for {username}",
             url=f"https://www.hivemc.com/player/{username}",
             icon_url="https://www.hivemc.com/img/white-logo.png",
         )
-        embed.set_thumbnail(
-            url=f"https://visage.surgeplay.com/bust/{await usernameToUUID(username, ctx.bot.http_session)}"
-        )
-        embed.timestamp = ctx.message.created_at
         embed.add_field(name="rank", value=(f"Rank: `{data['rank'][0]}`"))
-        await ctx.send(embed=embed)
+        return embed
 
     @commands.command()
     @commands.cooldown(rate=1, per=5.0, type=commands.BucketType.user)
     async def hivestatus(self, ctx: commands.Context, username: str):
         """View the status of a player on hive"""
         await ctx.trigger_typing()
-        if await self.bot.redis_session.exists(f"hiveMCStatus_{username}"):
-            data = json.loads(
-                await self.bot.redis_session.get(f"hiveMCStatus_{username}")
-            )
-        else:
-            data = await hiveMCStatus(username, ctx.bot.http_session)
-            self.bot.redis_session.set(
-                f"hiveMCStatus_{username}", json.dumps(data), expire=28800
-            )
-        if not data:
+        embed = await self.player_embed(
+            f"hivemc_player_{username}",
+            username,
+            lambda: hiveMCPlayer(username, ctx.bot.http_session),
+            lambda player: self.hivestatus_embed(username, hiveMCStatus(player)),
+            embed_key=f"embed_hivestatus_{username}",
+        )
+        if not embed:
             await ctx.send(
                 f"`{username}` has not logged onto Hive or their status is not available."
             )
             return
+        embed.timestamp = ctx.message.created_at
+        await ctx.send(embed=embed)
+
+    @staticmethod
+    def hivestatus_embed(username: str, data: dict) -> discord.Embed:
         embed = discord.Embed(color=0xFFAF03)
         embed.set_author(
             name=f"Hive Status for {username}",
             url=f"https://www.hivemc.com/player/{username}",
             icon_url="https://www.hivemc.com/img/white-logo.png",
         )
-        embed.set_thumbnail(
-            url=f"https://visage.surgeplay.com/bust/{await usernameToUUID(username, ctx.bot.http_session)}"
-        )
-        embed.timestamp = ctx.message.created_at
         embed.add_field(
             name="description",
             value=(f"Description: `{data['status'][0]['description']}`"),
         )
         embed.add_field(name="game", value=(f"Game: `{data['status'][0]['game']}`"))
-        await ctx.send(embed=embed)
+        return embed
 
     @commands.command()
     @commands.cooldown(rate=1, per=5.0, type=commands.BucketType.user)
@@ -447,58 +498,42 @@ class servers(commands.Cog):
         await ctx.trigger_typing()
 
         if game.lower() in hive_con:
-            if await self.bot.redis_session.exists(
-                f"hiveMCGameStats_{hive_con[game.lower()]}_{username}"
-            ):
-                data = json.loads(
-                    await self.bot.redis_session.get(
-                        f"hiveMCGameStats_{hive_con[game.lower()]}_{username}"
-                    )
-                )
-            else:
-                data = await hiveMCGameStats(
+            embed = await self.player_embed(
+                f"hiveMCGameStats_{hive_con[game.lower()]}_{username}",
+                username,
+                lambda: hiveMCGameStats(
                     username, hive_con[game.lower()], ctx.bot.http_session
-                )
-                self.bot.redis_session.set(
-                    f"hiveMCGameStats_{hive_con[game.lower()]}_{username}",
-                    json.dumps(data),
-                    expire=28800,
-                )
-            embed = discord.Embed(color=0xFFAF03)
-            embed.set_author(
-                name=f"Hive Stats for {username}",
-                url=f"https://www.hivemc.com/player/{username}",
-                icon_url="https://www.hivemc.com/img/white-logo.png",
-            )
-            embed.set_thumbnail(
-                url=f"https://visage.surgeplay.com/bust/{await usernameToUUID(username, ctx.bot.http_session)}"
+                ),
+                lambda data: self.hivestats_embed(username, game, data),
             )
-            embed.timestamp = ctx.message.created_at
-            if not data:
+            if not embed:
                 await ctx.send("No stats found")
                 return
-            del data["stats"][0]["UUID"]
-            if "cached" in data["stats"][0]:
-                del data["stats"][0]["cached"]
-            if "firstLogin" in data["stats"][0]:
-                del data["stats"][0]["firstLogin"]
-            if "lastLogin" in data["stats"][0]:
-                del data["stats"][0]["lastLogin"]
-            if "achievements" in data["stats"][0]:
-                del data["stats"][0]["achievements"]
-            if "title" in data["stats"][0]:
-                del data["stats"][0]["title"]
-            value = ""
-            for stat in data["stats"][0]:
-                if isinstance(data["stats"][0][stat], list) or isinstance(
-                    data["stats"][0][stat], dict
-                ):
-                    pass
-                else:
-                    value += f"`{stat}`: {data['stats'][0][stat]}\n"
-            embed.add_field(
-                name=f"{game.replace('_', ' ').upper()} Stats", value=value,
-            )
+            embed.timestamp = ctx.message.created_at
             await ctx.send(embed=embed)
         else:
             await ctx.send("Sorry that game was not recognized as a Hive game")
+
+    @staticmethod
+    def hivestats_embed(username: str, game: str, data: dict) -> discord.Embed:
+        embed = discord.Embed(color=0xFFAF03)
+        embed.set_author(
+            name=f"Hive Stats for {username}",
+            url=f"https://www.hivemc.com/player/{username}",
+            icon_url="https://www.hivemc.com/img/white-logo.png",
+        )
+        # the cached stats are shared between callers so filter them, don't mutate
+        value = ""
+        for stat in data["stats"][0]:
+            if stat in hive_hidden_stats:
+                continue
+            if isinstance(data["stats"][0][stat], list) or isinstance(
+                data["stats"][0][stat], dict
+            ):
+                pass
+            else:
+                value += f"`{stat}`: {data['stats'][0][stat]}\n"
+        embed.add_field(
+            name=f"{game.replace('_', ' ').upper()} Stats", value=value,
+        )
+        return embed
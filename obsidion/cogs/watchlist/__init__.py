@@ -0,0 +1,5 @@
+from .watchlist import watchlist
+
+
+def setup(bot):
+    bot.add_cog(watchlist(bot))
@@ -0,0 +1,285 @@
+"""
+Per guild watchlists of Minecraft servers.
+
+Every watched address is polled by a single scheduler task, however many guilds
+watch it: the addresses sit in a heap ordered by when they are next due, and the
+scheduler pings the due ones (a bounded number at a time), then pushes them
+back one jittered interval later. Guilds are only told about a server when it
+goes down or comes back up, and the last known state is kept in postgres so a
+restart doesn't announce every server again.
+"""
+
+import asyncio
+import heapq
+import logging
+import random
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import discord
+from discord.ext import commands
+
+from obsidion import constants
+from obsidion.bot import Obsidion
+from obsidion.utils.ping import java_status
+from obsidion.utils.utils import log_task_errors
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS watchlist (
+    guild_id BIGINT NOT NULL,
+    channel_id BIGINT NOT NULL,
+    address TEXT NOT NULL,
+    online BOOLEAN,
+    PRIMARY KEY (guild_id, address)
+);
+-- every poll updates the rows of an address
+CREATE INDEX IF NOT EXISTS watchlist_address ON watchlist (address);
+"""
+
+MAX_PORT = 65535
+
+# dot separated labels of letters, digits and inner hyphens, which covers IPv4 too
+HOSTNAME = re.compile(
+    r"^(?=.{1,253}$)[a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?(\.[a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?)*$"
+)
+
+
+def normalise(address: str) -> str:
+    """Lowercase an address and drop the default port, so duplicates match."""
+    address = address.lower().strip()
+    if address.endswith(":25565"):
+        address = address[: -len(":25565")]
+    return address
+
+
+def valid_address(address: str) -> bool:
+    """Whether a normalised address is a hostname with an optional valid port."""
+    host, colon, port = address.partition(":")
+    if colon and not (port.isdigit() and 0 < int(port) <= MAX_PORT):
+        return False
+    return bool(HOSTNAME.match(host))
+
+
+class watchlist(commands.Cog):
+    """Get told when a Minecraft server goes down or comes back up."""
+
+    def __init__(self, bot: Obsidion):
+        self.bot = bot
+        # address -> guild id -> channel id to post in
+        self.watchers: Dict[str, Dict[int, int]] = defaultdict(dict)
+        # address -> whether it was online when last pinged, None if unknown
+        self.online: Dict[str, Optional[bool]] = {}
+        # address -> consecutive failed pings
+        self.failures: Dict[str, int] = defaultdict(int)
+        # (due time, address), one entry per watched address
+        self._schedule: List[Tuple[float, str]] = []
+        self._scheduled = set()
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(constants.Watchlist.concurrency)
+        self._task = bot.loop.create_task(self.run())
+        self._task.add_done_callback(log_task_errors)
+
+    def cog_unload(self) -> None:
+        """Stop polling the watched servers on cog unload."""
+        self._task.cancel()
+
+    async def run(self) -> None:
+        await self.bot.db_ready.wait()
+        async with self.bot.db_pool.acquire() as conn:
+            await conn.execute(SCHEMA)
+            rows = await conn.fetch(
+                "SELECT guild_id, channel_id, address, online FROM watchlist"
+            )
+        for row in rows:
+            # every cluster polls the servers watched by the guilds it runs
+            if not self.bot.owns_guild(row["guild_id"]):
+                continue
+            self.watchers[row["address"]][row["guild_id"]] = row["channel_id"]
+            self.online[row["address"]] = row["online"]
+        # spread the first round of pings over an interval, not all at startup
+        for address in self.watchers:
+            self.schedule(address, random.uniform(0, constants.Watchlist.interval))
+        log.info(f"Watching {len(self.watchers)} servers.")
+
+        loop = asyncio.get_event_loop()
+        while True:
+            if not self._schedule:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            due, address = self._schedule[0]
+            delay = due - loop.time()
+            if delay > 0:
+                # a newly watched server may be due before the current head
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            heapq.heappop(self._schedule)
+            self._scheduled.discard(address)
+            if address not in self.watchers:
+                continue
+            await self._semaphore.acquire()
+            asyncio.ensure_future(self.check(address))
+
+    def schedule(self, address: str, delay: float) -> None:
+        """Ping `address` in `delay` seconds, unless it already is scheduled."""
+        if address in self._scheduled:
+            return
+        due = asyncio.get_event_loop().time() + delay
+        heapq.heappush(self._schedule, (due, address))
+        self._scheduled.add(address)
+        if self._schedule[0][1] == address:
+            self._wakeup.set()
+
+    async def check(self, address: str) -> None:
+        try:
+            host, _, port = address.partition(":")
+            online = bool(await java_status(host, port or None))
+            await self.update(address, online)
+        except Exception:
+            log.exception(f"Could not check the watched server {address}.")
+        finally:
+            self._semaphore.release()
+            if address in self.watchers:
+                jitter = constants.Watchlist.jitter
+                self.schedule(
+                    address,
+                    constants.Watchlist.interval
+                    * random.uniform(1 - jitter, 1 + jitter),
+                )
+
+    async def update(self, address: str, online: bool) -> None:
+        """Record the state of a server, notifying its watchers if it changed."""
+        if online:
+            self.failures.pop(address, None)
+        else:
+            # a single lost ping doesn't mean the server is down
+            self.failures[address] += 1
+            if self.failures[address] < constants.Watchlist.down_after:
+                return
+
+        previous = self.online.get(address)
+        if previous == online:
+            return
+        self.online[address] = online
+        async with self.bot.db_pool.acquire() as conn:
+            await conn.execute(
+                "UPDATE watchlist SET online = $2 WHERE address = $1", address, online
+            )
+        if previous is None:
+            # first time this server is seen, there is no change to announce
+            return
+
+        if online:
+            embed = discord.Embed(
+                description=f":white_check_mark: `{address}` is back online.",
+                color=0x00FF00,
+            )
+        else:
+            embed = discord.Embed(
+                description=f":x: `{address}` has gone offline.", color=0xFF0000
+            )
+        for channel_id in list(self.watchers.get(address, {}).values()):
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                continue
+            try:
+                await channel.send(embed=embed)
+            except discord.HTTPException:
+                log.info(f"Could not notify channel {channel_id} about {address}.")
+
+    @commands.group(invoke_without_command=True)
+    @commands.guild_only()
+    async def watchlist(self, ctx: commands.Context):
+        """List the Minecraft servers this server is watching."""
+        watched = sorted(
+            address
+            for address, guilds in self.watchers.items()
+            if ctx.guild.id in guilds
+        )
+        if not watched:
+            await ctx.send(
+                f"This server isn't watching any Minecraft servers, add one with `{ctx.prefix}watchlist add <address>`."
+            )
+            return
+        states = {True: ":white_check_mark:", False: ":x:", None: ":grey_question:"}
+        embed = discord.Embed(title="Watched Servers", color=0x00FF00)
+        embed.description = "\n".join(
+            f"{states[self.online.get(address)]} `{address}` in <#{self.watchers[address][ctx.guild.id]}>"
+            for address in watched
+        )
+        await ctx.send(embed=embed)
+
+    @watchlist.command(name="add")
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def watchlist_add(
+        self,
+        ctx: commands.Context,
+        address: str,
+        channel: discord.TextChannel = None,
+    ):
+        """Post in a channel when a Minecraft server goes down or comes back up."""
+        address = normalise(address)
+        if not valid_address(address):
+            await ctx.send(f":x: `{address}` is not a valid server address.")
+            return
+        channel = channel or ctx.channel
+        watched = sum(1 for guilds in self.watchers.values() if ctx.guild.id in guilds)
+        if (
+            ctx.guild.id not in self.watchers.get(address, {})
+            and watched >= constants.Watchlist.max_per_guild
+        ):
+            await ctx.send(
+                f"Sorry, a server can only watch up to {constants.Watchlist.max_per_guild} Minecraft servers."
+            )
+            return
+
+        async with self.bot.db_pool.acquire() as conn:
+            await conn.execute(
+                """
+                INSERT INTO watchlist (guild_id, channel_id, address, online)
+                VALUES ($1, $2, $3, $4)
+                ON CONFLICT (guild_id, address) DO UPDATE SET channel_id = $2
+                """,
+                ctx.guild.id,
+                channel.id,
+                address,
+                self.online.get(address),
+            )
+        self.watchers[address][ctx.guild.id] = channel.id
+        self.schedule(address, 0)
+        await ctx.send(
+            f":white_check_mark: Watching `{address}`, changes will be posted in {channel.mention}."
+        )
+
+    @watchlist.command(name="remove")
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def watchlist_remove(self, ctx: commands.Context, address: str):
+        """Stop watching a Minecraft server."""
+        address = normalise(address)
+        if ctx.guild.id not in self.watchers.get(address, {}):
+            await ctx.send(f"This server isn't watching `{address}`.")
+            return
+
+        async with self.bot.db_pool.acquire() as conn:
+            await conn.execute(
+                "DELETE FROM watchlist WHERE guild_id = $1 AND address = $2",
+                ctx.guild.id,
+                address,
+            )
+        del self.watchers[address][ctx.guild.id]
+        if not self.watchers[address]:
+            # its schedule entry is dropped when it comes up
+            del self.watchers[address]
+            self.online.pop(address, None)
+            self.failures.pop(address, None)
+        await ctx.send(f":white_check_mark: No longer watching `{address}`.")
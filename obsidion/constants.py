@@ -214,6 +214,11 @@ class Database(metaclass=YAMLGetter):
     password: str
     database: str
     port: int
+    min_size: int
+    max_size: int
+    max_idle_lifetime: float
+    connect_retries: int
+    connect_backoff: float
 
 
 class Redis(metaclass=YAMLGetter):
@@ -223,14 +228,102 @@ class Redis(metaclass=YAMLGetter):
     host: str
     port: int
     password: Optional[str]
+    min_size: int
+    max_size: int
+    connect_retries: int
+    connect_backoff: float
+    reconnect_interval: int
+
+
+class Cache(metaclass=YAMLGetter):
+    section = "cache"
+
+    local_enabled: bool
+    local_max_entries: int
+    local_max_bytes: int
+    local_ttl: int
+    negative_ttl: int
+    lock_timeout: int
+    lock_poll_interval: float
+    invalidation_channel: str
+
+
+class Mojang(metaclass=YAMLGetter):
+    section = "mojang"
+
+    batch_size: int
+    batch_delay: float
+    ttl: int
+
+
+class HTTP(metaclass=YAMLGetter):
+    section = "http"
+
+    connector: dict
+    retry_after: float
+    backoff_base: float
+    backoff_max: float
+    default_host: dict
+    hosts: dict
+
+
+class Scraping(metaclass=YAMLGetter):
+    section = "scraping"
+
+    parser_workers: int
+
+
+class Ping(metaclass=YAMLGetter):
+    section = "ping"
+
+    timeout: float
+    retries: int
+    bulk_limit: int
+    bulk_concurrency: int
+
+
+class Cluster(metaclass=YAMLGetter):
+    section = "cluster"
+
+    clusters: int
+    shard_count: Optional[int]
+    stats_interval: int
+    ready_timeout: int
+
+
+class Watchlist(metaclass=YAMLGetter):
+    section = "watchlist"
+
+    interval: int
+    jitter: float
+    concurrency: int
+    down_after: int
+    max_per_guild: int
 
 
 class Stats(metaclass=YAMLGetter):
     section = "stats"
 
     enabled: bool
+    backend: str
     presence_update_timeout: int
     statsd_host: str
+    statsd_port: int
+    prefix: str
+    max_packet_size: int
+    flush_interval: float
+    gauge_interval: int
+    prometheus_host: str
+    prometheus_port: int
+
+
+class Watchdog(metaclass=YAMLGetter):
+    section = "watchdog"
+
+    enabled: bool
+    interval: float
+    threshold: float
+    asyncio_debug: bool
 
 
 # Paths
@@ -70,6 +70,19 @@ class development(commands.Cog):
         """shutdown the bot"""
         self.bot._recreate()
 
+    @commands.command(hidden=True)
+    async def rollingrestart(self, ctx: commands.Context):
+        """restart every cluster, one at a time"""
+        if self.bot.cluster is None:
+            await ctx.send(
+                f"{ctx.message.author.mention}, :x: The bot is not running in clusters"
+            )
+            return
+        self.bot.cluster.rolling_restart()
+        await ctx.send(
+            f"{ctx.message.author.mention}, :white_check_mark: Restarting every cluster"
+        )
+
 
 def setup(bot) -> None:
     """Load the Utils cog."""
@@ -5,6 +5,7 @@ from discord.ext.commands import Cog, Context, errors
 import discord
 
 from obsidion import constants
+from obsidion.utils.http import UpstreamUnavailable
 
 log = logging.getLogger(__name__)
 
@@ -43,6 +44,13 @@ class ErrorHandler(Cog):
             await ctx.send(
                 f"This command is on cooldown, please retry in {e.retry_after:.2f}s"
             )
+        elif isinstance(e, errors.CommandInvokeError) and isinstance(
+            e.original, UpstreamUnavailable
+        ):
+            await ctx.send(
+                f"Sorry, `{e.original.host}` is not responding right now, please try again later."
+            )
+            self.bot.stats.incr("errors.upstream_unavailable")
         elif isinstance(e, errors.CommandInvokeError):
             await self.handle_unexpected_error(ctx, e.original)
         elif not isinstance(e, errors.DisabledCommand):
@@ -5,7 +5,6 @@ from discord.ext import commands
 from discord.ext.commands import Command
 from obsidion import constants
 from obsidion.bot import Obsidion
-from fuzzywuzzy import fuzz, process
 
 log = logging.getLogger(__name__)
 
@@ -94,6 +93,9 @@ class MyHelpCommand(commands.HelpCommand):
         Handles when a query does not match a valid command, group, cog or category.
         Will return an instance of the `HelpQueryNotFound` exception with the error message and possible matches.
         """
+        # fuzzywuzzy is only imported when a query doesn't match
+        from fuzzywuzzy import fuzz, process
+
         choices = await self.get_all_help_choices()
         result = process.extractBests(
             string, choices, scorer=fuzz.ratio, score_cutoff=60
@@ -1,6 +1,18 @@
+import math
+
+from discord.ext import tasks
 from discord.ext.commands import Cog, Context
 
+from obsidion import constants
 from obsidion.bot import Obsidion
+from obsidion.utils.context import Context as TimedContext
+from obsidion.utils.http import CircuitBreaker
+
+BREAKER_STATES = {
+    CircuitBreaker.CLOSED: 0,
+    CircuitBreaker.HALF_OPEN: 1,
+    CircuitBreaker.OPEN: 2,
+}
 
 
 class Stats(Cog):
@@ -8,13 +20,83 @@ class Stats(Cog):
 
     def __init__(self, bot: Obsidion):
         self.bot = bot
+        self.report_gauges.start()
+
+    def cog_unload(self) -> None:
+        """Stop reporting gauges on cog unload."""
+        self.report_gauges.cancel()
 
     @Cog.listener()
     async def on_command_completion(self, ctx: Context) -> None:
-        """Report completed commands to statsd."""
+        """Report completed commands, and how long each of their phases took, to statsd."""
         command_name = ctx.command.qualified_name.replace(" ", "_")
 
         self.bot.stats.incr(f"commands.{command_name}")
+        if isinstance(ctx, TimedContext) and ctx.completed_at is not None:
+            for phase, seconds in ctx.timings().items():
+                self.bot.stats.timing(
+                    f"commands.{command_name}.{phase}", seconds * 1000
+                )
+
+    @tasks.loop(seconds=constants.Stats.gauge_interval)
+    async def report_gauges(self) -> None:
+        """Report the state of the caches, upstream hosts, pools and shards."""
+        stats = self.bot.stats
+
+        cache = self.bot.cache
+        for namespace in set(cache.stats.hits) | set(cache.stats.misses):
+            stats.gauge(
+                f"cache.{namespace}.hit_ratio",
+                round(cache.stats.hit_ratio(namespace), 4),
+            )
+        stats.gauge("cache.hit_ratio", round(cache.stats.hit_ratio(), 4))
+        stats.gauge("cache.local.entries", len(cache.local))
+        stats.gauge("cache.local.bytes", cache.local.size)
+        stats.gauge("cache.local.evictions", cache.local.evictions)
+
+        for host, limiter in self.bot.rate_limiter.limiters.items():
+            host = host.replace(".", "_")
+            stats.gauge(f"http.{host}.waiting", limiter.waiting)
+            stats.gauge(f"http.{host}.in_flight", limiter.in_flight)
+            stats.gauge(f"http.{host}.rate_limited", limiter.rate_limited)
+            # total seconds requests have waited on the limiter, its rate is the wait
+            stats.gauge(f"http.{host}.wait_seconds", round(limiter.wait_time, 3))
+        for host, breaker in self.bot.circuit_breakers.breakers.items():
+            host = host.replace(".", "_")
+            stats.gauge(f"http.{host}.breaker", BREAKER_STATES[breaker.state])
+            stats.gauge(f"http.{host}.breaker_trips", breaker.trips)
+            stats.gauge(f"http.{host}.breaker_rejected", breaker.rejected)
+
+        stats.gauge("pools.postgres.up", int(self.bot.db_pool is not None))
+        stats.gauge("pools.redis.up", int(self.bot.cache.available))
+        if self.bot.db_pool is not None:
+            # asyncpg 0.22 has no public api for the usage of its pool
+            pool = self.bot.db_pool
+            stats.gauge("pools.postgres.max", pool._maxsize)
+            stats.gauge(
+                "pools.postgres.size",
+                sum(1 for holder in pool._holders if holder._con is not None),
+            )
+            stats.gauge("pools.postgres.in_use", pool._maxsize - pool._queue.qsize())
+        if self.bot.cache.available:
+            pool = self.bot.redis_session.connection
+            stats.gauge("pools.redis.max", pool.maxsize)
+            stats.gauge("pools.redis.size", pool.size)
+            stats.gauge("pools.redis.in_use", pool.size - pool.freesize)
+
+        for shard_id, latency in self.bot.latencies:
+            # shards which haven't connected yet have no latency
+            if math.isfinite(latency):
+                stats.gauge(f"shards.{shard_id}.latency", round(latency * 1000))
+
+    @report_gauges.before_loop
+    async def before_report_gauges(self) -> None:
+        await self.bot.wait_until_ready()
+        # the extensions are loaded before the stats client can send anything
+        for name, (imported, setup) in self.bot.extension_timings.items():
+            name = name.replace(".", "_")
+            self.bot.stats.timing(f"startup.{name}.import", imported * 1000)
+            self.bot.stats.timing(f"startup.{name}.setup", setup * 1000)
 
 
 def setup(bot: Obsidion) -> None:
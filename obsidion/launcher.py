@@ -0,0 +1,454 @@
+"""
+Cluster launcher.
+
+With `cluster.clusters` above 1 the shards are split into contiguous ranges,
+each run by its own worker process (a cluster) so they no longer share one
+event loop and one core. A supervisor process spawns the clusters and restarts
+them: a cluster exiting with `ExitCodes.RESTART` (or crashing) is started
+again, and a rolling restart restarts the clusters one at a time, waiting for
+each to be ready again before moving on to the next one.
+
+The supervisor is also the hub of the IPC between clusters. Every cluster
+reports its stats over a pipe, and the supervisor sends the stats of every
+cluster back to all of them, so each cluster knows the totals (e.g. the guild
+count posted to the bot lists) without asking the others.
+"""
+
+import asyncio
+import importlib
+import json
+import logging
+import multiprocessing
+import signal
+import time
+import urllib.request
+from collections import deque
+from multiprocessing.connection import Connection, wait
+from typing import Dict, List, Optional
+
+import discord
+
+from obsidion import _update_event_loop_policy, constants
+from obsidion.bot import ExitCodes, Obsidion, guild_prefix
+
+log = logging.getLogger(__name__)
+
+__all__ = ["ClusterClient", "Supervisor", "create_bot", "run_clusters"]
+
+EXTENSIONS = [
+    # core cogs
+    "obsidion.core.stats",
+    "obsidion.core.development",
+    "obsidion.core.help",
+    "obsidion.core.error_handler",
+    # extensions and main features
+    "obsidion.cogs.fun",
+    "obsidion.cogs.hypixel",
+    "obsidion.cogs.images",
+    "obsidion.cogs.info",
+    "obsidion.cogs.misc",
+    # "obsidion.cogs.rcon",
+    "obsidion.cogs.redstone",
+    "obsidion.cogs.servers",
+    "obsidion.cogs.events",
+    "obsidion.cogs.config",
+    "obsidion.cogs.watchlist",
+    # "obsidion.cogs.minecraft",
+]
+
+
+def load_extension(bot: Obsidion, name: str) -> None:
+    """Load an extension, timing its import and its setup separately."""
+    start = time.perf_counter()
+    # load_extension runs the extension's package again, but everything the
+    # package imports is already imported by then
+    importlib.import_module(name)
+    imported = time.perf_counter()
+    bot.load_extension(name)
+    done = time.perf_counter()
+    bot.extension_timings[name] = (imported - start, done - imported)
+    log.info(
+        f"Loaded {name} in {(done - start) * 1000:.0f}ms "
+        f"({(imported - start) * 1000:.0f}ms importing it)."
+    )
+
+
+def create_bot(cluster_id: int = 0, **kwargs) -> Obsidion:
+    """Create the bot and load its extensions.
+
+    Args:
+        cluster_id (int, optional): cluster the bot runs in. Defaults to 0.
+        **kwargs: passed on to `Obsidion`, e.g. the shards to run
+
+    Returns:
+        Obsidion: the bot, ready to be run
+    """
+    # set activity
+    activity = discord.Activity(
+        name=constants.Bot.status,
+        type=discord.ActivityType.watching,
+    )
+
+    intents = discord.Intents.none()
+    intents.messages = True
+    intents.guilds = True
+
+    # no command reads cached messages or members, so cache neither: without the
+    # members intent discord only sends the members of a guild on request anyway
+    member_cache_flags = discord.MemberCacheFlags.none()
+
+    mentions = discord.AllowedMentions(
+        everyone=False,
+    )
+
+    bot = Obsidion(
+        case_insensitive=True,
+        activity=activity,
+        command_prefix=guild_prefix,
+        allowed_mentions=mentions,
+        intents=intents,
+        member_cache_flags=member_cache_flags,
+        max_messages=None,
+        chunk_guilds_at_startup=False,
+        cluster_id=cluster_id,
+        **kwargs,
+    )
+
+    # Load all required cogs
+    start = time.perf_counter()
+    for name in EXTENSIONS:
+        load_extension(bot, name)
+
+    # the guild count is the total of every cluster, so only the first posts it
+    if constants.Discord_bot_list.voting_enabled and cluster_id == 0:
+        load_extension(bot, "obsidion.cogs.botlist")
+    log.info(
+        f"Loaded {len(bot.extensions)} extensions in "
+        f"{(time.perf_counter() - start) * 1000:.0f}ms."
+    )
+
+    return bot
+
+
+def recommended_shards() -> int:
+    """Ask discord how many shards the bot should run."""
+    request = urllib.request.Request(
+        "https://discord.com/api/v8/gateway/bot",
+        headers={
+            "Authorization": f"Bot {constants.Bot.discord_token}",
+            "User-Agent": "Obsidion (https://github.com/Darkflame72/Obsidion)",
+        },
+    )
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.load(response)["shards"]
+
+
+def shard_ranges(shard_count: int, clusters: int) -> List[List[int]]:
+    """Split the shards into `clusters` contiguous ranges of (nearly) equal size."""
+    size, extra = divmod(shard_count, clusters)
+    ranges, start = [], 0
+    for cluster in range(clusters):
+        end = start + size + (cluster < extra)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+class ClusterClient:
+    """A cluster's end of the IPC pipe to the supervisor, available as `bot.cluster`.
+
+    Args:
+        bot (Obsidion): the bot of this cluster
+        cluster_id (int): id of this cluster
+        conn (Connection): pipe to the supervisor
+    """
+
+    def __init__(self, bot: Obsidion, cluster_id: int, conn: Connection):
+        self.bot = bot
+        self.id = cluster_id
+        self.conn = conn
+        # cluster id -> the last stats it reported
+        self.clusters: Dict[int, dict] = {}
+
+        bot.loop.add_reader(conn.fileno(), self._receive)
+        bot.add_listener(self.on_ready)
+        bot.loop.create_task(self.report())
+
+    @property
+    def guild_count(self) -> int:
+        """Number of guilds across every cluster."""
+        others = sum(
+            stats["guilds"]
+            for cluster_id, stats in self.clusters.items()
+            if cluster_id != self.id
+        )
+        return others + len(self.bot.guilds)
+
+    def send(self, op: str, **data) -> None:
+        try:
+            self.conn.send({"op": op, "cluster": self.id, **data})
+        except (BrokenPipeError, OSError):
+            log.warning("Lost the connection to the cluster supervisor.")
+
+    def stats(self) -> dict:
+        return {
+            "guilds": len(self.bot.guilds),
+            "shards": len(self.bot.shards),
+            "latency": self.bot.latency,
+        }
+
+    def rolling_restart(self) -> None:
+        """Ask the supervisor to restart every cluster, one at a time."""
+        self.send("rolling_restart")
+
+    async def on_ready(self) -> None:
+        self.send("ready", **self.stats())
+
+    async def report(self) -> None:
+        while not self.bot.is_closed():
+            await asyncio.sleep(constants.Cluster.stats_interval)
+            if self.bot.is_ready():
+                self.send("stats", **self.stats())
+
+    def _receive(self) -> None:
+        try:
+            message = self.conn.recv()
+        except (EOFError, OSError):
+            # the supervisor is gone, don't keep running orphaned
+            log.error("The cluster supervisor went away, shutting down.")
+            self.bot.loop.remove_reader(self.conn.fileno())
+            self.bot.loop.create_task(self.bot.close())
+            return
+
+        if message["op"] == "clusters":
+            self.clusters = message["clusters"]
+        elif message["op"] == "shutdown":
+            log.info("Shutting down at the request of the cluster supervisor.")
+            self.bot.loop.create_task(self.bot.close())
+
+
+def run_cluster(
+    cluster_id: int, shard_ids: List[int], shard_count: int, conn: Connection
+) -> None:
+    """Entry point of a cluster process."""
+    _update_event_loop_policy()
+    # the supervisor handles ctrl+c, and tells the clusters to shut down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    bot = create_bot(
+        shard_ids=shard_ids, shard_count=shard_count, cluster_id=cluster_id
+    )
+    bot.cluster = ClusterClient(bot, cluster_id, conn)
+    log.info(f"Cluster {cluster_id} is starting shards {shard_ids[0]}-{shard_ids[-1]}.")
+    bot.run(constants.Bot.discord_token)
+
+
+class Cluster:
+    """The supervisor's view of a cluster process."""
+
+    def __init__(self, cluster_id: int, shard_ids: List[int]):
+        self.id = cluster_id
+        self.shard_ids = shard_ids
+        self.process: Optional[multiprocessing.Process] = None
+        self.conn: Optional[Connection] = None
+        self.stats: Optional[dict] = None
+        self.stopping = False
+        self.crashes = 0
+        self.started_at = 0.0
+
+
+class Supervisor:
+    """Spawn the clusters and restart them when they exit.
+
+    Args:
+        clusters (int): number of cluster processes
+        shard_count (int): total number of shards
+    """
+
+    def __init__(self, clusters: int, shard_count: int):
+        self.shard_count = shard_count
+        self.clusters = [
+            Cluster(cluster_id, shard_ids)
+            for cluster_id, shard_ids in enumerate(shard_ranges(shard_count, clusters))
+            if shard_ids
+        ]
+        self.context = multiprocessing.get_context("spawn")
+        self.shutting_down = False
+        # clusters still to be restarted by the running rolling restart
+        self.rolling: deque = deque()
+        self.rolling_current: Optional[Cluster] = None
+        self.rolling_deadline = 0.0
+        # (time, cluster) of crashed clusters waiting to be started again
+        self.pending: List[tuple] = []
+
+    def start(self, cluster: Cluster) -> None:
+        parent, child = self.context.Pipe()
+        cluster.process = self.context.Process(
+            target=run_cluster,
+            args=(cluster.id, cluster.shard_ids, self.shard_count, child),
+            name=f"obsidion-cluster-{cluster.id}",
+        )
+        cluster.process.start()
+        child.close()
+        cluster.conn = parent
+        cluster.stats = None
+        cluster.stopping = False
+        cluster.started_at = time.monotonic()
+        log.info(
+            f"Started cluster {cluster.id} (pid {cluster.process.pid}) with shards "
+            f"{cluster.shard_ids[0]}-{cluster.shard_ids[-1]}."
+        )
+
+    def stop(self, cluster: Cluster) -> None:
+        """Ask a cluster to shut down gracefully."""
+        cluster.stopping = True
+        self.send(cluster, {"op": "shutdown"})
+
+    def send(self, cluster: Cluster, message: dict) -> None:
+        if cluster.conn is None:
+            return
+        try:
+            cluster.conn.send(message)
+        except (BrokenPipeError, OSError):
+            pass
+
+    def broadcast_stats(self) -> None:
+        stats = {
+            cluster.id: cluster.stats for cluster in self.clusters if cluster.stats
+        }
+        for cluster in self.clusters:
+            self.send(cluster, {"op": "clusters", "clusters": stats})
+
+    def shutdown(self) -> None:
+        if self.shutting_down:
+            return
+        log.info("Shutting down every cluster.")
+        self.shutting_down = True
+        self.rolling.clear()
+        self.pending.clear()
+        for cluster in self.clusters:
+            if cluster.process and cluster.process.is_alive():
+                self.stop(cluster)
+
+    def rolling_restart(self) -> None:
+        if self.rolling or self.rolling_current or self.shutting_down:
+            return
+        log.info("Starting a rolling restart of every cluster.")
+        self.rolling.extend(self.clusters)
+        self._roll()
+
+    def _roll(self) -> None:
+        self.rolling_current = None
+        while self.rolling:
+            cluster = self.rolling.popleft()
+            if cluster.process and cluster.process.is_alive():
+                self.rolling_current = cluster
+                self.rolling_deadline = (
+                    time.monotonic() + constants.Cluster.ready_timeout
+                )
+                self.stop(cluster)
+                return
+        log.info("Rolling restart finished.")
+
+    def handle(self, cluster: Cluster, message: dict) -> None:
+        op = message["op"]
+        if op in ("ready", "stats"):
+            cluster.stats = {
+                "guilds": message["guilds"],
+                "shards": message["shards"],
+                "latency": message["latency"],
+            }
+            self.broadcast_stats()
+            if op == "ready":
+                cluster.crashes = 0
+                if cluster is self.rolling_current:
+                    self._roll()
+        elif op == "rolling_restart":
+            self.rolling_restart()
+
+    def exited(self, cluster: Cluster) -> None:
+        code = cluster.process.exitcode
+        cluster.conn.close()
+        cluster.conn = None
+        cluster.stats = None
+        self.broadcast_stats()
+
+        if self.shutting_down:
+            log.info(f"Cluster {cluster.id} has shut down.")
+        elif cluster.stopping or code == ExitCodes.RESTART:
+            log.info(f"Restarting cluster {cluster.id}.")
+            self.start(cluster)
+        elif code == ExitCodes.SHUTDOWN:
+            # an owner shut the bot down from this cluster, stop the others too
+            log.info(f"Cluster {cluster.id} was shut down.")
+            self.shutdown()
+        else:
+            # back off if it keeps crashing right after starting
+            cluster.crashes += 1
+            delay = min(2**cluster.crashes, 60)
+            log.error(
+                f"Cluster {cluster.id} exited with code {code}, restarting it in {delay}s."
+            )
+            self.pending.append((time.monotonic() + delay, cluster))
+
+    def run(self) -> int:
+        signal.signal(signal.SIGINT, lambda *_: self.shutdown())
+        signal.signal(signal.SIGTERM, lambda *_: self.shutdown())
+        signal.signal(signal.SIGHUP, lambda *_: self.rolling_restart())
+
+        for cluster in self.clusters:
+            self.start(cluster)
+
+        while True:
+            running = [
+                cluster
+                for cluster in self.clusters
+                if cluster.process and cluster.conn is not None
+            ]
+            if not running and not self.pending:
+                return ExitCodes.SHUTDOWN
+
+            now = time.monotonic()
+            for due, cluster in list(self.pending):
+                if due <= now:
+                    self.pending.remove((due, cluster))
+                    self.start(cluster)
+            if (
+                self.rolling_current is not None
+                and now > self.rolling_deadline
+                and self.rolling_current.stats is None
+            ):
+                log.warning(
+                    f"Cluster {self.rolling_current.id} did not become ready in time, "
+                    "carrying on with the rolling restart."
+                )
+                self._roll()
+
+            handles = {}
+            for cluster in running:
+                handles[cluster.conn] = cluster
+                handles[cluster.process.sentinel] = cluster
+            for ready in wait(list(handles), timeout=1.0):
+                cluster = handles[ready]
+                if ready == cluster.process.sentinel:
+                    cluster.process.join()
+                    if cluster.conn is not None:
+                        self.exited(cluster)
+                    continue
+                if ready is not cluster.conn:
+                    # the pipe of a cluster which has since been restarted
+                    continue
+                try:
+                    message = cluster.conn.recv()
+                except (EOFError, OSError):
+                    # the process is exiting, its sentinel will fire next
+                    continue
+                self.handle(cluster, message)
+
+
+def run_clusters() -> None:
+    """Run the bot as `cluster.clusters` processes under a supervisor."""
+    shard_count = constants.Cluster.shard_count or recommended_shards()
+    clusters = min(constants.Cluster.clusters, shard_count)
+    log.info(f"Running {shard_count} shards in {clusters} clusters.")
+    raise SystemExit(Supervisor(clusters, shard_count).run())
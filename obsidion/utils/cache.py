@@ -0,0 +1,497 @@
+"""
+Cache-aside helpers backed by the bot's redis session.
+
+Values are kept in two tiers: a size bounded in-process LRU in front of redis,
+so repeat lookups skip both the network hop and decoding the payload. Whenever a
+value is written its key is published on a redis channel, and every other
+process drops its local copy, keeping the shards coherent.
+
+Lookups that miss the cache are coalesced twice over: within a process only one
+fetch per key is ever in flight (every other caller awaits the same result),
+and across shards/processes a short lived redis lock lets a single worker hit
+the upstream while the others wait for it to write the key.
+
+A hit costs a single redis GET. Misses are stored together with the release of
+the fetch lock in one pipelined round trip. `False`, which the helpers return
+when a player or server could not be found, is cached with its own (shorter) TTL.
+When the upstream is unavailable an expired local copy is served, if there is one.
+
+If a redis command fails, the bot is told to connect to redis again, and until it
+has the local tier is used alone and misses are fetched without coalescing them
+across processes.
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import time
+import uuid
+from collections import Counter, OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import aioredis
+
+from obsidion import constants
+from obsidion.utils.http import UpstreamUnavailable
+from obsidion.utils.utils import log_task_errors
+
+log = logging.getLogger(__name__)
+
+__all__ = ["Cache", "CacheStats", "LocalCache", "SingleFlight", "cached"]
+
+# how long a worker may hold the fetch lock for a key before it expires (seconds)
+LOCK_TIMEOUT = constants.Cache.lock_timeout
+# how often a worker waiting on another worker's fetch re-checks redis (seconds)
+LOCK_POLL_INTERVAL = constants.Cache.lock_poll_interval
+# how long a `False` (not found) result is cached for by default (seconds)
+NEGATIVE_TTL = constants.Cache.negative_ttl
+# how long to wait before subscribing to invalidations again, doubling up to the max
+LISTEN_BACKOFF = 1
+LISTEN_MAX_BACKOFF = 60
+
+# errors of a redis command meaning redis (or the connection to it) is down
+REDIS_ERRORS = (aioredis.RedisError, OSError)
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one in-flight call."""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `factory` for `key` unless a call for it is already in flight.
+
+        Args:
+            key (str): key identifying the call
+            factory (Callable[[], Awaitable[Any]]): creates the coroutine to run
+
+        Returns:
+            Any: result of the (possibly shared) call
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        # shield so a cancelled caller doesn't cancel the fetch for everyone else
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: asyncio.Future) -> None:
+        self._calls.pop(key, None)
+        if not task.cancelled():
+            # mark the exception as retrieved, the callers have already seen it
+            task.exception()
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
+class LocalCache:
+    """Size bounded in-process LRU cache with a per entry expiry.
+
+    The size of an entry is the length of its encoded payload, which is a cheap
+    stand-in for the memory held by the decoded value. Values are shared between
+    every caller that gets them, so they must not be mutated.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+
+    def get(self, key: str, stale: bool = False) -> Any:
+        """Return the value of `key`, or None if it is missing or expired.
+
+        Expired entries are kept until they are evicted or replaced, and are
+        still returned when `stale` is True.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, _, value = entry
+        if expires < time.monotonic() and not stale:
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, size: int, ttl: float) -> None:
+        """Store `value` for `ttl` seconds, evicting the least recently used."""
+        self.pop(key)
+        if ttl <= 0 or size > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic() + ttl, size, value)
+        self.size += size
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            _, (_, evicted, _) = self._entries.popitem(last=False)
+            self.size -= evicted
+            self.evictions += 1
+
+    def pop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CacheStats:
+    """Hit/miss counters and upstream fetch latency, grouped by key namespace.
+
+    The namespace of a key is everything before its first underscore, so
+    `blocksmc_notch` is counted under `blocksmc`.
+    """
+
+    def __init__(self):
+        self.hits = Counter()
+        self.local_hits = Counter()
+        self.misses = Counter()
+        self.stale_hits = Counter()
+        self.fetches = Counter()
+        self.fetch_time = defaultdict(float)
+
+    @staticmethod
+    def namespace(key: str) -> str:
+        return key.split("_", 1)[0]
+
+    def hit(self, key: str, local: bool = False) -> None:
+        namespace = self.namespace(key)
+        self.hits[namespace] += 1
+        if local:
+            self.local_hits[namespace] += 1
+
+    def miss(self, key: str) -> None:
+        self.misses[self.namespace(key)] += 1
+
+    def stale(self, key: str) -> None:
+        self.stale_hits[self.namespace(key)] += 1
+
+    def fetched(self, key: str, seconds: float) -> None:
+        namespace = self.namespace(key)
+        self.fetches[namespace] += 1
+        self.fetch_time[namespace] += seconds
+
+    def hit_ratio(self, namespace: Optional[str] = None) -> float:
+        """Ratio of hits to lookups, for one namespace or all of them."""
+        if namespace is None:
+            hits = sum(self.hits.values())
+            lookups = hits + sum(self.misses.values())
+        else:
+            hits = self.hits[namespace]
+            lookups = hits + self.misses[namespace]
+        return hits / lookups if lookups else 0.0
+
+
+class Cache:
+    """Two tier cache-aside layer in front of `Obsidion.redis_session`."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.stats = CacheStats()
+        self.local = LocalCache(
+            constants.Cache.local_max_entries, constants.Cache.local_max_bytes
+        )
+        self.local_ttl = (
+            constants.Cache.local_ttl if constants.Cache.local_enabled else 0
+        )
+        self.channel = constants.Cache.invalidation_channel
+        self._flight = SingleFlight()
+        self._token = uuid.uuid4().hex
+        self._listener: Optional[asyncio.Task] = None
+
+    @property
+    def available(self) -> bool:
+        """Whether redis is up, without it only the local tier is used."""
+        return self.bot.redis_ready.is_set() and not self.bot.redis_closed
+
+    def _lost(self, error: Exception) -> None:
+        log.warning(f"A redis command failed ({error!r}), running without redis.")
+        self.bot.redis_lost()
+
+    def start_listening(self) -> None:
+        """Start listening for invalidations, unless it already is."""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.ensure_future(self.listen())
+            self._listener.add_done_callback(log_task_errors)
+
+    async def listen(self) -> None:
+        """Drop local copies of keys written by other processes.
+
+        Subscribes again whenever the connection drops, until the redis session
+        is closed.
+        """
+        if not self.local_ttl:
+            return
+        delay = LISTEN_BACKOFF
+        while not self.bot.redis_closed:
+            try:
+                (channel,) = await self.bot.redis_session.subscribe(self.channel)
+            except REDIS_ERRORS as e:
+                log.warning(
+                    f"Could not subscribe to cache invalidations ({e!r}), retrying in {delay}s."
+                )
+                # nothing tells us which keys changed meanwhile
+                self.local.clear()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, LISTEN_MAX_BACKOFF)
+                continue
+            # anything published while we weren't subscribed may now be stale
+            self.local.clear()
+            delay = LISTEN_BACKOFF
+            while await channel.wait_message():
+                token, _, key = (await channel.get(encoding="utf-8")).partition(":")
+                if token != self._token:
+                    self.local.pop(key)
+            if not self.bot.redis_closed:
+                log.warning(
+                    "Lost the cache invalidation subscription, subscribing again."
+                )
+                await asyncio.sleep(LISTEN_BACKOFF)
+        self.local.clear()
+
+    async def get(self, key: str, codec=json) -> Any:
+        """Return the cached value of `key`, or None if it isn't cached."""
+        value = self.local.get(key)
+        if value is not None:
+            self.stats.hit(key, local=True)
+            return value
+        value = await self._get(key, codec)
+        if value is not None:
+            self.stats.hit(key)
+        else:
+            self.stats.miss(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: int, codec=json) -> None:
+        """Store `value` under `key` in both tiers for `ttl` seconds."""
+        await self._store(key, value, ttl, codec, ttl, None)
+
+    async def invalidate(self, key: str) -> None:
+        """Remove `key` from redis and from the local tier of every process."""
+        self.local.pop(key)
+        if not self.available:
+            return
+        pipe = self.bot.redis_session.pipeline()
+        pipe.delete(key)
+        pipe.publish(self.channel, f"{self._token}:{key}")
+        try:
+            await pipe.execute()
+        except REDIS_ERRORS as e:
+            self._lost(e)
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        ttl: int,
+        codec=json,
+        negative_ttl: Optional[int] = NEGATIVE_TTL,
+    ) -> Any:
+        """Return the cached value of `key`, fetching and storing it on a miss.
+
+        Args:
+            key (str): redis key of the value
+            fetch (Callable[[], Awaitable[Any]]): fetches the value from upstream
+            ttl (int): seconds to keep the value in redis
+            codec (optional): object with `dumps`/`loads` used to (de)serialise
+                the value. Defaults to json.
+            negative_ttl (int, optional): seconds to keep a `False` result,
+                `None` to not cache it at all. Defaults to NEGATIVE_TTL.
+
+        Returns:
+            Any: the cached or freshly fetched value
+        """
+        value = self.local.get(key)
+        if value is not None:
+            self.stats.hit(key, local=True)
+            return value
+        value = await self._get(key, codec)
+        if value is not None:
+            self.stats.hit(key)
+            return value
+        self.stats.miss(key)
+        return await self._flight.do(
+            key, lambda: self._fetch(key, fetch, ttl, codec, negative_ttl)
+        )
+
+    async def _get(self, key: str, codec) -> Any:
+        if not self.available:
+            return None
+        try:
+            raw = await self.bot.redis_session.get(key)
+        except REDIS_ERRORS as e:
+            self._lost(e)
+            return None
+        if raw is None:
+            return None
+        try:
+            value = codec.loads(raw)
+        except ValueError:
+            log.warning(f"Could not decode the cached value of {key}, refetching it.")
+            return None
+        self.local.set(key, value, len(raw), self.local_ttl)
+        return value
+
+    async def _fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        ttl: int,
+        codec,
+        negative_ttl: Optional[int],
+    ) -> Any:
+        redis = self.bot.redis_session
+        # without redis there are no other processes to share the fetch with
+        lock = f"lock_{key}" if self.available else None
+
+        if lock is not None:
+            try:
+                locked = await redis.set(
+                    lock, self._token, expire=LOCK_TIMEOUT, exist=redis.SET_IF_NOT_EXIST
+                )
+            except REDIS_ERRORS as e:
+                self._lost(e)
+                lock, locked = None, True
+            if not locked:
+                # another shard is already fetching this key, wait for it to land
+                value = await self._wait_for_fetch(key, lock, codec)
+                if value is not None:
+                    return value
+                log.debug(f"Gave up waiting on the fetch lock for {key}, fetching it.")
+                lock = None
+
+        start = time.perf_counter()
+        try:
+            value = await fetch()
+        except UpstreamUnavailable:
+            await self._release(lock)
+            stale = self.local.get(key, stale=True)
+            if stale is None:
+                raise
+            log.info(f"Serving a stale copy of {key}, its upstream is unavailable.")
+            self.stats.stale(key)
+            return stale
+        except BaseException:
+            await self._release(lock)
+            raise
+        self.stats.fetched(key, time.perf_counter() - start)
+
+        await self._store(key, value, ttl, codec, negative_ttl, lock)
+        return value
+
+    async def _wait_for_fetch(self, key: str, lock: str, codec) -> Any:
+        """Wait for the holder of the fetch lock of `key` to store it.
+
+        Returns None if the lock is released or expires without the key being
+        stored, or if redis goes away meanwhile.
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + LOCK_TIMEOUT
+        while loop.time() < deadline and self.available:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            value = await self._get(key, codec)
+            if value is not None:
+                return value
+            try:
+                if not await self.bot.redis_session.exists(lock):
+                    return None
+            except REDIS_ERRORS as e:
+                self._lost(e)
+                return None
+        return None
+
+    async def _release(self, lock: Optional[str]) -> None:
+        if lock is None or not self.available:
+            return
+        try:
+            await self.bot.redis_session.delete(lock)
+        except REDIS_ERRORS as e:
+            self._lost(e)
+
+    async def _store(
+        self,
+        key: str,
+        value: Any,
+        ttl: int,
+        codec,
+        negative_ttl: Optional[int],
+        lock: Optional[str],
+    ) -> None:
+        """Store `value`, tell the other processes and release the fetch lock.
+
+        All in a single round trip.
+        """
+        if value is False:
+            ttl = negative_ttl
+        elif value is None:
+            ttl = None
+
+        if not self.available:
+            # the lock was never taken, so there is nothing else to do
+            if ttl:
+                raw = codec.dumps(value)
+                self.local.set(key, value, len(raw), min(ttl, self.local_ttl))
+            return
+
+        pipe = self.bot.redis_session.pipeline()
+        if ttl:
+            raw = codec.dumps(value)
+            self.local.set(key, value, len(raw), min(ttl, self.local_ttl))
+            pipe.set(key, raw, expire=ttl)
+            if self.local_ttl:
+                pipe.publish(self.channel, f"{self._token}:{key}")
+        if lock is not None:
+            # the value is written in the same pipeline, so even if our lock had
+            # expired and been taken over, its holder's waiters will find the key
+            pipe.delete(lock)
+        try:
+            await pipe.execute()
+        except REDIS_ERRORS as e:
+            # the value is in the local tier, the other processes will fetch it again
+            self._lost(e)
+
+
+def cached(
+    key_fn: Callable[..., str],
+    ttl: int,
+    codec=json,
+    negative_ttl: Optional[int] = NEGATIVE_TTL,
+):
+    """Cache the result of a coroutine method in `self.bot.cache`.
+
+    Example:
+        @cached(lambda username: f"username_{username}", ttl=28800)
+        async def get_uuid(self, username):
+            ...
+
+    Args:
+        key_fn (Callable[..., str]): builds the redis key from the method's
+            arguments (excluding `self`)
+        ttl (int): seconds to keep the value in redis
+        codec (optional): object with `dumps`/`loads`. Defaults to json.
+        negative_ttl (int, optional): seconds to keep a `False` result.
+            Defaults to NEGATIVE_TTL.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            return await self.bot.cache.get_or_fetch(
+                key_fn(*args, **kwargs),
+                lambda: func(self, *args, **kwargs),
+                ttl=ttl,
+                codec=codec,
+                negative_ttl=negative_ttl,
+            )
+
+        return wrapper
+
+    return decorator
@@ -156,6 +156,21 @@ def escape(text: str, *, mass_mentions: bool = False, formatting: bool = False)
     return text
 
 
+def shorten(text: str, length: int) -> str:
+    """Cut text down to `length` characters, ending it with an ellipsis if cut.
+
+    Args:
+        text (str): text to shorten
+        length (int): most characters to keep, including the ellipsis
+
+    Returns:
+        str: the text, or its start followed by an ellipsis
+    """
+    if len(text) <= length:
+        return text
+    return text[: length - 1] + "\N{HORIZONTAL ELLIPSIS}"
+
+
 def humanize_list(items: Sequence[str]) -> str:
     """Get comma-separted list, with the last element joined with *and*.
     This uses an Oxford comma, because without one, items containing
@@ -0,0 +1,90 @@
+"""
+Command context which times the phases of a command.
+
+A command's time is split into:
+    queue: from the message being sent until the command is invoked, which
+        includes the gateway delivering it and it waiting on the event loop
+    upstream: time with a request to an upstream api or server in flight
+    send: time sending replies to discord
+    render: everything else, i.e. building the reply
+
+The context of the command being run is kept in `current_context`, so code far
+from the command (the http session's trace config, the server pings) can add to
+its upstream phase without being handed the context.
+"""
+
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+from discord.ext import commands
+
+__all__ = ["Context", "current_context", "upstream"]
+
+current_context: ContextVar[Optional["Context"]] = ContextVar(
+    "current_context", default=None
+)
+
+
+class Context(commands.Context):
+    """Context recording how long each phase of the command took."""
+
+    def __init__(self, **attrs):
+        super().__init__(**attrs)
+        # when the message was sent, on the perf_counter clock; discord's clock
+        # may be a little ahead of ours, so the age is never taken as negative
+        age = (datetime.utcnow() - self.message.created_at).total_seconds()
+        self.received = time.perf_counter() - max(age, 0.0)
+        self.invoked_at: Optional[float] = None
+        self.completed_at: Optional[float] = None
+        self.phases: Dict[str, float] = defaultdict(float)
+        self._upstream_in_flight = 0
+        self._upstream_since = 0.0
+
+    def upstream_started(self) -> None:
+        # overlapping requests are counted once, as wall clock time
+        if not self._upstream_in_flight:
+            self._upstream_since = time.perf_counter()
+        self._upstream_in_flight += 1
+
+    def upstream_finished(self) -> None:
+        self._upstream_in_flight -= 1
+        if not self._upstream_in_flight:
+            self.phases["upstream"] += time.perf_counter() - self._upstream_since
+
+    async def send(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().send(*args, **kwargs)
+        finally:
+            self.phases["send"] += time.perf_counter() - start
+
+    def timings(self) -> Dict[str, float]:
+        """Seconds spent in each phase of the command, and in total."""
+        total = self.completed_at - self.invoked_at
+        upstream = self.phases["upstream"]
+        send = self.phases["send"]
+        return {
+            "queue": self.invoked_at - self.received,
+            "upstream": upstream,
+            "send": send,
+            "render": max(total - upstream - send, 0.0),
+            "total": total,
+        }
+
+
+@contextmanager
+def upstream() -> Iterator[None]:
+    """Count the time spent in the block as upstream time of the current command."""
+    ctx = current_context.get()
+    if ctx is None:
+        yield
+        return
+    ctx.upstream_started()
+    try:
+        yield
+    finally:
+        ctx.upstream_finished()
@@ -0,0 +1,423 @@
+"""
+Outbound HTTP governance for `Obsidion.http_session`.
+
+Every upstream host gets a token bucket rate limit and a cap on concurrent
+requests. Requests over either limit queue until they may go out, and a 429
+with a `Retry-After` header pauses the whole host for that long.
+
+Every host also gets a circuit breaker: after enough consecutive failures the
+host is considered down and requests to it fail fast with `CircuitOpenError`
+until a trial request gets through again.
+
+The limits and breakers are enforced from aiohttp `TraceConfig`s, so callers
+keep using the session as is. `fetch` adds the per host timeout and retries
+with jittered exponential backoff on top, for idempotent GETs.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from types import SimpleNamespace
+from typing import Any, Dict, Optional, Union
+
+import aiohttp
+from yarl import URL
+
+from obsidion import constants
+
+log = logging.getLogger(__name__)
+
+__all__ = [
+    "CircuitBreaker",
+    "CircuitBreakers",
+    "CircuitOpenError",
+    "HostLimiter",
+    "RateLimiter",
+    "UpstreamUnavailable",
+    "fetch",
+    "host_settings",
+]
+
+
+class UpstreamUnavailable(Exception):
+    """An upstream host could not be reached, even after retrying."""
+
+    def __init__(self, host: str, reason: str):
+        self.host = host
+        super().__init__(f"{host} is unavailable: {reason}")
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """A request was refused because the circuit breaker of its host is open."""
+
+    def __init__(self, host: str):
+        super().__init__(host, "circuit breaker is open")
+
+
+def host_settings(host: str) -> dict:
+    """Settings of an upstream host, falling back on `http.default_host`."""
+    return {**constants.HTTP.default_host, **constants.HTTP.hosts.get(host, {})}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a `Retry-After` header, which may also be a date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class HostLimiter:
+    """Token bucket rate limit and concurrency cap for a single upstream host.
+
+    Args:
+        host (str): hostname the limits apply to
+        rate (int): requests allowed every `per` seconds, also the burst size
+        per (float): length of the rate limit window in seconds
+        concurrency (int): requests allowed to be in flight at once
+    """
+
+    def __init__(self, host: str, rate: int, per: float, concurrency: int):
+        self.host = host
+        self.rate = rate
+        self.per = per
+        self.concurrency = concurrency
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+        # metrics
+        self.waiting = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.wait_time = 0.0
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent to the host."""
+        self.waiting += 1
+        start = time.monotonic()
+        try:
+            await self._semaphore.acquire()
+            try:
+                await self._take_token()
+            except BaseException:
+                self._semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+            self.wait_time += time.monotonic() - start
+        self.in_flight += 1
+        self.requests += 1
+
+    def release(self) -> None:
+        """Mark a request as finished."""
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def retry_after(self, seconds: float) -> None:
+        """Hold back every request to the host for `seconds`."""
+        self.rate_limited += 1
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        log.warning(f"Rate limited by {self.host}, pausing it for {seconds:.1f}s.")
+
+    async def _take_token(self) -> None:
+        while True:
+            now = time.monotonic()
+            self.tokens = min(
+                self.rate, self.tokens + (now - self.updated) * self.rate / self.per
+            )
+            self.updated = now
+
+            blocked = self.blocked_until - now
+            if blocked <= 0 and self.tokens >= 1:
+                self.tokens -= 1
+                return
+            refill = (1 - self.tokens) * self.per / self.rate
+            await asyncio.sleep(max(blocked, refill))
+
+
+class RateLimiter:
+    """Per host limiters, applied to a session through `trace_config`."""
+
+    def __init__(self):
+        self.limiters: Dict[str, HostLimiter] = {}
+
+    def get(self, host: str) -> HostLimiter:
+        """Return the limiter of `host`, creating it on first use."""
+        limiter = self.limiters.get(host)
+        if limiter is None:
+            settings = host_settings(host)
+            limiter = HostLimiter(
+                host, settings["rate"], settings["per"], settings["concurrency"]
+            )
+            self.limiters[host] = limiter
+        return limiter
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """Create a trace config which enforces the limits on a session."""
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_request_end.append(self._on_request_end)
+        trace_config.on_request_exception.append(self._on_request_exception)
+        return trace_config
+
+    async def _on_request_start(
+        self,
+        session: aiohttp.ClientSession,
+        ctx: SimpleNamespace,
+        params: aiohttp.TraceRequestStartParams,
+    ) -> None:
+        limiter = self.get(params.url.host)
+        current = getattr(ctx, "limiter", None)
+        if current is limiter:
+            # a redirect to the same host keeps the slot of the original request
+            return
+        if current is not None:
+            current.release()
+            ctx.limiter = None
+        await limiter.acquire()
+        ctx.limiter = limiter
+
+    async def _on_request_end(
+        self,
+        session: aiohttp.ClientSession,
+        ctx: SimpleNamespace,
+        params: aiohttp.TraceRequestEndParams,
+    ) -> None:
+        limiter = getattr(ctx, "limiter", None)
+        if limiter is None:
+            return
+        ctx.limiter = None
+
+        # this fires once the headers are in, but the slot is held until the body
+        # has been read too, i.e. until the connection goes back to the pool
+        response = params.response
+        if response.connection is None:
+            limiter.release()
+        else:
+            response.connection.add_callback(limiter.release)
+
+        if response.status == 429:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            limiter.retry_after(
+                constants.HTTP.retry_after if retry_after is None else retry_after
+            )
+
+    async def _on_request_exception(
+        self,
+        session: aiohttp.ClientSession,
+        ctx: SimpleNamespace,
+        params: aiohttp.TraceRequestExceptionParams,
+    ) -> None:
+        limiter = getattr(ctx, "limiter", None)
+        if limiter is None:
+            return
+        ctx.limiter = None
+        limiter.release()
+
+
+class CircuitBreaker:
+    """Stop sending requests to a host which keeps failing.
+
+    Closed: requests flow, consecutive failures are counted.
+    Open: after `threshold` failures requests are refused for `reset_timeout`.
+    Half open: one trial request is let through, closing the breaker again if it
+    succeeds and re-opening it if it fails. A trial which hasn't reported back
+    after another `reset_timeout` (e.g. cancelled while waiting for the rate
+    limiter, which fires no trace) is given up on and a new one let through.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, host: str, threshold: int, reset_timeout: float):
+        self.host = host
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started = 0.0
+
+        # metrics
+        self.trips = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """Whether a request may be sent to the host right now."""
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            waited = now - self.opened_at
+        else:
+            # half open, with a trial in flight
+            waited = now - self.trial_started
+        if waited >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self.trial_started = now
+            return True
+        self.rejected += 1
+        return False
+
+    def success(self) -> None:
+        if self.state != self.CLOSED:
+            log.info(f"{self.host} has recovered, closing its circuit breaker.")
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (
+            self.state == self.CLOSED and self.failures >= self.threshold
+        ):
+            if self.state == self.CLOSED:
+                log.warning(f"{self.host} keeps failing, opening its circuit breaker.")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.trips += 1
+
+
+class CircuitBreakers:
+    """Per host circuit breakers, applied to a session through `trace_config`.
+
+    A request fails when it raises or the host answers with a 5xx status.
+    """
+
+    def __init__(self):
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, host: str) -> CircuitBreaker:
+        """Return the breaker of `host`, creating it on first use."""
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            settings = host_settings(host)
+            breaker = CircuitBreaker(
+                host, settings["breaker_threshold"], settings["breaker_reset"]
+            )
+            self.breakers[host] = breaker
+        return breaker
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """Create a trace config which enforces the breakers on a session."""
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_request_end.append(self._on_request_end)
+        trace_config.on_request_exception.append(self._on_request_exception)
+        return trace_config
+
+    async def _on_request_start(
+        self,
+        session: aiohttp.ClientSession,
+        ctx: SimpleNamespace,
+        params: aiohttp.TraceRequestStartParams,
+    ) -> None:
+        breaker = self.get(params.url.host)
+        if getattr(ctx, "breaker", None) is breaker:
+            return
+        if not breaker.allow():
+            raise CircuitOpenError(params.url.host)
+        ctx.breaker = breaker
+
+    async def _on_request_end(
+        self,
+        session: aiohttp.ClientSession,
+        ctx: SimpleNamespace,
+        params: aiohttp.TraceRequestEndParams,
+    ) -> None:
+        breaker = getattr(ctx, "breaker", None)
+        if breaker is None:
+            return
+        if params.response.status >= 500:
+            breaker.failure()
+        else:
+            breaker.success()
+
+    async def _on_request_exception(
+        self,
+        session: aiohttp.ClientSession,
+        ctx: SimpleNamespace,
+        params: aiohttp.TraceRequestExceptionParams,
+    ) -> None:
+        breaker = getattr(ctx, "breaker", None)
+        if breaker is not None and not isinstance(params.exception, CircuitOpenError):
+            breaker.failure()
+
+
+def backoff(attempt: int) -> float:
+    """Seconds to wait before retry number `attempt`, with full jitter."""
+    delay = min(constants.HTTP.backoff_max, constants.HTTP.backoff_base * 2**attempt)
+    return random.uniform(0, delay)
+
+
+async def fetch(
+    session: aiohttp.ClientSession,
+    url: str,
+    params: dict = None,
+    json: dict = None,
+    text: bool = False,
+) -> Union[Any, bool]:
+    """GET a url with the timeout and retry policy of its host.
+
+    Connection errors, timeouts, 429s and 5xx responses are retried with
+    jittered exponential backoff, up to the `retries` of the host. A 200 which
+    isn't json fails at once.
+
+    Args:
+        session (aiohttp.ClientSession): aiohttp session to use
+        url (str): url to get
+        params (dict, optional): query parameters. Defaults to None.
+        json (dict, optional): json to pass to request. Defaults to None.
+        text (bool, optional): return the body as text instead of decoding
+            it as json. Defaults to False.
+
+    Raises:
+        UpstreamUnavailable: the host could not be reached after retrying, or
+            answered with something other than json
+        CircuitOpenError: the circuit breaker of the host is open
+
+    Returns:
+        Union[Any, bool]: the body, False if the response was not a 200
+    """
+    host = URL(url).host
+    settings = host_settings(host)
+    timeout = aiohttp.ClientTimeout(total=settings["timeout"])
+
+    for attempt in range(settings["retries"] + 1):
+        if attempt:
+            await asyncio.sleep(backoff(attempt - 1))
+        try:
+            async with session.get(
+                url, params=params, json=json, timeout=timeout
+            ) as resp:
+                if resp.status == 429 or resp.status >= 500:
+                    reason = f"status {resp.status}"
+                elif resp.status != 200:
+                    return False
+                elif text:
+                    return await resp.text()
+                else:
+                    return await resp.json()
+        except CircuitOpenError:
+            raise
+        except aiohttp.ContentTypeError:
+            # a 200 which isn't json won't become json by asking again
+            raise UpstreamUnavailable(host, f"expected json, got {resp.content_type}")
+        except asyncio.TimeoutError:
+            reason = f"timed out after {settings['timeout']}s"
+        except aiohttp.ClientError as e:
+            reason = str(e) or e.__class__.__name__
+        log.debug(f"GET {url} failed ({reason}), attempt {attempt + 1}.")
+
+    raise UpstreamUnavailable(host, reason)
@@ -0,0 +1,149 @@
+"""
+Batched Minecraft username <-> UUID resolution.
+
+Mojang's bulk profiles endpoint takes up to 10 usernames per request, so instead
+of one POST per lookup the resolver queues lookups for a few milliseconds and
+sends them together, handing each caller back its own result. Both directions
+of the mapping are cached through `Obsidion.cache`, and requests are paced by
+the api.mojang.com limits of `Obsidion.rate_limiter`.
+"""
+
+import asyncio
+import logging
+import re
+from typing import Dict, List, Optional, Set, Union
+
+import aiohttp
+
+from obsidion import constants
+from obsidion.utils.http import UpstreamUnavailable, backoff, host_settings
+from obsidion.utils.utils import UUIDToUsername, log_task_errors
+
+log = logging.getLogger(__name__)
+
+__all__ = ["UUIDResolver"]
+
+PROFILES_HOST = "api.mojang.com"
+PROFILES_URL = f"https://{PROFILES_HOST}/profiles/minecraft"
+
+# what Mojang accepts as a username, the endpoint fails the whole batch on anything else
+USERNAME = re.compile(r"^[A-Za-z0-9_]{1,16}$")
+
+
+class UUIDResolver:
+    """Resolve usernames to UUIDs in batches through the bulk profiles endpoint."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.batch_size = constants.Mojang.batch_size
+        self.batch_delay = constants.Mojang.batch_delay
+        self.ttl = constants.Mojang.ttl
+        self.requests = 0
+        self._queue: Dict[str, asyncio.Future] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # the batches being resolved, so they aren't garbage collected mid flight
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def username_to_uuid(self, username: str) -> Union[str, bool]:
+        """Takes in an mc username and tries to convert it to a mc uuid.
+
+        Args:
+            username (str): username of player which uuid will be from
+
+        Returns:
+            Union[str, bool]: uuid of player, False if the username is not used
+        """
+        if not USERNAME.match(username):
+            return False
+        username = username.lower()
+        return await self.bot.cache.get_or_fetch(
+            f"uuid_{username}", lambda: self._enqueue(username), ttl=self.ttl
+        )
+
+    async def uuid_to_username(self, uuid: str) -> Union[str, bool]:
+        """Takes in a minecraft UUID and converts it to its current username.
+
+        Args:
+            uuid (str): uuid of player
+
+        Returns:
+            Union[str, bool]: username of player, False if the uuid is not used
+        """
+        return await self.bot.cache.get_or_fetch(
+            f"name_{uuid}",
+            lambda: UUIDToUsername(uuid, self.bot.http_session),
+            ttl=self.ttl,
+        )
+
+    def _enqueue(self, username: str) -> asyncio.Future:
+        future = self._queue.get(username)
+        if future is not None:
+            return future
+
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._queue[username] = future
+
+        if len(self._queue) >= self.batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_delay, self._flush)
+        return future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self._queue:
+            batch = dict(list(self._queue.items())[: self.batch_size])
+            for username in batch:
+                del self._queue[username]
+            task = asyncio.ensure_future(self._resolve(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            task.add_done_callback(log_task_errors)
+
+    async def _resolve(self, batch: Dict[str, asyncio.Future]) -> None:
+        try:
+            profiles = await self._post(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                # the callers may have given up (been cancelled) meanwhile
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        found = {profile["name"].lower(): profile for profile in profiles}
+        for username, future in batch.items():
+            profile = found.get(username)
+            if not future.done():
+                future.set_result(profile["id"] if profile else False)
+
+        # we get the current names for free, so fill in the reverse direction
+        for profile in found.values():
+            try:
+                await self.bot.cache.set(
+                    f"name_{profile['id']}", profile["name"], self.ttl
+                )
+            except Exception:
+                log.exception(f"Could not cache the username of {profile['id']}.")
+
+    async def _post(self, usernames: List[str]) -> list:
+        # Mojang's rate limit is enforced by `Obsidion.rate_limiter`, which also
+        # holds back api.mojang.com for as long as a 429 asks us to
+        settings = host_settings(PROFILES_HOST)
+        timeout = aiohttp.ClientTimeout(total=settings["timeout"])
+        for attempt in range(settings["retries"] + 1):
+            if attempt:
+                await asyncio.sleep(backoff(attempt - 1))
+            self.requests += 1
+            async with self.bot.http_session.post(
+                PROFILES_URL, json=usernames, timeout=timeout
+            ) as resp:
+                if resp.status == 429:
+                    continue
+                if resp.status == 204:
+                    return []
+                resp.raise_for_status()
+                return await resp.json()
+        raise UpstreamUnavailable(PROFILES_HOST, "status 429")
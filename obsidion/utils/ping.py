@@ -0,0 +1,417 @@
+"""
+Native Minecraft server list ping.
+
+Java edition servers are queried with the server list ping protocol: a
+handshake, a status request whose response is the server's status json and a
+ping/pong to measure latency. Servers too old to understand it (1.6 and older)
+get the legacy `0xFE 0x01` ping instead. When no port is given the address is
+resolved through its `_minecraft._tcp` SRV record, like the client does.
+
+Bedrock edition servers answer a RakNet unconnected ping over UDP with a pong
+holding their status. Every ping goes out of one shared socket and the pongs
+are matched back to their pings by the timestamp field, which the server echoes.
+Pings are resent on packet loss.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import random
+import re
+import socket
+import struct
+import time
+from typing import Dict, Optional, Tuple, Union
+
+import aiodns
+
+from obsidion import constants
+from obsidion.utils.context import upstream
+
+log = logging.getLogger(__name__)
+
+__all__ = ["BedrockProtocol", "ProtocolError", "bedrock_status", "java_status"]
+
+JAVA_PORT = 25565
+BEDROCK_PORT = 19132
+# RakNet's offline message id, sent in every unconnected packet
+RAKNET_MAGIC = bytes.fromhex("00ffff00fefefefefdfdfdfd12345678")
+UNCONNECTED_PING = 0x01
+UNCONNECTED_PONG = 0x1C
+# protocol version sent in the handshake, servers answer with their own version
+PROTOCOL_VERSION = 47
+LEGACY_PROTOCOL_VERSION = 74
+
+_formatting = re.compile("§.")
+_resolver: Optional[aiodns.DNSResolver] = None
+_bedrock: Optional["BedrockProtocol"] = None
+
+
+class ProtocolError(Exception):
+    """The server answered with something which is not a valid response."""
+
+
+def pack_varint(value: int) -> bytes:
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def pack_string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return pack_varint(len(data)) + data
+
+
+def pack_packet(packet_id: int, payload: bytes = b"") -> bytes:
+    data = pack_varint(packet_id) + payload
+    return pack_varint(len(data)) + data
+
+
+def unpack_varint(data: bytes, offset: int = 0) -> Tuple[int, int]:
+    """Read a varint from `data`, returning it and the offset after it."""
+    value = 0
+    for i in range(5):
+        if offset >= len(data):
+            raise ProtocolError("truncated varint")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            if value & 0x80000000:
+                value -= 1 << 32
+            return value, offset
+    raise ProtocolError("varint is too big")
+
+
+async def read_varint(reader: asyncio.StreamReader) -> int:
+    value = 0
+    for i in range(5):
+        byte = (await reader.readexactly(1))[0]
+        value |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return value
+    raise ProtocolError("varint is too big")
+
+
+async def read_packet(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    length = await read_varint(reader)
+    if length <= 0 or length > 0x200000:
+        raise ProtocolError(f"invalid packet length {length}")
+    data = await reader.readexactly(length)
+    packet_id, offset = unpack_varint(data)
+    return packet_id, data[offset:]
+
+
+def plain_text(component: Union[str, dict, list]) -> str:
+    """Flatten a chat component into plain text without formatting codes."""
+    if isinstance(component, str):
+        text = component
+    elif isinstance(component, list):
+        text = "".join(plain_text(part) for part in component)
+    elif isinstance(component, dict):
+        text = component.get("text", "") + "".join(
+            plain_text(part) for part in component.get("extra", ())
+        )
+    else:
+        text = ""
+    return _formatting.sub("", text)
+
+
+async def resolve_srv(host: str) -> Tuple[str, int]:
+    """Resolve the `_minecraft._tcp` SRV record of a host, if it has one."""
+    global _resolver
+    if _resolver is None:
+        _resolver = aiodns.DNSResolver()
+    try:
+        records = await _resolver.query(f"_minecraft._tcp.{host}", "SRV")
+    except aiodns.error.DNSError:
+        return host, JAVA_PORT
+    if not records:
+        return host, JAVA_PORT
+    record = min(records, key=lambda record: (record.priority, -record.weight))
+    return record.host.rstrip("."), record.port
+
+
+async def _status(host: str, port: int, address: str) -> dict:
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(
+            pack_packet(
+                0x00,
+                pack_varint(PROTOCOL_VERSION)
+                + pack_string(address)
+                + struct.pack(">H", port)
+                + pack_varint(1),
+            )
+            + pack_packet(0x00)
+        )
+        await writer.drain()
+
+        packet_id, payload = await read_packet(reader)
+        if packet_id != 0x00:
+            raise ProtocolError(f"unexpected packet {packet_id:#x}")
+        length, offset = unpack_varint(payload)
+        try:
+            status = json.loads(payload[offset : offset + length].decode("utf-8"))
+        except ValueError as e:
+            raise ProtocolError(f"invalid status json: {e}") from None
+        if not isinstance(status, dict):
+            raise ProtocolError("the status json is not an object")
+
+        start = time.perf_counter()
+        token = int(start * 1000)
+        writer.write(pack_packet(0x01, struct.pack(">q", token)))
+        await writer.drain()
+        try:
+            packet_id, payload = await read_packet(reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # some servers close the connection instead of answering the ping
+            latency = None
+        else:
+            latency = round((time.perf_counter() - start) * 1000)
+    finally:
+        writer.close()
+
+    players = status.get("players")
+    players = players if isinstance(players, dict) else {}
+    version = status.get("version")
+    version = version if isinstance(version, dict) else {}
+    return {
+        "description": plain_text(status.get("description", "")),
+        "players": {
+            "online": players.get("online", 0),
+            "max": players.get("max", 0),
+            "sample": [
+                {"name": plain_text(player.get("name", "")), "id": player.get("id")}
+                for player in players.get("sample") or ()
+                if isinstance(player, dict)
+            ],
+        },
+        "version": {
+            "name": plain_text(version.get("name", "")),
+            "protocol": version.get("protocol"),
+        },
+        "favicon": status.get("favicon"),
+        "latency": latency,
+    }
+
+
+async def _legacy_status(host: str, port: int, address: str) -> dict:
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        channel = "MC|PingHost".encode("utf-16-be")
+        encoded_address = address.encode("utf-16-be")
+        data = (
+            struct.pack(">B", LEGACY_PROTOCOL_VERSION)
+            + struct.pack(">h", len(address))
+            + encoded_address
+            + struct.pack(">i", port)
+        )
+        start = time.perf_counter()
+        writer.write(
+            b"\xfe\x01\xfa"
+            + struct.pack(">h", len("MC|PingHost"))
+            + channel
+            + struct.pack(">h", len(data))
+            + data
+        )
+        await writer.drain()
+
+        header = await reader.readexactly(3)
+        latency = round((time.perf_counter() - start) * 1000)
+        if header[0] != 0xFF:
+            raise ProtocolError("not a legacy kick packet")
+        (length,) = struct.unpack(">H", header[1:])
+        response = (await reader.readexactly(length * 2)).decode("utf-16-be")
+    finally:
+        writer.close()
+
+    if response.startswith("§1\x00"):
+        # 1.4 - 1.6: §1, protocol, version, motd, online and max players
+        _, protocol, version, motd, online, maximum = response.split("\x00")
+    else:
+        # beta 1.8 - 1.3: motd§online§max
+        motd, online, maximum = response.rsplit("§", 2)
+        protocol, version = None, ""
+    return {
+        "description": plain_text(motd),
+        "players": {"online": int(online), "max": int(maximum), "sample": []},
+        "version": {
+            "name": version,
+            "protocol": int(protocol) if protocol is not None else None,
+        },
+        "favicon": None,
+        "latency": latency,
+    }
+
+
+async def java_status(
+    address: str, port: Optional[int] = None, timeout: Optional[float] = None
+) -> Union[dict, bool]:
+    """Ping a Java edition server.
+
+    Args:
+        address (str): hostname or ip of the server
+        port (int, optional): port of the server, looked up through the SRV
+            record of `address` (or 25565) if left out. Defaults to None.
+        timeout (float, optional): seconds for the whole ping. Defaults to
+            `ping.timeout`.
+
+    Returns:
+        Union[dict, bool]: the status of the server with its description,
+            players, version, favicon and latency, False if it is offline
+    """
+    timeout = timeout or constants.Ping.timeout
+
+    async def ping():
+        if port:
+            host, server_port = address, int(port)
+        else:
+            host, server_port = await resolve_srv(address)
+        try:
+            return await _status(host, server_port, address)
+        except (ProtocolError, asyncio.IncompleteReadError, ConnectionResetError):
+            log.debug(f"{address} did not answer the status request, pinging legacy.")
+            return await _legacy_status(host, server_port, address)
+
+    try:
+        with upstream():
+            return await asyncio.wait_for(ping(), timeout)
+    except (
+        asyncio.TimeoutError,
+        OSError,
+        ProtocolError,
+        asyncio.IncompleteReadError,
+        ValueError,
+    ) as e:
+        log.debug(f"Could not ping {address}:{port}: {e!r}")
+        return False
+
+
+class BedrockProtocol(asyncio.DatagramProtocol):
+    """Shared UDP socket sending RakNet unconnected pings."""
+
+    def __init__(self):
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.guid = random.getrandbits(63)
+        self._waiters: Dict[int, asyncio.Future] = {}
+        self._tokens = itertools.count(int(time.time() * 1000))
+
+    def connection_made(self, transport: asyncio.DatagramTransport) -> None:
+        self.transport = transport
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        for waiter in self._waiters.values():
+            if not waiter.done():
+                waiter.set_exception(exc or ConnectionError("socket closed"))
+
+    def error_received(self, exc: Exception) -> None:
+        log.debug(f"Bedrock ping socket error: {exc!r}")
+
+    def datagram_received(self, data: bytes, addr: tuple) -> None:
+        if len(data) < 35 or data[0] != UNCONNECTED_PONG or data[17:33] != RAKNET_MAGIC:
+            return
+        (token,) = struct.unpack_from(">q", data, 1)
+        waiter = self._waiters.get(token)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(data)
+
+    async def ping(
+        self, addr: tuple, timeout: float, retries: int
+    ) -> Tuple[bytes, float]:
+        """Ping `addr`, returning the pong and the round trip time in seconds."""
+        token = next(self._tokens)
+        packet = (
+            struct.pack(">Bq", UNCONNECTED_PING, token)
+            + RAKNET_MAGIC
+            + struct.pack(">q", self.guid)
+        )
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters[token] = waiter
+        try:
+            for _ in range(retries + 1):
+                start = time.perf_counter()
+                self.transport.sendto(packet, addr)
+                try:
+                    pong = await asyncio.wait_for(
+                        asyncio.shield(waiter), timeout / (retries + 1)
+                    )
+                except asyncio.TimeoutError:
+                    continue
+                return pong, time.perf_counter() - start
+            raise asyncio.TimeoutError()
+        finally:
+            del self._waiters[token]
+
+
+async def bedrock_protocol() -> BedrockProtocol:
+    """Return the shared bedrock ping socket, opening it on first use."""
+    global _bedrock
+    if _bedrock is None or _bedrock.transport.is_closing():
+        loop = asyncio.get_event_loop()
+        transport, protocol = await loop.create_datagram_endpoint(
+            BedrockProtocol, family=socket.AF_INET
+        )
+        if _bedrock is None or _bedrock.transport.is_closing():
+            _bedrock = protocol
+        else:
+            # opened concurrently by another ping
+            transport.close()
+    return _bedrock
+
+
+def parse_pong(pong: bytes) -> dict:
+    (length,) = struct.unpack_from(">H", pong, 33)
+    fields = pong[35 : 35 + length].decode("utf-8", "replace").split(";")
+    if len(fields) < 6:
+        raise ProtocolError("incomplete server id")
+    return {
+        "motd": plain_text(fields[1]),
+        "players": {"online": int(fields[4]), "max": int(fields[5]), "names": []},
+        "software": {"version": fields[3], "protocol": int(fields[2])},
+        "map": plain_text(fields[7]) if len(fields) > 7 else "",
+        "gamemode": fields[8] if len(fields) > 8 else "",
+    }
+
+
+async def bedrock_status(
+    address: str, port: Optional[int] = None, timeout: Optional[float] = None
+) -> Union[dict, bool]:
+    """Ping a Bedrock edition server.
+
+    Args:
+        address (str): hostname or ip of the server
+        port (int, optional): port of the server. Defaults to 19132.
+        timeout (float, optional): seconds for the whole ping, split between
+            the retries. Defaults to `ping.timeout`.
+
+    Returns:
+        Union[dict, bool]: the status of the server with its motd, players,
+            software, map and latency, False if it is offline
+    """
+    timeout = timeout or constants.Ping.timeout
+    port = int(port) if port else BEDROCK_PORT
+    loop = asyncio.get_event_loop()
+    try:
+        with upstream():
+            info = await loop.getaddrinfo(
+                address, port, family=socket.AF_INET, type=socket.SOCK_DGRAM
+            )
+            protocol = await bedrock_protocol()
+            pong, latency = await protocol.ping(
+                info[0][4], timeout, constants.Ping.retries
+            )
+        data = parse_pong(pong)
+    except (asyncio.TimeoutError, OSError, ProtocolError, ValueError) as e:
+        log.debug(f"Could not ping {address}:{port}: {e!r}")
+        return False
+    data["latency"] = round(latency * 1000)
+    return data
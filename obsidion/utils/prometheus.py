@@ -0,0 +1,235 @@
+"""
+Prometheus metrics, served over http for scraping.
+
+`PrometheusClient` has the interface of the statsd client, so it is a drop in
+replacement for `bot.stats`: counters, gauges and timers are kept in process
+and served from `/metrics` in the Prometheus text format. Recording a metric
+is a dict lookup and an addition (a bisect for timers), there is no lock as
+every metric is recorded from the event loop.
+
+The dotted statsd names are turned into Prometheus metrics with labels by
+`RULES`, e.g. `commands.info.upstream` becomes
+`obsidion_command_duration_seconds{command="info",phase="upstream"}`.
+"""
+
+import logging
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+from statsd.client.base import StatsClientBase
+
+log = logging.getLogger(__name__)
+
+__all__ = ["PrometheusClient"]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# upper bounds of the timer buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (pattern of the statsd name, metric name, scale of the value), the named groups of the
+# pattern become labels, except for `metric` which is put in the metric name.
+# Timers and latencies are in milliseconds in statsd, and seconds here.
+RULES = [
+    (r"commands\.(?P<command>[^.]+)", "commands", 1),
+    (
+        r"commands\.(?P<command>[^.]+)\.(?P<phase>queue|upstream|send|render|total)",
+        "command_duration_seconds",
+        0.001,
+    ),
+    (r"http\.(?P<host>[^.]+)\.latency", "http_request_duration_seconds", 0.001),
+    (r"http\.(?P<host>[^.]+)\.(?P<metric>\w+)", "http_{metric}", 1),
+    (r"cache\.(?P<namespace>[^.]+)\.hit_ratio", "cache_namespace_hit_ratio", 1),
+    (r"shards\.(?P<shard>\d+)\.latency", "shard_latency_seconds", 0.001),
+    (r"pools\.(?P<pool>[^.]+)\.up", "pool_up", 1),
+    (r"pools\.(?P<pool>[^.]+)\.(?P<metric>\w+)", "pool_connections_{metric}", 1),
+    (r"errors\.(?P<error>\w+)", "errors", 1),
+    (r"upload_bytes\.(?P<command>[^.]+)", "upload_bytes", 1),
+    (r"loop\.lag", "loop_lag_seconds", 0.001),
+    (
+        r"startup\.(?P<extension>[^.]+)\.(?P<phase>import|setup)",
+        "extension_load_seconds",
+        0.001,
+    ),
+    (r"loop\.blocked\.(?P<cog>[^.]+)\.(?P<command>[^.]+)", "loop_blocked", 1),
+]
+RULES = [(re.compile(pattern), name, scale) for pattern, name, scale in RULES]
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+class Series:
+    """A statsd name resolved to a Prometheus metric name and labels."""
+
+    __slots__ = ("name", "labels", "scale")
+
+    def __init__(self, name: str, labels: Dict[str, str], scale: float):
+        self.name = name
+        self.labels = ",".join(f'{key}="{escape(v)}"' for key, v in labels.items())
+        self.scale = scale
+
+    def line(self, suffix: str, value: float, extra: str = "") -> str:
+        labels = ",".join(filter(None, (self.labels, extra)))
+        if labels:
+            return f"{self.name}{suffix}{{{labels}}} {value!r}"
+        return f"{self.name}{suffix} {value!r}"
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        # the last bucket is +Inf
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class PrometheusClient(StatsClientBase):
+    """A statsd compatible client exposing its metrics at `/metrics`.
+
+    Args:
+        host (str): address to serve the metrics on
+        port (int): port to serve the metrics on
+        prefix (str, optional): prefix of every metric name. Defaults to None.
+        enabled (bool, optional): whether to serve the metrics at all.
+            Defaults to True.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        prefix: Optional[str] = None,
+        enabled: bool = True,
+    ):
+        self._host = host
+        self._port = port
+        self._prefix = re.sub(r"\W", "_", prefix) + "_" if prefix else ""
+        self.enabled = enabled
+        self._runner: Optional[web.AppRunner] = None
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._series: Dict[str, Series] = {}
+
+    def resolve(self, stat: str, timer: bool = False) -> Series:
+        """Find the metric name and labels of a statsd name."""
+        series = self._series.get(stat)
+        if series is not None:
+            return series
+        for pattern, name, scale in RULES:
+            match = pattern.fullmatch(stat)
+            if match:
+                labels = match.groupdict()
+                name = name.format(metric=labels.pop("metric", ""))
+                break
+        else:
+            labels, name, scale = {}, re.sub(r"\W", "_", stat), 1
+            if timer:
+                name, scale = f"{name}_seconds", 0.001
+        series = self._series[stat] = Series(self._prefix + name, labels, scale)
+        return series
+
+    # the sample rate is ignored, recording a metric is cheaper than sampling it
+
+    def incr(self, stat: str, count: float = 1, rate: float = 1) -> None:
+        self._counters[stat] += count
+
+    def gauge(
+        self, stat: str, value: float, rate: float = 1, delta: bool = False
+    ) -> None:
+        if delta:
+            value += self._gauges.get(stat, 0)
+        self._gauges[stat] = value
+
+    def timing(self, stat: str, delta: float, rate: float = 1) -> None:
+        if isinstance(delta, timedelta):
+            delta = delta.total_seconds() * 1000
+        histogram = self._histograms.get(stat)
+        if histogram is None:
+            histogram = self._histograms[stat] = Histogram()
+        histogram.observe(delta * self.resolve(stat, timer=True).scale)
+
+    def _send(self, data: str) -> None:
+        # sets have no Prometheus equivalent, and are dropped
+        pass
+
+    def pipeline(self) -> "PrometheusClient":
+        # metrics are not sent anywhere, so there is nothing to batch
+        return self
+
+    def __enter__(self) -> "PrometheusClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+    def render(self) -> str:
+        """The current value of every metric, in the Prometheus text format."""
+        metrics: Dict[str, Tuple[str, List[str]]] = {}
+
+        def lines(series: Series, kind: str) -> List[str]:
+            if series.name not in metrics:
+                metrics[series.name] = (kind, [])
+            return metrics[series.name][1]
+
+        for stat, value in list(self._counters.items()):
+            series = self.resolve(stat)
+            lines(series, "counter").append(series.line("_total", value))
+        for stat, value in list(self._gauges.items()):
+            series = self.resolve(stat)
+            lines(series, "gauge").append(series.line("", value * series.scale))
+        for stat, histogram in list(self._histograms.items()):
+            series = self.resolve(stat)
+            out = lines(series, "histogram")
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                cumulative += count
+                out.append(series.line("_bucket", cumulative, f'le="{bound}"'))
+            out.append(series.line("_sum", histogram.sum))
+            out.append(series.line("_count", histogram.count))
+
+        body = []
+        for name, (kind, samples) in sorted(metrics.items()):
+            suffix = "_total" if kind == "counter" else ""
+            body.append(f"# TYPE {name}{suffix} {kind}")
+            body.extend(samples)
+        return "\n".join(body) + "\n"
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            body=self.render().encode(), headers={"Content-Type": CONTENT_TYPE}
+        )
+
+    async def create_socket(self) -> None:
+        """Start serving the metrics, they are still recorded until it starts."""
+        if not self.enabled or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self._host, self._port).start()
+        except OSError:
+            log.exception(f"Could not serve the metrics on port {self._port}.")
+        else:
+            log.info(f"Serving metrics on {self._host}:{self._port}/metrics.")
+
+    async def close(self) -> None:
+        """Stop serving the metrics."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,158 @@
+"""
+Asynchronous statsd client.
+
+Metrics are buffered and sent as multi-metric packets (one metric per line),
+either once the buffer fills a packet or `stats.flush_interval` seconds after
+the first buffered metric. Recording a metric on the hot path costs formatting
+a string and appending it to a list, and no socket call.
+"""
+
+import asyncio
+import logging
+import socket
+import time
+from types import SimpleNamespace
+from typing import List, Optional
+
+import aiohttp
+from statsd.client.base import StatsClientBase
+from statsd.client.udp import Pipeline
+
+from obsidion.utils.context import current_context
+
+log = logging.getLogger(__name__)
+
+__all__ = ["AsyncStatsClient", "http_trace_config"]
+
+
+class AsyncStatsClient(StatsClientBase):
+    """A statsd client sending batched metrics over a non-blocking UDP socket.
+
+    Args:
+        loop (asyncio.AbstractEventLoop): loop to send from
+        host (str): statsd host
+        port (int, optional): statsd port. Defaults to 8125.
+        prefix (str, optional): prefix of every metric. Defaults to None.
+        enabled (bool, optional): whether to send anything at all, when False
+            every metric is dropped. Defaults to True.
+        max_packet_size (int, optional): largest packet to send, in bytes.
+            Defaults to 1432, which fits an ethernet frame.
+        flush_interval (float, optional): seconds a metric may stay buffered.
+            Defaults to 1.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        host: str,
+        port: int = 8125,
+        prefix: Optional[str] = None,
+        enabled: bool = True,
+        max_packet_size: int = 1432,
+        flush_interval: float = 1.0,
+    ):
+        self._loop = loop
+        self._host = host
+        self._port = port
+        self._prefix = prefix
+        self._maxudpsize = max_packet_size
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._buffer: List[str] = []
+        self._buffered = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    async def create_socket(self) -> None:
+        """Open the UDP socket, metrics are dropped until it is open."""
+        if not self.enabled or self._transport is not None:
+            return
+        try:
+            self._transport, _ = await self._loop.create_datagram_endpoint(
+                asyncio.DatagramProtocol,
+                family=socket.AF_INET,
+                remote_addr=(self._host, self._port),
+            )
+        except OSError:
+            log.exception(f"Could not open the statsd socket to {self._host}.")
+
+    def _send(self, data: str) -> None:
+        if self._transport is None:
+            return
+        self._buffer.append(data)
+        self._buffered += len(data) + 1
+        if self._buffered >= self._maxudpsize:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(self.flush_interval, self.flush)
+
+    def flush(self) -> None:
+        """Send every buffered metric, packed into as few packets as possible."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._buffer or self._transport is None:
+            return
+
+        packet = self._buffer[0]
+        for data in self._buffer[1:]:
+            if len(packet) + len(data) + 1 > self._maxudpsize:
+                self._sendto(packet)
+                packet = data
+            else:
+                packet += "\n" + data
+        self._sendto(packet)
+        self._buffer.clear()
+        self._buffered = 0
+
+    def _sendto(self, packet: str) -> None:
+        try:
+            self._transport.sendto(packet.encode("ascii"))
+        except OSError:
+            # statsd is best effort, never let it break the bot
+            pass
+
+    def pipeline(self) -> Pipeline:
+        return Pipeline(self)
+
+    async def close(self) -> None:
+        """Flush the buffered metrics and close the socket."""
+        self.flush()
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+
+def http_trace_config(stats: AsyncStatsClient) -> aiohttp.TraceConfig:
+    """Time requests per host, and count them as upstream time of the command."""
+
+    async def on_request_start(
+        session: aiohttp.ClientSession,
+        ctx: SimpleNamespace,
+        params: aiohttp.TraceRequestStartParams,
+    ) -> None:
+        # also sent again for every redirect, the request is timed as a whole
+        if getattr(ctx, "started", None) is not None:
+            return
+        ctx.started = time.perf_counter()
+        ctx.host = params.url.host.replace(".", "_")
+        ctx.command = current_context.get()
+        if ctx.command is not None:
+            ctx.command.upstream_started()
+
+    async def on_request_done(
+        session: aiohttp.ClientSession, ctx: SimpleNamespace, params
+    ) -> None:
+        started = getattr(ctx, "started", None)
+        if started is None:
+            return
+        ctx.started = None
+        stats.timing(f"http.{ctx.host}.latency", (time.perf_counter() - started) * 1000)
+        if ctx.command is not None:
+            ctx.command.upstream_finished()
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_done)
+    trace_config.on_request_exception.append(on_request_done)
+    return trace_config
@@ -1,6 +1,25 @@
+import asyncio
+import logging
+
+from obsidion.utils.http import fetch
+
+log = logging.getLogger(__name__)
+
+
+def log_task_errors(task: asyncio.Task) -> None:
+    """Done callback logging the exception a background task failed with.
+
+    Nothing awaits background tasks, so their exceptions would otherwise be lost.
+    """
+    if not task.cancelled() and task.exception() is not None:
+        log.error(f"Background task {task!r} failed.", exc_info=task.exception())
+
+
 async def get(session, url: str, params: dict = None, json: dict = None) -> dict:
     """Get the json from a webpage.
 
+    The request uses the timeout, retries and circuit breaker of the url's host.
+
     Args:
         session ([type]): aiohttp session to use
         url (str): url of restapi
@@ -10,34 +29,7 @@ async def get(session, url: str, params: dict = None, json: dict = None) -> dict
     Returns:
         dict: [description]
     """
-    async with session.get(url, params=params, json=json) as resp:
-        if resp.status == 200:
-            data = await resp.json()
-            return data
-        return False
-
-
-async def usernameToUUID(username: str, session) -> str:
-    """Takes in an mc username and tries to convert it to a mc uuid.
-
-    Args:
-        username (str): username of player which uuid will be from
-        session ([type]): aiohttp session
-
-    Returns:
-        str: uuid of player
-    """
-
-    response = await session.post(
-        "https://api.mojang.com/profiles/minecraft", json=[username]
-    )
-
-    data = await response.json()
-
-    if response.status == 204 or data == []:
-        return False
-
-    return data[0]["id"]
+    return await fetch(session, url, params=params, json=json)
 
 
 async def UUIDToUsername(uuid: str, session) -> str:
@@ -51,12 +43,12 @@ async def UUIDToUsername(uuid: str, session) -> str:
         str: username of player from uuid
     """
 
-    data = await session.get(f"https://api.mojang.com/user/profiles/{uuid}/names")
-
-    if data.status == 204:
-        return False
-
-    data = await data.json()
+    async with session.get(
+        f"https://api.mojang.com/user/profiles/{uuid}/names"
+    ) as response:
+        if response.status == 204:
+            return False
+        data = await response.json()
 
     if not data:
         return False
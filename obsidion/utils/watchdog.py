@@ -0,0 +1,120 @@
+"""
+Event loop watchdog.
+
+A heartbeat coroutine wakes up every `watchdog.interval` seconds and reports
+how late it woke up as the loop lag. A thread watches the heartbeat, and when
+it stops for longer than `watchdog.threshold` seconds, something is blocking
+the loop: the thread logs the stack of the loop's thread while it is still
+blocked, with the command and cog it is running, so the blocking code can be
+found. This works without running the loop in asyncio's (slow) debug mode.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, Optional, Tuple
+
+from discord.ext import commands
+
+from obsidion import constants
+
+log = logging.getLogger(__name__)
+
+__all__ = ["Watchdog"]
+
+
+def find_cog(frame) -> Optional[str]:
+    """Name of the innermost cog with a method on the stack."""
+    while frame is not None:
+        owner = frame.f_locals.get("self")
+        if isinstance(owner, commands.Cog):
+            return owner.qualified_name
+        frame = frame.f_back
+    return None
+
+
+class Watchdog:
+    """Measures the lag of the bot's event loop, and reports what blocks it.
+
+    Args:
+        bot (Obsidion): bot whose loop to watch
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.interval = constants.Watchdog.interval
+        self.threshold = constants.Watchdog.threshold
+        # command being run by each task, to know what is blocking the loop
+        self.commands: Dict[asyncio.Task, commands.Context] = {}
+        self._beat = 0.0
+        self._reported = 0.0
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """Start watching the loop, must be called from the loop."""
+        if not constants.Watchdog.enabled or self._task is not None:
+            return
+        loop = self.bot.loop
+        if constants.Watchdog.asyncio_debug:
+            # also have asyncio log every slow callback, at a cost to every callback
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = loop.create_task(self.heartbeat())
+        threading.Thread(target=self.watch, name="watchdog", daemon=True).start()
+
+    def stop(self) -> None:
+        """Stop watching the loop."""
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def heartbeat(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - start - self.interval, 0.0)
+            self._beat = time.monotonic()
+            self.bot.stats.timing("loop.lag", lag * 1000)
+            if lag > self.threshold:
+                log.info(f"The event loop was blocked for {lag:.2f}s.")
+
+    def watch(self) -> None:
+        while not self._stopped.wait(self.interval / 2):
+            beat = self._beat
+            blocked = time.monotonic() - beat - self.interval
+            # report every block once, while it is still blocking
+            if blocked > self.threshold and self._reported != beat:
+                self._reported = beat
+                self.report(blocked)
+
+    def report(self, blocked: float) -> None:
+        """Log what the loop's thread is running, called from the watchdog thread."""
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return
+        command, cog = self.blame(frame)
+        stack = "".join(traceback.format_stack(frame))
+        log.warning(
+            f"The event loop has been blocked for {blocked:.2f}s in the command {command} "
+            f"of the cog {cog}:\n{stack}"
+        )
+        stat = f"loop.blocked.{cog}.{command}".replace(" ", "_")
+        self.bot.loop.call_soon_threadsafe(self.bot.stats.incr, stat)
+
+    def blame(self, frame) -> Tuple[str, str]:
+        """The command and cog running in the frame, or unknown."""
+        task = asyncio.current_task(self.bot.loop)
+        ctx = self.commands.get(task)
+        if ctx is not None and ctx.command is not None:
+            return ctx.command.qualified_name, ctx.command.cog_name or "none"
+        return "unknown", find_cog(frame) or "unknown"
@@ -0,0 +1,5 @@
+"""
+Benchmarks of the performance work, run from the root of the repository with
+`python -m tests.benchmarks.<name>`. Each prints its measurements, run one with
+`--help` for its options.
+"""
@@ -0,0 +1,71 @@
+"""
+Upstream requests made by concurrent identical lookups.
+
+Fires `--requests` lookups of the same (uncached) player at once, spread over
+`--shards` shards sharing one fake redis, and counts how many of them reach the
+upstream. "before" is the lookup the servers cog used to do (EXISTS, then GET or
+scrape and SET), "after" is `Cache.get_or_fetch`.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import fakeredis
+import fakeredis.aioredis
+
+from tests.helpers import FakeBot, counting_fetch
+
+KEY = "blocksmc_notch"
+VALUE = {"rank": "VIP", "timeplayed": "12h", "game_stats": []}
+
+
+async def uncoalesced(redis, fetch) -> dict:
+    if await redis.exists(KEY):
+        return json.loads(await redis.get(KEY))
+    value = await fetch()
+    await redis.set(KEY, json.dumps(value), expire=60)
+    return value
+
+
+async def run(requests: int, shards: int, latency: float, coalesce: bool) -> tuple:
+    server = fakeredis.FakeServer()
+    bots = [
+        FakeBot(await fakeredis.aioredis.create_redis_pool(server=server))
+        for _ in range(shards)
+    ]
+    fetch = counting_fetch(VALUE, latency)
+
+    def lookup(bot: FakeBot):
+        if coalesce:
+            return bot.cache.get_or_fetch(KEY, fetch, ttl=60)
+        return uncoalesced(bot.redis_session, fetch)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(lookup(bots[i % shards]) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    for bot in bots:
+        bot.redis_session.close()
+    return fetch.calls, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="seconds an upstream fetch takes"
+    )
+    args = parser.parse_args()
+
+    print(f"{args.requests} concurrent lookups of one key on {args.shards} shard(s)")
+    for name, coalesce in (("before", False), ("after", True)):
+        calls, elapsed = asyncio.run(
+            run(args.requests, args.shards, args.latency, coalesce)
+        )
+        print(f"{name:>6}: {calls:>5} upstream requests in {elapsed * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
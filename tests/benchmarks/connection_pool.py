@@ -0,0 +1,61 @@
+"""
+Connection reuse of the upstream session under sustained load.
+
+Sends `--requests` GETs through `fetch` and the bot's upstream session to a
+local stub server, `--concurrency` at a time, and reports the throughput, how
+many connections were opened for them and whether any socket outlives the
+session (Linux only).
+"""
+
+import argparse
+import asyncio
+import time
+
+from obsidion.utils.http import HostLimiter, fetch
+from tests.helpers import close_bot, create_bot, open_sockets, serve
+from tests.test_http import ok, track_connections
+
+
+async def run(requests: int, concurrency: int) -> None:
+    sockets = open_sockets()
+    bot = await create_bot()
+    opened = track_connections(bot.http_session)
+    async with serve(ok) as url:
+        # the stub has no rate limit, only cap the requests in flight
+        limiter = HostLimiter("127.0.0.1", 10**9, 1, concurrency)
+        bot.rate_limiter.limiters["127.0.0.1"] = limiter
+        queue = iter(range(requests))
+        peak = 0
+
+        async def worker():
+            nonlocal peak
+            for i in queue:
+                await fetch(bot.http_session, f"{url}/{i}")
+                if i % 1000 == 0:
+                    peak = max(peak, open_sockets() - sockets)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    await close_bot(bot)
+    await asyncio.sleep(0)
+
+    print(f"{requests} requests in {elapsed:.1f}s ({requests / elapsed:.0f}/s)")
+    print(
+        f"connections opened: {len(opened)} ({requests / len(opened):.0f} requests each)"
+    )
+    print(
+        f"peak sockets open: {peak}, left open after closing: {open_sockets() - sockets}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100_000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
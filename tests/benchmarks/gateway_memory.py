@@ -0,0 +1,187 @@
+"""
+Memory the client state takes per 1,000 guilds.
+
+Replays a GUILD_CREATE for each of `--guilds` guilds and then
+`--messages-per-guild` MESSAGE_CREATEs per guild into a discord.py
+`ConnectionState`, with the intents of the launcher, and reports the growth
+of the resident set (Linux only). "defaults" leaves the cache options at
+discord.py's defaults, "lean" uses the options `create_bot` passes. Every
+profile is replayed in a fresh process.
+"""
+
+import argparse
+import asyncio
+import subprocess
+import sys
+
+import discord
+from discord.state import ConnectionState
+
+BOT_ID = 10**17
+PROFILES = {
+    "defaults": {},
+    "lean": {
+        "max_messages": None,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": False,
+    },
+}
+
+
+def rss() -> int:
+    """Resident set size of the process in bytes, 0 where it is unknown."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * 4096
+    except OSError:
+        return 0
+
+
+def user(user_id: int) -> dict:
+    return {
+        "id": str(user_id),
+        "username": f"user{user_id}",
+        "discriminator": "0001",
+        "avatar": "a" * 32,
+        "bot": user_id == BOT_ID,
+    }
+
+
+def member(user_id: int) -> dict:
+    return {
+        "user": user(user_id),
+        "roles": [],
+        "joined_at": "2020-01-01T00:00:00.000000+00:00",
+        "deaf": False,
+        "mute": False,
+    }
+
+
+def guild_create(guild_id: int, members: int) -> dict:
+    base = guild_id * 1000
+    return {
+        "id": str(guild_id),
+        "name": f"guild {guild_id}",
+        "owner_id": str(base + 1),
+        "region": "europe",
+        "member_count": 500,
+        "roles": [
+            {
+                "id": str(guild_id if i == 0 else base + 100 + i),
+                "name": f"role {i}",
+                "permissions": "104324673",
+                "position": i,
+                "color": 0,
+                "hoist": False,
+                "managed": False,
+                "mentionable": False,
+            }
+            for i in range(10)
+        ],
+        "channels": [
+            {
+                "id": str(base + 200 + i),
+                "type": 0,
+                "name": f"channel-{i}",
+                "position": i,
+                "permission_overwrites": [],
+                "topic": "a channel",
+                "nsfw": False,
+            }
+            for i in range(20)
+        ],
+        "emojis": [],
+        # the bot, and the members discord sends without the members intent
+        "members": [member(BOT_ID)] + [member(base + i) for i in range(1, members)],
+        "voice_states": [],
+        "presences": [],
+        "features": [],
+    }
+
+
+def message_create(guild_id: int, message_id: int) -> dict:
+    base = guild_id * 1000
+    author = base + 1 + message_id % 50
+    return {
+        "id": str(message_id),
+        "channel_id": str(base + 200 + message_id % 20),
+        "guild_id": str(guild_id),
+        "author": user(author),
+        "member": {k: v for k, v in member(author).items() if k != "user"},
+        "content": "anyone on the server? " * 3,
+        "timestamp": "2021-01-01T00:00:00.000000+00:00",
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+    }
+
+
+def replay(profile: str, guilds: int, messages: int, members: int) -> tuple:
+    """Resident set growth after the guilds and after the messages, in bytes."""
+    loop = asyncio.new_event_loop()
+    intents = discord.Intents.none()
+    intents.messages = True
+    intents.guilds = True
+    state = ConnectionState(
+        dispatch=lambda *args: None,
+        handlers={},
+        hooks={},
+        syncer=None,
+        http=None,
+        loop=loop,
+        intents=intents,
+        **PROFILES[profile],
+    )
+    state.user = discord.ClientUser(state=state, data=user(BOT_ID))
+    start = rss()
+    for guild_id in range(1, guilds + 1):
+        state.parse_guild_create(guild_create(guild_id, members))
+    after_guilds = rss()
+    message_id = 0
+    for _ in range(messages):
+        for guild_id in range(1, guilds + 1):
+            message_id += 1
+            state.parse_message_create(message_create(guild_id, message_id))
+    return after_guilds - start, rss() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=5000)
+    parser.add_argument("--messages-per-guild", type=int, default=20)
+    parser.add_argument("--members", type=int, default=25)
+    parser.add_argument("--replay", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.replay:
+        print(*replay(args.replay, args.guilds, args.messages_per_guild, args.members))
+        return
+
+    print(
+        f"{args.guilds} guilds, {args.messages_per_guild} messages per guild, "
+        f"{args.members} members in each GUILD_CREATE"
+    )
+    print(f"{'profile':<10}{'guilds':>14}{'+ messages':>14}")
+    for profile in PROFILES:
+        output = subprocess.run(
+            [sys.executable, "-m", __spec__.name, "--replay", profile]
+            + ["--guilds", str(args.guilds)]
+            + ["--messages-per-guild", str(args.messages_per_guild)]
+            + ["--members", str(args.members)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        per_guilds = [int(size) / args.guilds * 1000 / 2**20 for size in output.split()]
+        print(f"{profile:<10}" + "".join(f"{size:>10.1f}MiB" for size in per_guilds))
+    print("(resident set growth per 1,000 guilds)")
+
+
+if __name__ == "__main__":
+    main()
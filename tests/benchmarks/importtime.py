@@ -0,0 +1,83 @@
+"""
+Import time of the launcher and the extensions.
+
+Imports `obsidion.launcher` and every extension of `EXTENSIONS` in a fresh
+interpreter with `-X importtime`, reports the total and the packages taking
+the longest, and exits with an error when the total is above `--target`
+milliseconds (the best of `--repeat` runs) or when one of the modules
+deferred to their first use was imported.
+"""
+
+import argparse
+import subprocess
+import sys
+from collections import Counter
+
+# total import time (ms) above which the benchmark fails, measured at ~440ms
+TARGET = 650
+# modules which are only imported when first used
+DEFERRED = (
+    "lxml",
+    "aiohypixel",
+    "fuzzywuzzy",
+    "fakeredis",
+    "obsidion.cogs.servers.scraper",
+)
+
+IMPORT = """
+import importlib
+
+from obsidion.launcher import EXTENSIONS
+
+for name in EXTENSIONS:
+    importlib.import_module(name)
+"""
+
+
+def importtime() -> list:
+    """(module, self µs, cumulative µs) of every module imported."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        modules.append((name.strip(), int(own), int(cumulative)))
+    return modules
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target", type=float, default=TARGET)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [importtime() for _ in range(args.repeat)]
+    modules = min(runs, key=lambda run: sum(own for _, own, _ in run))
+    total = sum(own for _, own, _ in modules) / 1000
+
+    # the time of each top level package, including what it imports
+    packages = Counter()
+    for name, own, _ in modules:
+        packages[name.split(".")[0]] += own
+    print(f"{'package':<24}{'ms':>8}")
+    for package, own in packages.most_common(args.top):
+        print(f"{package:<24}{own / 1000:>8.1f}")
+    print(f"{'total':<24}{total:>8.1f} (target {args.target:.0f})")
+
+    imported = {name for name, _, _ in modules}
+    deferred = [name for name in DEFERRED if name in imported]
+    if deferred:
+        sys.exit(f"imported at startup: {', '.join(deferred)}")
+    if total > args.target:
+        sys.exit(f"importing took {total:.0f}ms, more than {args.target:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
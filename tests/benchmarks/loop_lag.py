@@ -0,0 +1,76 @@
+"""
+Event loop lag while scraped pages are parsed.
+
+Parses `--pages` saved player pages, `--concurrency` at a time, while a
+heartbeat measures how late the loop wakes it up. "before" parses every page
+on the event loop, "after" sends them to the parser process pool like the
+servers cog does.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from obsidion.cogs.servers import scraper, utils
+from tests.helpers import fixture
+
+SITES = ("blocksmc", "universocraft", "minesaga", "gommehd", "veltpvp")
+# how often the heartbeat wakes up (seconds)
+INTERVAL = 0.005
+
+
+async def heartbeat(lags: list, stop: asyncio.Event) -> None:
+    loop = asyncio.get_event_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(INTERVAL)
+        lags.append(max(loop.time() - start - INTERVAL, 0.0))
+
+
+async def run(pages: int, concurrency: int, offload: bool) -> list:
+    html = {site: fixture(f"{site}.html") for site in SITES}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def scrape(i: int):
+        site = SITES[i % len(SITES)]
+        async with semaphore:
+            # stands in for the request of the page
+            await asyncio.sleep(0.001)
+            if offload:
+                return await utils.parse(f"parse_{site}", html[site])
+            return getattr(scraper, f"parse_{site}")(html[site])
+
+    if offload:
+        # start the workers before measuring, like a warm bot
+        await asyncio.gather(*(scrape(i) for i in range(len(SITES))))
+    lags, stop = [], asyncio.Event()
+    beat = asyncio.ensure_future(heartbeat(lags, stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(scrape(i) for i in range(pages)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    utils.shutdown_parser_pool()
+    return lags, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{args.pages} pages, {args.concurrency} at a time")
+    for name, offload in (("before", False), ("after", True)):
+        lags, elapsed = asyncio.run(run(args.pages, args.concurrency, offload))
+        lags = sorted(lag * 1000 for lag in lags)
+        print(
+            f"{name:>6}: loop lag mean {statistics.mean(lags):.2f}ms, "
+            f"p99 {lags[int(len(lags) * 0.99)]:.2f}ms, max {lags[-1]:.2f}ms "
+            f"(pages parsed in {elapsed:.1f}s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
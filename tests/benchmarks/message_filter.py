@@ -0,0 +1,70 @@
+"""
+CPU time per message of the command handling.
+
+Feeds `--messages` synthetic chat messages, spread over `--guilds` guilds of
+which one in ten has a custom prefix, through `process_commands`. "before"
+builds a context for every message like `commands.Bot.process_commands`,
+"after" drops the messages `could_be_command` rules out first. The messages
+are ordinary chat, as almost everything the bot receives is.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+from discord.ext import commands
+
+from tests.helpers import close_bot, create_bot, message
+
+BOT_ID = 1234
+WORDS = ("gg", "anyone on", "the server is down", "lol", "where is the portal")
+
+
+def messages(count: int, guilds: int) -> list:
+    rng = random.Random(0)
+    return [
+        message(
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 8))),
+            guild_id=rng.randrange(guilds),
+        )
+        for _ in range(count)
+    ]
+
+
+async def run(count: int, guilds: int) -> dict:
+    bot = await create_bot()
+    bot._connection.user = SimpleNamespace(id=BOT_ID, mention=f"<@{BOT_ID}>")
+    bot.prefixes.update((guild_id, "!") for guild_id in range(0, guilds, 10))
+    chat = messages(count, guilds)
+    timings = {}
+    try:
+        for name, process in (
+            ("before", lambda msg: commands.Bot.process_commands(bot, msg)),
+            ("after", bot.process_commands),
+        ):
+            start = time.process_time()
+            for msg in chat:
+                await process(msg)
+            timings[name] = (time.process_time() - start) / count
+    finally:
+        await close_bot(bot)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--guilds", type=int, default=10_000)
+    args = parser.parse_args()
+
+    timings = asyncio.run(run(args.messages, args.guilds))
+    print(f"{args.messages} messages in {args.guilds} guilds")
+    for name, seconds in timings.items():
+        print(f"{name:>6}: {seconds * 10**6:.2f}µs of CPU per message")
+    print(f"{timings['before'] / timings['after']:.1f}x less CPU per message")
+
+
+if __name__ == "__main__":
+    main()
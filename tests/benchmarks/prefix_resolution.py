@@ -0,0 +1,81 @@
+"""
+Time to resolve the prefix of a message as the number of guilds grows.
+
+Fills `bot.prefixes` like the config cog does with 1,000 to 100,000 guilds
+with a custom prefix, and times `guild_prefix` and `could_be_command` for
+messages from random guilds, along with the memory the prefixes take.
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import timeit
+import tracemalloc
+from types import SimpleNamespace
+
+from obsidion.bot import guild_prefix
+from tests.helpers import close_bot, create_bot, message
+
+BOT_ID = 1234
+GUILDS = (1_000, 10_000, 100_000)
+PREFIXES = ("!", "?", ".", "-", "mc!", "o!")
+
+
+def fill(prefixes: dict, guilds: int) -> None:
+    rng = random.Random(0)
+    for guild_id in range(guilds):
+        # a fresh string each, like the rows postgres returns
+        prefixes[guild_id] = sys.intern("".join(rng.choice(PREFIXES)))
+
+
+def per_call(func, number: int) -> float:
+    """Best time of `func` in nanoseconds."""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 10**9
+
+
+async def run(number: int) -> list:
+    bot = await create_bot()
+    bot._connection.user = SimpleNamespace(id=BOT_ID, mention=f"<@{BOT_ID}>")
+    results = []
+    try:
+        for guilds in GUILDS:
+            bot.prefixes.clear()
+            tracemalloc.start()
+            fill(bot.prefixes, guilds)
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            rng = random.Random(1)
+            messages = iter(
+                [
+                    message("hello", guild_id=rng.randrange(guilds))
+                    for _ in range(number * 5)
+                ]
+            )
+            results.append(
+                (
+                    guilds,
+                    per_call(lambda: guild_prefix(bot, next(messages)), number // 5),
+                    per_call(lambda: bot.could_be_command(next(messages)), number // 5),
+                    size,
+                )
+            )
+    finally:
+        await close_bot(bot)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(f"{'guilds':>8}{'guild_prefix':>15}{'could_be_command':>19}{'memory':>12}")
+    for guilds, prefix, could_be, size in asyncio.run(run(args.number)):
+        print(
+            f"{guilds:>8}{prefix:>13.0f}ns{could_be:>17.0f}ns" f"{size / 1024:>8.0f}KiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Parse time and memory per page of the scrapers.
+
+Parses the saved page of every site with its `Site` spec and reports the time
+per page, and the memory the parsed tree of a page takes (the growth of the
+resident set of a fresh process while `--trees` trees are kept alive, Linux
+only). When BeautifulSoup is installed, building its tree of the page is
+measured too, as a lower bound of what the scrapers cost before.
+"""
+
+import argparse
+import subprocess
+import sys
+import timeit
+
+from lxml import etree
+
+from obsidion.cogs.servers import scraper
+from tests.helpers import fixture
+
+SITES = ("blocksmc", "universocraft", "minesaga", "gommehd", "veltpvp")
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+
+def rss() -> int:
+    """Resident set size of the process in bytes, 0 where it is unknown."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * 4096
+    except OSError:
+        return 0
+
+
+def per_page(func, number: int) -> float:
+    """Best time of `func` in milliseconds."""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1000
+
+
+def build_tree(engine: str, html: str):
+    if engine == "bs4":
+        return BeautifulSoup(html, "lxml")
+    return etree.fromstring(html.encode("utf-8"), scraper._parser)
+
+
+def tree_size(site: str, engine: str, trees: int) -> float:
+    """Kibibytes each tree of the page of `site` takes.
+
+    Measured in a new process, as the memory freed by the previous measurement
+    would be reused.
+    """
+    output = subprocess.run(
+        [sys.executable, "-m", __spec__.name, "--tree-size", site, engine]
+        + ["--trees", str(trees)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return float(output)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument("--trees", type=int, default=200)
+    parser.add_argument("--tree-size", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.tree_size:
+        site, engine = args.tree_size
+        html = fixture(f"{site}.html")
+        start = rss()
+        kept = [build_tree(engine, html) for _ in range(args.trees)]
+        print((rss() - start) / len(kept) / 1024)
+        return
+
+    header = f"{'site':<14}{'size':>8}{'parse':>10}{'tree':>10}"
+    if BeautifulSoup is not None:
+        header += f"{'bs4 tree':>12}{'bs4 size':>10}"
+    print(header)
+    for site in SITES:
+        html = fixture(f"{site}.html")
+        parse = getattr(scraper, f"parse_{site}")
+        row = (
+            f"{site:<14}{len(html.encode('utf-8')) / 1024:>6.1f}KB"
+            f"{per_page(lambda: parse(html), args.number):>8.2f}ms"
+            f"{tree_size(site, 'lxml', args.trees):>7.0f}KiB"
+        )
+        if BeautifulSoup is not None:
+            bs4_time = per_page(lambda: build_tree("bs4", html), args.number // 10)
+            row += (
+                f"{bs4_time:>10.2f}ms"
+                f"{tree_size(site, 'bs4', args.trees // 10):>7.0f}KiB"
+            )
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Shared fixtures of the tests.
+
+The tests run from the root of the repository (the constants are loaded from
+`config-default.yaml` in the working directory), with `python -m pytest`.
+Redis is faked with fakeredis and upstream hosts with local servers, so the
+tests need no network access.
+"""
+
+import asyncio
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+
+from tests.helpers import FakeBot
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+@pytest.fixture
+def redis_server():
+    """A fake redis server, shared by every pool created on it."""
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def bot(loop, redis_server):
+    redis = loop.run_until_complete(
+        fakeredis.aioredis.create_redis_pool(server=redis_server)
+    )
+    bot = FakeBot(redis)
+    yield bot
+    if not redis.closed:
+        redis.close()
+        loop.run_until_complete(redis.wait_closed())
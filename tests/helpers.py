@@ -0,0 +1,140 @@
+"""
+Stand-ins for the bot and the upstream hosts, shared by the tests and the
+benchmarks.
+"""
+
+import asyncio
+import contextlib
+import datetime
+import os
+import socket
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
+from aiohttp import web
+from aiohttp.abc import AbstractResolver
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def fixture(name: str) -> str:
+    """Contents of a saved page in `tests/fixtures`."""
+    return (FIXTURES / name).read_text(encoding="utf-8")
+
+
+class FakeBot:
+    """The parts of `Obsidion` the cache and the utils rely on.
+
+    Args:
+        redis_session (optional): redis pool to use, None to run without redis.
+            Defaults to None.
+    """
+
+    def __init__(self, redis_session=None):
+        from obsidion.utils.cache import Cache
+
+        self.redis_session = redis_session
+        self.redis_ready = asyncio.Event()
+        self.redis_closed = False
+        self.lost = 0
+        if redis_session is not None:
+            self.redis_ready.set()
+        self.cache = Cache(self)
+
+    def redis_lost(self) -> None:
+        self.lost += 1
+        self.redis_ready.clear()
+
+
+def message(content: str, guild_id: Optional[int] = 1, bot: bool = False):
+    """The parts of a `discord.Message` the command handling reads."""
+    return SimpleNamespace(
+        content=content,
+        guild=SimpleNamespace(id=guild_id) if guild_id is not None else None,
+        author=SimpleNamespace(id=42, bot=bot),
+        created_at=datetime.datetime.utcnow(),
+        _state=None,
+    )
+
+
+def counting_fetch(value, delay: float = 0.05):
+    """A fetch returning `value` after `delay`, counting how often it runs."""
+
+    async def fetch():
+        fetch.calls += 1
+        await asyncio.sleep(delay)
+        return value
+
+    fetch.calls = 0
+    return fetch
+
+
+@contextlib.asynccontextmanager
+async def serve(handler, host: str = "127.0.0.1"):
+    """Serve `handler` for every method and path, yielding the base url."""
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, 0).start()
+    try:
+        yield f"http://{host}:{runner.addresses[0][1]}"
+    finally:
+        await runner.cleanup()
+
+
+class StubResolver(AbstractResolver):
+    """Resolves every hostname to a local stub server, so urls are left as is.
+
+    Args:
+        port (int): port of the stub server
+    """
+
+    def __init__(self, port: int):
+        self.port = port
+
+    async def resolve(self, host: str, port: int = 0, family=socket.AF_INET):
+        return [
+            {
+                "hostname": host,
+                "host": "127.0.0.1",
+                "port": self.port,
+                "family": socket.AF_INET,
+                "proto": 0,
+                "flags": socket.AI_NUMERICHOST,
+            }
+        ]
+
+    async def close(self) -> None:
+        pass
+
+
+async def create_bot():
+    """An `Obsidion` with its http sessions, but not logged in."""
+    from obsidion.bot import Obsidion, guild_prefix
+
+    bot = Obsidion(command_prefix=guild_prefix)
+    bot._recreate()
+    return bot
+
+
+async def close_bot(bot) -> None:
+    """Close what `create_bot` opened."""
+    await bot.http_session.close()
+    await bot._connector.close()
+    await bot.http.connector.close()
+    await bot._resolver.close()
+    await bot.stats.close()
+
+
+def open_sockets() -> int:
+    """Number of sockets the process has open (Linux only)."""
+    count = 0
+    for fd in os.listdir("/proc/self/fd"):
+        try:
+            count += os.readlink(f"/proc/self/fd/{fd}").startswith("socket:")
+        except OSError:
+            # closed meanwhile, e.g. the one listing the directory
+            pass
+    return count
@@ -0,0 +1,98 @@
+import datetime
+import time
+from types import SimpleNamespace
+
+from obsidion.bot import guild_prefix
+from tests.helpers import close_bot, create_bot, message
+
+BOT_ID = 1234
+
+
+def test_only_possible_commands_build_a_context(loop):
+    contexts = []
+
+    async def main():
+        bot = await create_bot()
+        get_context = bot.get_context
+
+        async def counting_get_context(message, **kwargs):
+            contexts.append(message.content)
+            return await get_context(message, **kwargs)
+
+        async def invoke(ctx):
+            pass
+
+        bot.get_context = counting_get_context
+        bot.invoke = invoke
+        bot.prefixes[2] = "!"
+        try:
+            # the mention prefixes aren't known before logging in
+            assert bot.could_be_command(message("hello"))
+            bot._connection.user = SimpleNamespace(id=BOT_ID, mention=f"<@{BOT_ID}>")
+            for msg in (
+                message("hello"),
+                message("/help"),
+                message("/help", bot=True),
+                message("!help"),
+                message("!help", guild_id=2),
+                message("/help", guild_id=2),
+                message(f"<@{BOT_ID}> help", guild_id=2),
+                message(f"<@!{BOT_ID}> help"),
+                message(f"<@{BOT_ID}>help"),
+                message("/help", guild_id=None),
+            ):
+                await bot.process_commands(msg)
+        finally:
+            await close_bot(bot)
+
+    loop.run_until_complete(main())
+    assert contexts == [
+        "/help",
+        "!help",
+        f"<@{BOT_ID}> help",
+        f"<@!{BOT_ID}> help",
+        "/help",
+    ]
+
+
+def test_guild_prefix(loop):
+    async def main():
+        bot = await create_bot()
+        bot._connection.user = SimpleNamespace(id=BOT_ID, mention=f"<@{BOT_ID}>")
+        bot.prefixes[2] = "!"
+        try:
+            return [
+                guild_prefix(bot, message("hi", guild_id=guild_id))
+                for guild_id in (1, 2, None)
+            ]
+        finally:
+            await close_bot(bot)
+
+    mentions = [f"<@{BOT_ID}> ", f"<@!{BOT_ID}> "]
+    assert loop.run_until_complete(main()) == [
+        mentions + ["/"],
+        mentions + ["!"],
+        mentions + ["/"],
+    ]
+
+
+def test_queue_time_counts_from_the_message_being_sent(loop):
+    async def main():
+        bot = await create_bot()
+        bot._connection.user = SimpleNamespace(id=BOT_ID, mention=f"<@{BOT_ID}>")
+        try:
+            queued = []
+            for age in (0.5, -2):
+                msg = message("/help")
+                msg.created_at -= datetime.timedelta(seconds=age)
+                ctx = await bot.get_context(msg)
+                ctx.invoked_at = ctx.completed_at = time.perf_counter()
+                queued.append(ctx.timings()["queue"])
+            return queued
+        finally:
+            await close_bot(bot)
+
+    late, early = loop.run_until_complete(main())
+    assert 0.5 <= late < 1
+    # discord's clock running ahead of ours
+    assert 0 <= early < 0.5
@@ -0,0 +1,127 @@
+import asyncio
+
+import fakeredis.aioredis
+
+from obsidion.utils.http import UpstreamUnavailable
+from tests.helpers import FakeBot, counting_fetch
+
+
+def test_concurrent_misses_fetch_once(loop, bot):
+    fetch = counting_fetch({"rank": "VIP"})
+
+    async def main():
+        return await asyncio.gather(
+            *(
+                bot.cache.get_or_fetch("blocksmc_notch", fetch, ttl=60)
+                for _ in range(1000)
+            )
+        )
+
+    results = loop.run_until_complete(main())
+    assert fetch.calls == 1
+    assert all(result == {"rank": "VIP"} for result in results)
+
+
+def test_processes_share_one_fetch(loop, bot, redis_server):
+    # a second shard, with its own local tier and its own connection to redis
+    other = FakeBot(
+        loop.run_until_complete(
+            fakeredis.aioredis.create_redis_pool(server=redis_server)
+        )
+    )
+    fetch = counting_fetch({"rank": "VIP"})
+
+    async def main():
+        return await asyncio.gather(
+            *(
+                cache.get_or_fetch("blocksmc_notch", fetch, ttl=60)
+                for cache in (bot.cache, other.cache)
+                for _ in range(500)
+            )
+        )
+
+    results = loop.run_until_complete(main())
+    assert fetch.calls == 1
+    assert all(result == {"rank": "VIP"} for result in results)
+    other.redis_session.close()
+
+
+def test_hits_skip_the_fetch(loop, bot):
+    fetch = counting_fetch({"rank": "VIP"})
+
+    async def main():
+        await bot.cache.get_or_fetch("blocksmc_notch", fetch, ttl=60)
+        # only the redis tier is left
+        bot.cache.local.clear()
+        return await bot.cache.get_or_fetch("blocksmc_notch", fetch, ttl=60)
+
+    assert loop.run_until_complete(main()) == {"rank": "VIP"}
+    assert fetch.calls == 1
+    assert bot.cache.stats.hits["blocksmc"] == 1
+
+
+def test_not_found_is_cached(loop, bot):
+    fetch = counting_fetch(False)
+
+    async def main():
+        for _ in range(3):
+            assert (
+                await bot.cache.get_or_fetch("blocksmc_nobody", fetch, ttl=60) is False
+            )
+
+    loop.run_until_complete(main())
+    assert fetch.calls == 1
+
+
+def test_stale_copy_when_upstream_is_unavailable(loop, bot):
+    async def unavailable():
+        raise UpstreamUnavailable("blocksmc.com", "status 503")
+
+    async def main():
+        await bot.cache.get_or_fetch(
+            "blocksmc_notch", counting_fetch({"rank": "VIP"}), ttl=60
+        )
+        # expire both tiers
+        await bot.redis_session.delete("blocksmc_notch")
+        bot.cache.local._entries["blocksmc_notch"] = (
+            0.0,
+            *bot.cache.local._entries["blocksmc_notch"][1:],
+        )
+        return await bot.cache.get_or_fetch("blocksmc_notch", unavailable, ttl=60)
+
+    assert loop.run_until_complete(main()) == {"rank": "VIP"}
+    assert bot.cache.stats.stale_hits["blocksmc"] == 1
+
+
+def test_runs_without_redis_when_it_goes_away(loop, bot):
+    fetch = counting_fetch({"rank": "VIP"})
+
+    async def main():
+        bot.redis_session.close()
+        await bot.redis_session.wait_closed()
+        first = await bot.cache.get_or_fetch("blocksmc_notch", fetch, ttl=60)
+        # served from the local tier
+        second = await bot.cache.get_or_fetch("blocksmc_notch", fetch, ttl=60)
+        await bot.cache.invalidate("blocksmc_notch")
+        return first, second
+
+    assert loop.run_until_complete(main()) == ({"rank": "VIP"}, {"rank": "VIP"})
+    assert fetch.calls == 1
+    assert bot.lost == 1
+    assert not bot.cache.available
+
+
+def test_without_redis_concurrent_misses_still_fetch_once(loop):
+    bot = FakeBot()
+    fetch = counting_fetch({"rank": "VIP"})
+
+    async def main():
+        return await asyncio.gather(
+            *(
+                bot.cache.get_or_fetch("blocksmc_notch", fetch, ttl=60)
+                for _ in range(100)
+            )
+        )
+
+    loop.run_until_complete(main())
+    assert fetch.calls == 1
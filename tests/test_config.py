@@ -0,0 +1,134 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from obsidion.cogs.config.config import CHANNEL, config
+
+
+class Connection:
+    """The parts of an asyncpg connection the config cog uses."""
+
+    def __init__(self, rows, notify_during_fetch):
+        self.rows = rows
+        self.listeners = {}
+        self.termination_listeners = []
+        self.closed = False
+        # notifications arriving while the next fetch is in flight
+        self.notify_during_fetch = notify_during_fetch
+
+    async def add_listener(self, channel, callback) -> None:
+        self.listeners[channel] = callback
+
+    async def remove_listener(self, channel, callback) -> None:
+        self.listeners.pop(channel, None)
+
+    def add_termination_listener(self, callback) -> None:
+        self.termination_listeners.append(callback)
+
+    def remove_termination_listener(self, callback) -> None:
+        self.termination_listeners.remove(callback)
+
+    async def execute(self, query, *args) -> None:
+        pass
+
+    async def fetch(self, query):
+        rows = list(self.rows)
+        while self.notify_during_fetch:
+            self.notify(*self.notify_during_fetch.pop(0))
+        return [{"guild_id": guild_id, "prefix": prefix} for guild_id, prefix in rows]
+
+    def is_closed(self) -> bool:
+        return self.closed
+
+    def notify(self, guild_id: int, prefix: str) -> None:
+        payload = json.dumps({"guild_id": guild_id, "prefix": prefix})
+        self.listeners[CHANNEL](self, 1, CHANNEL, payload)
+
+    def terminate(self) -> None:
+        self.closed = True
+        for callback in self.termination_listeners:
+            callback(self)
+
+
+class Pool:
+    def __init__(self, rows):
+        self.rows = rows
+        self.acquired = []
+        self.released = []
+        self.notify_during_fetch = []
+
+    async def acquire(self) -> Connection:
+        self.acquired.append(Connection(self.rows, self.notify_during_fetch))
+        return self.acquired[-1]
+
+    async def release(self, conn) -> None:
+        self.released.append(conn)
+
+
+def test_prefixes_follow_the_database(loop):
+    rows = [(1, "!"), (2, "?"), (3, "!")]
+    db_ready = asyncio.Event()
+    db_ready.set()
+    bot = SimpleNamespace(
+        loop=loop,
+        db_ready=db_ready,
+        db_pool=Pool(rows),
+        prefixes={},
+        # this cluster runs the odd guilds
+        owns_guild=lambda guild_id: guild_id % 2 == 1,
+    )
+
+    async def main():
+        cog = config(bot)
+        await asyncio.sleep(0)
+        assert bot.prefixes == {1: "!", 3: "!"}
+        # the strings are shared
+        assert bot.prefixes[1] is bot.prefixes[3]
+
+        conn = bot.db_pool.acquired[0]
+        conn.notify(5, "$")
+        conn.notify(4, "$")
+        conn.notify(1, "/")
+        assert bot.prefixes == {3: "!", 5: "$"}
+
+        # prefix 3 is reset while the connection is down
+        rows[2] = (5, "$")
+        conn.terminate()
+        await asyncio.sleep(0)
+        assert bot.db_pool.released == [conn]
+        assert bot.prefixes == {1: "!", 5: "$"}
+        assert bot.db_pool.acquired[1].listeners
+        cog.cog_unload()
+        await asyncio.sleep(0)
+
+    loop.run_until_complete(main())
+    assert bot.db_pool.released == bot.db_pool.acquired
+
+
+def test_changes_during_a_reload_are_kept(loop):
+    db_ready = asyncio.Event()
+    db_ready.set()
+    bot = SimpleNamespace(
+        loop=loop,
+        db_ready=db_ready,
+        db_pool=Pool([(1, "!"), (2, "!")]),
+        prefixes={},
+        owns_guild=lambda guild_id: True,
+    )
+    # the rows are read before these changes are committed
+    bot.db_pool.notify_during_fetch.extend([(2, "/"), (3, "?")])
+
+    async def main():
+        cog = config(bot)
+        await asyncio.sleep(0)
+        assert bot.prefixes == {1: "!", 3: "?"}
+
+        bot.db_pool.rows[:] = [(1, "!"), (3, "?")]
+        bot.db_pool.notify_during_fetch.append((1, "$"))
+        bot.db_pool.acquired[0].terminate()
+        await asyncio.sleep(0)
+        assert bot.prefixes == {1: "$", 3: "?"}
+        cog.cog_unload()
+        await asyncio.sleep(0)
+
+    loop.run_until_complete(main())
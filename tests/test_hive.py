@@ -0,0 +1,72 @@
+import datetime
+from collections import Counter
+from types import SimpleNamespace
+
+import aiohttp
+from aiohttp import web
+
+from obsidion.cogs.servers import servers
+from tests.helpers import StubResolver, serve
+
+PLAYER = {
+    "rankName": "Regular Hive Member",
+    "status": {"description": "Currently hibernating in", "game": "the Land of Nod!"},
+    "achievements": {"CHAT_GRAMMAR": {"progress": 1}},
+}
+
+
+class Context:
+    """The parts of `commands.Context` the servers commands use."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.message = SimpleNamespace(created_at=datetime.datetime.utcnow())
+        self.sent = []
+
+    async def trigger_typing(self) -> None:
+        pass
+
+    async def send(self, content=None, *, embed=None) -> None:
+        self.sent.append(embed or content)
+
+
+def test_hive_commands_share_one_request_per_player(loop, bot):
+    requests = Counter()
+
+    async def hive(request: web.Request) -> web.Response:
+        requests[request.path] += 1
+        return web.json_response(PLAYER)
+
+    async def uuid(username):
+        return None
+
+    async def main():
+        async with serve(hive) as url:
+            port = int(url.rsplit(":", 1)[1])
+            connector = aiohttp.TCPConnector(resolver=StubResolver(port))
+            async with aiohttp.ClientSession(connector=connector) as session:
+                bot.http_session = session
+                bot.uuid_resolver = SimpleNamespace(username_to_uuid=uuid)
+                cog = servers(bot)
+                ctx = Context(bot)
+                for command, username in (
+                    (cog.hiverank, "Notch"),
+                    (cog.hivestatus, "Notch"),
+                    (cog.hiverank, "Notch"),
+                    (cog.hivestatus, "jeb_"),
+                    (cog.hiverank, "jeb_"),
+                    (cog.hivestatus, "Notch"),
+                ):
+                    await command.callback(cog, ctx, username)
+                return ctx.sent
+
+    sent = loop.run_until_complete(main())
+    assert requests == {"/v1/player/Notch": 1, "/v1/player/jeb_": 1}
+    assert [embed.fields[0].value for embed in sent] == [
+        "Rank: `Regular Hive Member`",
+        "Description: `Currently hibernating in`",
+        "Rank: `Regular Hive Member`",
+        "Description: `Currently hibernating in`",
+        "Rank: `Regular Hive Member`",
+        "Description: `Currently hibernating in`",
+    ]
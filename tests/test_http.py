@@ -0,0 +1,158 @@
+import asyncio
+import sys
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from obsidion.utils.http import (
+    CircuitBreaker,
+    CircuitOpenError,
+    HostLimiter,
+    UpstreamUnavailable,
+    fetch,
+)
+from tests.helpers import close_bot, create_bot, open_sockets, serve
+
+
+async def ok(request: web.Request) -> web.Response:
+    return web.json_response({"ok": True})
+
+
+def track_connections(session: aiohttp.ClientSession) -> list:
+    """Record every connection the session opens."""
+    opened = []
+
+    async def on_connection_create_end(session, context, params):
+        opened.append(params)
+
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_create_end.append(on_connection_create_end)
+    trace.freeze()
+    session._trace_configs.append(trace)
+    return opened
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="counts the sockets in /proc")
+def test_connections_are_reused_without_leaking(loop):
+    requests, concurrency = 5000, 20
+
+    async def main():
+        sockets = open_sockets()
+        bot = await create_bot()
+        opened = track_connections(bot.http_session)
+        async with serve(ok) as url:
+            limiter = HostLimiter("127.0.0.1", 10**9, 1, concurrency)
+            bot.rate_limiter.limiters["127.0.0.1"] = limiter
+            results = await asyncio.gather(
+                *(fetch(bot.http_session, f"{url}/{i}") for i in range(requests))
+            )
+            assert all(result == {"ok": True} for result in results)
+            # every request was sent on one of the connections kept alive
+            assert len(opened) <= concurrency
+            assert limiter.in_flight == 0
+        await close_bot(bot)
+        await asyncio.sleep(0)
+        return sockets
+
+    sockets = loop.run_until_complete(main())
+    assert open_sockets() <= sockets
+
+
+def test_discord_connections_do_not_starve_upstream_requests(loop):
+    release = asyncio.Event()
+
+    async def stream(request: web.Request) -> web.StreamResponse:
+        if request.path != "/gateway":
+            return await ok(request)
+        # holds its connection open, like a shard's gateway websocket
+        response = web.StreamResponse()
+        await response.prepare(request)
+        await release.wait()
+        return response
+
+    async def main():
+        bot = await create_bot()
+        async with serve(stream) as url:
+            gateway = aiohttp.ClientSession(
+                connector=bot.http.connector, connector_owner=False
+            )
+            shards = [await gateway.get(f"{url}/gateway") for _ in range(11)]
+            try:
+                result = await asyncio.wait_for(
+                    fetch(bot.http_session, f"{url}/status"), 5
+                )
+            finally:
+                release.set()
+                for response in shards:
+                    response.close()
+                await gateway.close()
+        await close_bot(bot)
+        return result
+
+    assert loop.run_until_complete(main()) == {"ok": True}
+
+
+def test_breaker_recovers_from_a_trial_cancelled_by_the_limiter(loop):
+    async def main():
+        bot = await create_bot()
+        async with serve(ok) as url:
+            breaker = bot.circuit_breakers.get("127.0.0.1")
+            breaker.reset_timeout = 0.2
+            for _ in range(breaker.threshold):
+                breaker.failure()
+            await asyncio.sleep(breaker.reset_timeout)
+
+            # the trial is let through the breaker, then waits for a token
+            limiter = HostLimiter("127.0.0.1", 1, 60, 10)
+            limiter.tokens = 0
+            bot.rate_limiter.limiters["127.0.0.1"] = limiter
+            trial = asyncio.ensure_future(fetch(bot.http_session, url))
+            await asyncio.sleep(0.05)
+            assert limiter.waiting == 1
+            trial.cancel()
+            await asyncio.sleep(0)
+
+            bot.rate_limiter.limiters["127.0.0.1"] = HostLimiter(
+                "127.0.0.1", 100, 1, 10
+            )
+            with pytest.raises(CircuitOpenError):
+                await fetch(bot.http_session, url)
+            await asyncio.sleep(breaker.reset_timeout)
+            result = await fetch(bot.http_session, url)
+            state = breaker.state
+        await close_bot(bot)
+        return result, state
+
+    assert loop.run_until_complete(main()) == ({"ok": True}, "closed")
+
+
+def test_a_200_which_is_not_json_is_not_retried(loop):
+    requests = []
+
+    async def page(request: web.Request) -> web.Response:
+        requests.append(request.path)
+        return web.Response(text="<html>maintenance</html>", content_type="text/html")
+
+    async def main():
+        async with serve(page) as url:
+            async with aiohttp.ClientSession() as session:
+                with pytest.raises(UpstreamUnavailable, match="got text/html"):
+                    await fetch(session, url)
+
+    loop.run_until_complete(main())
+    assert len(requests) == 1
+
+
+def test_breaker_gives_up_on_a_trial_which_never_reports_back():
+    breaker = CircuitBreaker("127.0.0.1", threshold=1, reset_timeout=0.05)
+    breaker.failure()
+    time.sleep(0.05)
+    # aiohttp 3.7 fires no trace for a request cancelled before it's sent
+    assert breaker.allow()
+    assert not breaker.allow()
+    time.sleep(0.05)
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == CircuitBreaker.CLOSED
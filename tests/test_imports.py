@@ -0,0 +1,12 @@
+import subprocess
+import sys
+
+from tests.benchmarks.importtime import DEFERRED, IMPORT
+
+
+def test_startup_skips_the_deferred_modules():
+    check = IMPORT + "\nimport sys\nprint(*sorted(sys.modules))"
+    imported = subprocess.run(
+        [sys.executable, "-c", check], check=True, capture_output=True, text=True
+    ).stdout.split()
+    assert [name for name in DEFERRED if name in imported] == []
@@ -0,0 +1,55 @@
+from obsidion.cogs.info.info import info
+
+STATUS = {
+    "players": {"online": 12, "max": 100, "sample": []},
+    "version": {"name": "Paper 1.16.5 " + "x" * 2000},
+    "latency": 20,
+}
+
+
+class Message:
+    def __init__(self, embed):
+        self.embed = embed
+
+    async def edit(self, *, embed) -> None:
+        self.embed = embed
+
+
+class Context:
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, content=None, *, embed=None) -> Message:
+        self.messages.append(Message(embed))
+        return self.messages[-1]
+
+
+def test_servers_are_paginated_under_the_embed_limits(loop, bot):
+    cog = info(bot)
+
+    async def get_java_server(server_ip, port):
+        return False if server_ip.startswith("down") else STATUS
+
+    cog.get_java_server = get_java_server
+    addresses = [f"play{i}.{'long' * 100}.net" for i in range(21)] + [
+        "down.net",
+        "a:b:c",
+    ]
+    ctx = Context()
+    loop.run_until_complete(cog.servers.callback(cog, ctx, *addresses))
+
+    embeds = [message.embed for message in ctx.messages]
+    assert [embed.title for embed in embeds] == [
+        "Java Servers (1/3)",
+        "Java Servers (2/3)",
+        "Java Servers (3/3)",
+    ]
+    assert [len(embed.fields) for embed in embeds] == [10, 10, 3]
+    assert all(len(embed) <= 6000 for embed in embeds)
+    fields = [field for embed in embeds for field in embed.fields]
+    assert all(len(field.name) <= 256 and len(field.value) <= 1024 for field in fields)
+    assert fields[0].value.startswith(":white_check_mark: `12/100` players")
+    assert [field.value for field in fields[-2:]] == [
+        ":x: Not online or cannot be requested",
+        ":x: Not a valid server address",
+    ]
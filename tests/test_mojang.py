@@ -0,0 +1,52 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+from obsidion.utils import mojang
+from obsidion.utils.mojang import UUIDResolver
+from tests.helpers import serve
+
+PROFILES = {
+    "notch": "069a79f444e94726a5befca90e38aaf5",
+    "jeb_": "853c80ef3c3749fdaa49938b674adae6",
+}
+
+
+async def profiles(request: web.Request) -> web.Response:
+    names = await request.json()
+    if any(not mojang.USERNAME.match(name) for name in names):
+        return web.json_response({"error": "IllegalArgumentException"}, status=400)
+    await asyncio.sleep(0.05)
+    return web.json_response(
+        [{"id": PROFILES[name], "name": name} for name in names if name in PROFILES]
+    )
+
+
+def test_invalid_names_dont_fail_the_batch(loop, bot, monkeypatch):
+    async def main():
+        async with serve(profiles) as url:
+            monkeypatch.setattr(mojang, "PROFILES_URL", f"{url}/profiles/minecraft")
+            async with aiohttp.ClientSession() as session:
+                bot.http_session = session
+                resolver = UUIDResolver(bot)
+                # a lookup given up on doesn't affect the rest of its batch
+                cancelled = resolver._enqueue("jeb_")
+                lookups = asyncio.gather(
+                    *(
+                        resolver.username_to_uuid(name)
+                        for name in ("Notch", "not a name", "x" * 17, "", "nobody")
+                    )
+                )
+                await asyncio.sleep(0.02)
+                cancelled.cancel()
+                results = await asyncio.wait_for(lookups, 5)
+                await asyncio.sleep(0)
+                return results, resolver.requests
+
+    errors = []
+    loop.set_exception_handler(lambda loop, context: errors.append(context))
+    results, requests = loop.run_until_complete(main())
+    assert not errors
+    assert results == [PROFILES["notch"], False, False, False, False]
+    assert requests == 1
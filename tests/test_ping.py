@@ -0,0 +1,179 @@
+import asyncio
+import json
+import struct
+
+import pytest
+
+from obsidion.utils import ping
+from obsidion.utils.ping import (
+    RAKNET_MAGIC,
+    UNCONNECTED_PONG,
+    bedrock_status,
+    java_status,
+    pack_packet,
+    pack_string,
+    read_packet,
+)
+
+STATUS = {
+    "version": {"name": "Paper 1.16.5", "protocol": 754},
+    "players": {
+        "max": 100,
+        "online": 2,
+        "sample": [{"name": "§aNotch", "id": "069a79f4-44e9-4726-a5be-fca90e38aaf5"}],
+    },
+    "description": {"text": "§6A ", "extra": [{"text": "Minecraft"}, " Server"]},
+    "favicon": "data:image/png;base64,iVBORw0KGgo=",
+}
+
+
+def status_server(status, answer_ping: bool = True):
+    """Handler of a server answering the status request with `status`."""
+
+    async def handle(reader, writer):
+        try:
+            await read_packet(reader)  # handshake
+            await read_packet(reader)  # status request
+            body = status if isinstance(status, str) else json.dumps(status)
+            writer.write(pack_packet(0x00, pack_string(body)))
+            packet_id, payload = await read_packet(reader)
+            if answer_ping and packet_id == 0x01:
+                writer.write(pack_packet(0x01, payload))
+            await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def legacy_server(reader, writer):
+    """A 1.6 server, which closes the connection on a modern handshake."""
+    try:
+        if (await reader.readexactly(1)) != b"\xfe":
+            return
+        await reader.read(1024)
+        response = "§1\x0078\x001.6.4\x00A §lLegacy§r Server\x003\x0020"
+        writer.write(
+            b"\xff" + struct.pack(">H", len(response)) + response.encode("utf-16-be")
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def java_ping(handler):
+    server = await asyncio.start_server(handler, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        return await java_status("127.0.0.1", port, timeout=2)
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def test_java_status(loop):
+    data = loop.run_until_complete(java_ping(status_server(STATUS)))
+    assert data["description"] == "A Minecraft Server"
+    assert data["players"] == {
+        "online": 2,
+        "max": 100,
+        "sample": [{"name": "Notch", "id": "069a79f4-44e9-4726-a5be-fca90e38aaf5"}],
+    }
+    assert data["version"] == {"name": "Paper 1.16.5", "protocol": 754}
+    assert data["favicon"] == STATUS["favicon"]
+    assert data["latency"] is not None
+
+
+def test_java_status_without_pong(loop):
+    data = loop.run_until_complete(java_ping(status_server(STATUS, answer_ping=False)))
+    assert data["players"]["online"] == 2
+    assert data["latency"] is None
+
+
+def test_java_status_of_a_legacy_server(loop):
+    data = loop.run_until_complete(java_ping(legacy_server))
+    assert data["description"] == "A Legacy Server"
+    assert data["players"] == {"online": 3, "max": 20, "sample": []}
+    assert data["version"] == {"name": "1.6.4", "protocol": 78}
+
+
+@pytest.mark.parametrize(
+    "status, description",
+    [
+        ({"description": ""}, ""),
+        ({"description": {"translate": "multiplayer.status.unknown"}}, ""),
+        ({"players": 5, "version": None, "description": "§cHi"}, "Hi"),
+    ],
+)
+def test_java_status_with_missing_fields(loop, status, description):
+    data = loop.run_until_complete(java_ping(status_server(status)))
+    assert data["description"] == description
+    assert data["players"] == {"online": 0, "max": 0, "sample": []}
+
+
+@pytest.mark.parametrize("status", ["[1, 2]", '"text"', "{not json"])
+def test_java_status_with_invalid_json(loop, status):
+    assert loop.run_until_complete(java_ping(status_server(status))) is False
+
+
+def test_java_status_of_an_offline_server(loop):
+    async def main():
+        # a port nothing listens on
+        server = await asyncio.start_server(lambda r, w: None, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        server.close()
+        await server.wait_closed()
+        return await java_status("127.0.0.1", port, timeout=2)
+
+    assert loop.run_until_complete(main()) is False
+
+
+class BedrockServer(asyncio.DatagramProtocol):
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        token = data[1:9]
+        server_id = (
+            "MCPE;§bBedrock §rServer;422;1.16.201;4;50;1234;Survival World;Survival;1"
+        ).encode("utf-8")
+        self.transport.sendto(
+            bytes([UNCONNECTED_PONG])
+            + token
+            + struct.pack(">q", 1234)
+            + RAKNET_MAGIC
+            + struct.pack(">H", len(server_id))
+            + server_id,
+            addr,
+        )
+
+
+@pytest.fixture
+def bedrock_socket():
+    yield
+    # the shared ping socket belongs to the loop of the test
+    if ping._bedrock is not None:
+        ping._bedrock.transport.close()
+        ping._bedrock = None
+
+
+def test_bedrock_status(loop, bedrock_socket):
+    async def main():
+        transport, _ = await loop.create_datagram_endpoint(
+            BedrockServer, local_addr=("127.0.0.1", 0)
+        )
+        port = transport.get_extra_info("sockname")[1]
+        try:
+            return await bedrock_status("127.0.0.1", port, timeout=2)
+        finally:
+            transport.close()
+
+    data = loop.run_until_complete(main())
+    assert data["motd"] == "Bedrock Server"
+    assert data["players"] == {"online": 4, "max": 50, "names": []}
+    assert data["software"] == {"version": "1.16.201", "protocol": 422}
+    assert data["map"] == "Survival World"
+    assert data["gamemode"] == "Survival"
+    assert data["latency"] is not None
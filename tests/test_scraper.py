@@ -0,0 +1,77 @@
+import pytest
+
+from obsidion.cogs.servers import scraper, utils
+from tests.helpers import fixture
+
+SITES = ("blocksmc", "universocraft", "minesaga", "gommehd", "veltpvp")
+
+
+@pytest.fixture
+def parser_pool():
+    yield
+    utils.shutdown_parser_pool()
+
+
+def test_pool_parses_like_the_loop(loop, parser_pool):
+    async def main():
+        return [
+            await utils.parse(f"parse_{site}", fixture(f"{site}.html"))
+            for site in SITES
+        ]
+
+    pooled = loop.run_until_complete(main())
+    assert pooled == [
+        getattr(scraper, f"parse_{site}")(fixture(f"{site}.html")) for site in SITES
+    ]
+
+
+def test_blocksmc():
+    data = scraper.parse_blocksmc(fixture("blocksmc.html"))
+    assert data["rank"] == "VIP+"
+    assert data["timeplayed"] == "1234h 56m"
+    assert [list(game)[0] for game in data["game_stats"]] == [
+        "SkyWars",
+        "BedWars",
+        "Duels",
+        "EggWars",
+        "SurvivalGames",
+        "TheBridge",
+        "MurderMystery",
+        "BuildBattle",
+    ]
+    assert data["game_stats"][0]["SkyWars"]["Kills"] == 21222
+
+
+def test_blocksmc_missing_player():
+    assert scraper.parse_blocksmc(fixture("blocksmc_missing.html")) is False
+
+
+def test_universocraft():
+    data = scraper.parse_universocraft(fixture("universocraft.html"))
+    assert len(data["game_stats"]) == 8
+    assert data["game_stats"][1]["BedWars"]["Kills"] == "16280"
+
+
+def test_minesaga():
+    data = scraper.parse_minesaga(fixture("minesaga.html"))
+    assert data["joined"] == "Joined 2019-03-14"
+    assert data["last_seen"] == "2 days ago"
+    assert data["play_time"] == "412 hours"
+    assert data["game_stats"][0]["Factions"]["Kills"] == " 22741"
+
+
+def test_gommehd():
+    data = scraper.parse_gommehd(fixture("gommehd.html"))
+    assert data["game_stats"][0]["SkyWars"]["Kills"] == "27456"
+    assert len(data["game_stats"][0]["SkyWars"]) == 8
+
+
+def test_veltpvp():
+    data = scraper.parse_veltpvp(fixture("veltpvp.html"))
+    assert data["rank"] == "Owner"
+    assert data["last_seen"] == "Last seen 2 days ago"
+    assert data["current_status"] == "Online"
+    assert data["first_joined"] == "2015-06-01"
+    assert data["time_played"] == "1203 hours"
+    assert data["monthly_views"] == "4521"
+    assert [list(game)[0] for game in data["game_stats"]] == ["HCF", "Practice"]
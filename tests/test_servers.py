@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+import discord
+
+from obsidion.cogs.servers import servers
+from obsidion.utils.http import UpstreamUnavailable
+from tests.helpers import counting_fetch
+
+UUID = "069a79f444e94726a5befca90e38aaf5"
+
+
+def build(data: dict) -> discord.Embed:
+    return discord.Embed(description=data["rank"])
+
+
+def resolver(*results):
+    """A UUID resolver answering with `results` in turn, raising exceptions."""
+    results = list(results)
+
+    async def username_to_uuid(username):
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return SimpleNamespace(username_to_uuid=username_to_uuid)
+
+
+def test_player_embed_survives_a_failed_uuid_lookup(loop, bot):
+    bot.uuid_resolver = resolver(UpstreamUnavailable("api.mojang.com", "down"), UUID)
+    cog = servers(bot)
+    fetch = counting_fetch({"rank": "VIP"}, delay=0)
+
+    async def main():
+        embeds = []
+        for _ in range(3):
+            embeds.append(
+                await cog.player_embed("blocksmc_notch", "Notch", fetch, build)
+            )
+        return embeds
+
+    without_uuid, with_uuid, cached = loop.run_until_complete(main())
+    assert without_uuid.description == "VIP"
+    assert without_uuid.thumbnail.url is discord.Embed.Empty
+    # the embed without a thumbnail wasn't cached, the next lookup resolves it
+    assert with_uuid.thumbnail.url.endswith(UUID)
+    assert cached.to_dict() == with_uuid.to_dict()
+    assert fetch.calls == 1
+
+
+def test_player_embed_of_a_missing_player(loop, bot):
+    bot.uuid_resolver = resolver(False)
+    cog = servers(bot)
+    fetch = counting_fetch(False, delay=0)
+    embed = loop.run_until_complete(
+        cog.player_embed("blocksmc_nobody", "nobody", fetch, build)
+    )
+    assert embed is None
@@ -0,0 +1,32 @@
+import pytest
+
+from obsidion.cogs.watchlist.watchlist import normalise, valid_address
+
+
+@pytest.mark.parametrize(
+    "address",
+    ["hypixel.net", "mc.hypixel.net:25565", "play-1.example.org:1", "127.0.0.1:65535"],
+)
+def test_valid_addresses(address):
+    assert valid_address(normalise(address))
+
+
+@pytest.mark.parametrize(
+    "address",
+    [
+        "",
+        ":25565",
+        "hypixel.net:",
+        "hypixel.net:0",
+        "hypixel.net:65536",
+        "hypixel.net:port",
+        "hypixel.net:25565:1",
+        "-hypixel.net",
+        "hypixel..net",
+        "hyp ixel.net",
+        "hypixel.net/`@everyone`",
+        "a" * 64 + ".net",
+    ],
+)
+def test_invalid_addresses(address):
+    assert not valid_address(normalise(address))